@@ -30,8 +30,9 @@ export async function processEventBatch(job: EventProcessingJob): Promise<void>
         // 2. Group events by user and session
         const sessionGroups = groupEventsBySession(events);
 
-        // 3. Process each session
-        for (const [sessionKey, sessionEvents] of Object.entries(sessionGroups)) {
+        // 3. Extract features for each session
+        const sessions: { userId: string; sessionId: string; features: BehavioralFeatures }[] = [];
+        for (const sessionKey of Object.keys(sessionGroups)) {
             const [userId, sessionId] = sessionKey.split('::');
 
             // FETCH ALL EVENTS FOR THIS SESSION TO CALCULATE CUMULATIVE FEATURES
@@ -47,14 +48,25 @@ export async function processEventBatch(job: EventProcessingJob): Promise<void>
             }));
 
             // Extract features from ALL session events
-            const features = extractFeatures(allSessionEvents as BehaviorEvent[]);
+            sessions.push({
+                userId,
+                sessionId,
+                features: extractFeatures(allSessionEvents as BehaviorEvent[]),
+            });
+        }
 
-            // Call ML service for prediction
-            const prediction = await callMLService({
+        // 4. Score every session with a single ML service round trip
+        const predictions = await callMLServiceBatch(
+            sessions.map(({ userId, sessionId, features }) => ({
                 features,
                 user_id: parseInt(userId),
                 session_id: sessionId,
-            });
+            }))
+        );
+
+        // 5. Process each session
+        for (const [index, { userId, sessionId, features }] of sessions.entries()) {
+            const prediction = predictions[index];
 
             // Store risk score
             const riskScore = await storeRiskScore({
@@ -261,22 +273,28 @@ function getDefaultFeatures(): BehavioralFeatures {
     };
 }
 
-// Call ML service for prediction
-async function callMLService(data: {
+interface MLPredictRequest {
     features: BehavioralFeatures;
     user_id: number;
     session_id: string;
-}): Promise<{
+}
+
+interface MLPrediction {
     risk_score: number;
     confidence: number;
     anomaly_type: string;
     model_version: string;
     explanation?: string;
-}> {
+}
+
+// Call ML service batch endpoint; items it could not score fall back individually
+async function callMLServiceBatch(items: MLPredictRequest[]): Promise<MLPrediction[]> {
+    if (items.length === 0) return [];
+
     try {
         const response = await axios.post(
-            `${config.ml.service_url}/predict`,
-            data,
+            `${config.ml.service_url}/predict/batch`,
+            { requests: items },
             {
                 timeout: config.ml.timeout,
                 headers: {
@@ -285,21 +303,27 @@ async function callMLService(data: {
             }
         );
 
-        return response.data;
+        return response.data.results.map((result: { prediction?: MLPrediction; error?: string }, index: number) => {
+            if (result.prediction) return result.prediction;
+            logger.warn('ML service rejected batch item', { session_id: items[index].session_id, error: result.error });
+            return fallbackPrediction(items[index].features);
+        });
     } catch (error) {
-        logger.error('ML service call failed', { error });
-
-        // Fallback: Calculate basic risk score
-        return {
-            risk_score: calculateFallbackRiskScore(data.features),
-            confidence: 0.5,
-            anomaly_type: 'unknown',
-            model_version: 'fallback-1.0',
-            explanation: 'Risk calculated using fallback method',
-        };
+        logger.error('ML service batch call failed', { error });
+        return items.map(item => fallbackPrediction(item.features));
     }
 }
 
+function fallbackPrediction(features: BehavioralFeatures): MLPrediction {
+    return {
+        risk_score: calculateFallbackRiskScore(features),
+        confidence: 0.5,
+        anomaly_type: 'unknown',
+        model_version: 'fallback-1.0',
+        explanation: 'Risk calculated using fallback method',
+    };
+}
+
 // Fallback risk calculation
 function calculateFallbackRiskScore(features: BehavioralFeatures): number {
     let score = 0;
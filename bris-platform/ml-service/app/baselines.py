@@ -0,0 +1,327 @@
+"""Per-user behavioral baselines.
+
+Keeps a running mean and variance of each tracked feature for every user
+(Welford, merged per batch with Chan's parallel update), so sessions can be
+scored against the user's own history instead of fixed absolute thresholds.
+State lives in flat NumPy arrays indexed by a slot per user; the least
+recently updated users are evicted when the store is full. The store can be
+snapshotted to an .npz file for warm restarts.
+
+The backend re-scores a session's cumulative features after every event
+batch, so the same session arrives many times as it grows. Each session
+contributes one sample: the row it was last learned from is remembered,
+and a later row for the same session replaces it instead of adding to it.
+"""
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.scoring import COLUMN_INDEX
+
+logger = logging.getLogger(__name__)
+
+BASELINE_MAX_USERS = int(os.getenv("BASELINE_MAX_USERS", "100000"))
+# Sessions whose contribution is remembered for replacement; older ones are forgotten
+BASELINE_MAX_SESSIONS = int(os.getenv("BASELINE_MAX_SESSIONS", "200000"))
+# Sessions a user needs before their baseline is used for scoring
+BASELINE_MIN_SAMPLES = int(os.getenv("BASELINE_MIN_SAMPLES", "5"))
+BASELINE_Z_THRESHOLD = float(os.getenv("BASELINE_Z_THRESHOLD", "2.5"))
+BASELINE_SCORING = os.getenv("BASELINE_SCORING", "true").lower() == "true"
+BASELINE_SNAPSHOT_PATH = os.getenv(
+    "BASELINE_SNAPSHOT_PATH", os.path.join(os.getenv("MODEL_PATH", "./models"), "baselines.npz")
+)
+BASELINE_SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("BASELINE_SNAPSHOT_INTERVAL_SECONDS", "300"))
+
+# Features that describe how a user behaves; time, device and volume fields are left out
+BASELINE_COLUMNS = (
+    "click_frequency",
+    "scroll_velocity",
+    "typing_speed",
+    "dwell_time",
+    "tab_switch_count",
+    "copy_paste_events",
+    "navigation_speed",
+    "mouse_trajectory_entropy",
+    "error_rate",
+)
+# Smallest standard deviation assumed per feature, so a user who always had
+# zero tab switches doesn't get an infinite z-score for their first one
+STD_FLOORS = np.array([1.0, 20.0, 5.0, 1.0, 1.0, 1.0, 0.2, 0.05, 0.01])
+
+SNAPSHOT_FORMAT = 1
+
+
+class BaselineStore:
+    def __init__(
+        self,
+        max_users: int = BASELINE_MAX_USERS,
+        min_samples: int = BASELINE_MIN_SAMPLES,
+        initial_capacity: int = 1024,
+        max_sessions: int = BASELINE_MAX_SESSIONS,
+    ):
+        self.max_users = max_users
+        self.min_samples = min_samples
+        self.max_sessions = max_sessions
+        self.columns = np.array([COLUMN_INDEX[name] for name in BASELINE_COLUMNS], dtype=np.intp)
+        width = len(BASELINE_COLUMNS)
+        capacity = min(initial_capacity, max_users)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.mean = np.zeros((capacity, width), dtype=np.float64)
+        self.m2 = np.zeros((capacity, width), dtype=np.float64)
+        # Bumped whenever a row is handed to another user, invalidating its remembered sessions
+        self.generation = np.zeros(capacity, dtype=np.int64)
+        # user_id -> row, least recently updated first
+        self._slots: "OrderedDict[int, int]" = OrderedDict()
+        self._free: List[int] = list(range(capacity - 1, -1, -1))
+        self._reset_sessions()
+        self.updates = 0
+        self.replaced = 0
+        self.evictions = 0
+
+    def _reset_sessions(self):
+        # session_id -> (user row, its generation, the values it contributed)
+        self._sessions: "OrderedDict[str, Tuple[int, int, np.ndarray]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _grow(self):
+        old = len(self.count)
+        new = min(old * 2, self.max_users)
+        self.count = np.concatenate([self.count, np.zeros(new - old, dtype=np.int64)])
+        self.mean = np.concatenate([self.mean, np.zeros((new - old, self.mean.shape[1]))])
+        self.m2 = np.concatenate([self.m2, np.zeros((new - old, self.m2.shape[1]))])
+        self.generation = np.concatenate([self.generation, np.zeros(new - old, dtype=np.int64)])
+        self._free.extend(range(new - 1, old - 1, -1))
+
+    def _slot_for_update(self, user_id: int) -> int:
+        slot = self._slots.get(user_id)
+        if slot is not None:
+            self._slots.move_to_end(user_id)
+            return slot
+        if not self._free:
+            if len(self.count) < self.max_users:
+                self._grow()
+            else:
+                _, slot = self._slots.popitem(last=False)
+                self.evictions += 1
+                self.count[slot] = 0
+                self.mean[slot] = 0.0
+                self.m2[slot] = 0.0
+                self.generation[slot] += 1
+                self._free.append(slot)
+        slot = self._free.pop()
+        self._slots[user_id] = slot
+        return slot
+
+    def update(self, user_ids: Sequence[int], X: np.ndarray, session_ids: Optional[Sequence[str]] = None):
+        """Fold rows of a feature matrix (FEATURE_COLUMNS order) into their users' baselines.
+
+        With ``session_ids``, a session that was learned from before replaces
+        its earlier row rather than adding a second sample.
+        """
+        if session_ids is not None:
+            # Only the last row of a session repeated within the call counts
+            last = {sid: i for i, sid in enumerate(session_ids)}
+            if len(last) < len(session_ids):
+                rows = np.fromiter(last.values(), dtype=np.intp, count=len(last))
+                user_ids, X, session_ids = np.asarray(user_ids)[rows], X[rows], list(last)
+        # A chunk never holds more distinct users than the store, so eviction
+        # can't hand a slot touched earlier in the chunk to another user
+        for start in range(0, len(user_ids), self.max_users):
+            stop = start + self.max_users
+            self._update_chunk(user_ids[start:stop], X[start:stop], None if session_ids is None else session_ids[start:stop])
+
+    def _update_chunk(self, user_ids: Sequence[int], X: np.ndarray, session_ids: Optional[Sequence[str]]):
+        values = X[:, self.columns]
+        keep = np.isfinite(values).all(axis=1)
+        if not keep.all():
+            values = values[keep]
+            user_ids = np.asarray(user_ids)[keep]
+            if session_ids is not None:
+                session_ids = [sid for sid, k in zip(session_ids, keep) if k]
+        if not len(user_ids):
+            return
+
+        rows = np.fromiter((self._slot_for_update(int(u)) for u in user_ids), dtype=np.intp, count=len(user_ids))
+        if session_ids is not None:
+            self._forget_sessions(session_ids)
+            generations = self.generation[rows]
+            for sid, row, gen, vals in zip(session_ids, rows.tolist(), generations.tolist(), values):
+                self._sessions[sid] = (row, gen, vals.copy())
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._add(rows, values)
+        self.updates += len(user_ids)
+
+    def _forget_sessions(self, session_ids: Sequence[str]):
+        """Take back the rows these sessions contributed earlier, if their user still owns the slot."""
+        previous = [self._sessions.pop(sid, None) for sid in session_ids]
+        previous = [p for p in previous if p is not None and self.generation[p[0]] == p[1]]
+        if not previous:
+            return
+        self.replaced += len(previous)
+        rows = np.array([p[0] for p in previous], dtype=np.intp)
+        values = np.array([p[2] for p in previous])
+        slots, inverse = np.unique(rows, return_inverse=True)
+        n_r = np.bincount(inverse).astype(np.float64)
+        mean_r = np.zeros((len(slots), values.shape[1]))
+        np.add.at(mean_r, inverse, values)
+        mean_r /= n_r[:, None]
+        m2_r = np.zeros_like(mean_r)
+        np.add.at(m2_r, inverse, (values - mean_r[inverse]) ** 2)
+
+        # Chan's merge run backwards: the statistics of the rest once these rows are gone
+        n = self.count[slots].astype(np.float64)
+        n_a = n - n_r
+        left = n_a > 0
+        safe_a = np.where(left, n_a, 1.0)
+        mean_a = (self.mean[slots] * n[:, None] - mean_r * n_r[:, None]) / safe_a[:, None]
+        delta = mean_r - mean_a
+        m2_a = np.maximum(self.m2[slots] - m2_r - delta ** 2 * (n_a * n_r / np.maximum(n, 1))[:, None], 0.0)
+        self.count[slots] = np.where(left, n_a, 0).astype(np.int64)
+        self.mean[slots] = np.where(left[:, None], mean_a, 0.0)
+        self.m2[slots] = np.where(left[:, None], m2_a, 0.0)
+
+    def _add(self, rows: np.ndarray, values: np.ndarray):
+        slots, inverse = np.unique(rows, return_inverse=True)
+        n_b = np.bincount(inverse).astype(np.float64)
+        mean_b = np.zeros((len(slots), values.shape[1]))
+        np.add.at(mean_b, inverse, values)
+        mean_b /= n_b[:, None]
+        m2_b = np.zeros_like(mean_b)
+        np.add.at(m2_b, inverse, (values - mean_b[inverse]) ** 2)
+
+        n_a = self.count[slots].astype(np.float64)
+        n = n_a + n_b
+        delta = mean_b - self.mean[slots]
+        self.mean[slots] += delta * (n_b / n)[:, None]
+        self.m2[slots] += m2_b + delta ** 2 * (n_a * n_b / n)[:, None]
+        self.count[slots] += n_b.astype(np.int64)
+
+    def zscores(self, user_ids: Sequence[int], X: np.ndarray) -> Optional[np.ndarray]:
+        """Per-feature deviation of each row from its user's baseline.
+
+        Returns an array shaped like X, NaN for untracked features and for
+        users without enough history, or None when no row has a baseline.
+        """
+        rows = np.fromiter((self._slots.get(int(u), -1) for u in user_ids), dtype=np.intp, count=len(user_ids))
+        ready = rows >= 0
+        ready[ready] = self.count[rows[ready]] >= self.min_samples
+        if not ready.any():
+            return None
+
+        slots = rows[ready]
+        n = self.count[slots].astype(np.float64)
+        std = np.maximum(np.sqrt(self.m2[slots] / (n - 1)[:, None]), STD_FLOORS)
+        Z = np.full(X.shape, np.nan)
+        Z[np.ix_(ready, self.columns)] = (X[ready][:, self.columns] - self.mean[slots]) / std
+        return Z
+
+    def sessions(self, user_id: int) -> int:
+        slot = self._slots.get(user_id)
+        return 0 if slot is None else int(self.count[slot])
+
+    def baseline(self, user_id: int) -> Optional[Dict[str, Dict[str, float]]]:
+        slot = self._slots.get(user_id)
+        if slot is None:
+            return None
+        n = int(self.count[slot])
+        std = np.sqrt(self.m2[slot] / (n - 1)) if n > 1 else np.zeros(len(BASELINE_COLUMNS))
+        return {
+            name: {"mean": float(self.mean[slot, i]), "std": float(std[i])}
+            for i, name in enumerate(BASELINE_COLUMNS)
+        }
+
+    def snapshot_data(self) -> Dict[str, np.ndarray]:
+        """Copy of the store in LRU order, safe to write from another thread."""
+        user_ids = np.fromiter(self._slots.keys(), dtype=np.int64, count=len(self._slots))
+        rows = np.fromiter(self._slots.values(), dtype=np.intp, count=len(self._slots))
+        return {
+            "format": np.int64(SNAPSHOT_FORMAT),
+            "columns": np.array(BASELINE_COLUMNS),
+            "user_ids": user_ids,
+            "count": self.count[rows],
+            "mean": self.mean[rows],
+            "m2": self.m2[rows],
+        }
+
+    def snapshot(self, path: str = BASELINE_SNAPSHOT_PATH):
+        write_snapshot(self.snapshot_data(), path)
+
+    def load(self, path: str = BASELINE_SNAPSHOT_PATH) -> bool:
+        """Replace the store's contents with a snapshot; False if there is none usable."""
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if int(data["format"]) != SNAPSHOT_FORMAT or tuple(data["columns"]) != BASELINE_COLUMNS:
+                    logger.warning(f"Ignoring baseline snapshot {path}: written for a different feature layout")
+                    return False
+                user_ids, count, mean, m2 = data["user_ids"], data["count"], data["mean"], data["m2"]
+        except Exception as e:
+            logger.warning(f"Could not load baseline snapshot {path}: {e}")
+            return False
+
+        # Snapshots keep LRU order, so the most recently active users survive a smaller store
+        keep = slice(max(len(user_ids) - self.max_users, 0), None)
+        user_ids, count, mean, m2 = user_ids[keep], count[keep], mean[keep], m2[keep]
+        n = len(user_ids)
+        capacity = min(max(n, 1024), self.max_users)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.mean = np.zeros((capacity, len(BASELINE_COLUMNS)), dtype=np.float64)
+        self.m2 = np.zeros_like(self.mean)
+        self.count[:n], self.mean[:n], self.m2[:n] = count, mean, m2
+        self.generation = np.zeros(capacity, dtype=np.int64)
+        # Contributions from before the snapshot can no longer be taken back
+        self._reset_sessions()
+        self._slots = OrderedDict((int(u), i) for i, u in enumerate(user_ids))
+        self._free = list(range(capacity - 1, n - 1, -1))
+        return True
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "users": len(self._slots),
+            "max_users": self.max_users,
+            "capacity": len(self.count),
+            "updates": self.updates,
+            "replaced_session_rows": self.replaced,
+            "tracked_sessions": len(self._sessions),
+            "evictions": self.evictions,
+            "memory_bytes": int(self.count.nbytes + self.mean.nbytes + self.m2.nbytes),
+        }
+
+
+def write_snapshot(data: Dict[str, np.ndarray], path: str = BASELINE_SNAPSHOT_PATH):
+    """Write snapshot arrays to ``path`` atomically (temp file, fsync, rename).
+
+    Every uvicorn worker snapshots to the same path, so each write gets its
+    own temp file; the last rename wins with a complete file.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+baseline_store = BaselineStore()
+
+
+def baseline_deviation(Z_row: np.ndarray) -> Optional[Dict[str, float]]:
+    """Tracked z-scores of one row keyed by feature name, or None without a baseline."""
+    if np.isnan(Z_row[COLUMN_INDEX[BASELINE_COLUMNS[0]]]):
+        return None
+    return {name: round(float(Z_row[COLUMN_INDEX[name]]), 2) for name in BASELINE_COLUMNS}
+
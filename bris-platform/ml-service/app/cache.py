@@ -0,0 +1,138 @@
+"""Two-tier LRU/TTL cache for AI and explanation responses.
+
+Entries are keyed on a fingerprint of the request payload (with floats
+optionally quantized so jitter in polled features still hits), the endpoint
+and the prompt version, so editing a prompt invalidates its old answers.
+The in-process LRU is the first tier; with a shared backend (Redis, see
+app/shared_state.py) entries are also written there as JSON, so one
+worker's Gemini answer serves every other worker.
+"""
+import hashlib
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.shared_state import SharedState, shared_state
+
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+CACHE_DEFAULT_TTL_SECONDS = float(os.getenv("CACHE_DEFAULT_TTL_SECONDS", "300"))
+# Significant digits kept for float features; 0 disables quantization
+CACHE_QUANTIZE_DIGITS = int(os.getenv("CACHE_QUANTIZE_DIGITS", "3"))
+
+ENDPOINT_TTLS = {
+    "ai/dna": float(os.getenv("CACHE_TTL_AI_DNA_SECONDS", "600")),
+    "ai/reconstruction": float(os.getenv("CACHE_TTL_AI_RECONSTRUCTION_SECONDS", "600")),
+    "explain": float(os.getenv("CACHE_TTL_EXPLAIN_SECONDS", "60")),
+}
+
+
+def _quantize(value: Any, digits: int) -> Any:
+    if isinstance(value, float):
+        if digits <= 0 or value == 0 or not math.isfinite(value):
+            return value
+        return float(f"{value:.{digits}g}")
+    if isinstance(value, dict):
+        return {k: _quantize(v, digits) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_quantize(v, digits) for v in value]
+    return value
+
+
+def fingerprint(endpoint: str, prompt_version: str, payload: Dict[str, Any], digits: int = CACHE_QUANTIZE_DIGITS) -> str:
+    """Stable cache key for a request payload."""
+    canonical = json.dumps(_quantize(payload, digits), sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+    return f"{endpoint}:{prompt_version}:{digest}"
+
+
+class ResponseCache:
+    """Size-bounded LRU with per-endpoint TTLs and hit/miss counters."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttls: Optional[Dict[str, float]] = None, shared: Optional[SharedState] = None):
+        self.max_entries = max_entries
+        self.ttls = dict(ENDPOINT_TTLS if ttls is None else ttls)
+        self.shared = shared
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.shared_hits: Dict[str, int] = {}
+        self.evictions = 0
+
+    def get(self, endpoint: str, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits[endpoint] = self.hits.get(endpoint, 0) + 1
+                return value
+            del self._entries[key]
+        self.misses[endpoint] = self.misses.get(endpoint, 0) + 1
+        return None
+
+    def set(self, endpoint: str, key: str, value: Any):
+        ttl = self.ttls.get(endpoint, CACHE_DEFAULT_TTL_SECONDS)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def lookup(self, endpoint: str, key: str) -> Optional[Any]:
+        """Check the local tier, then the shared one; shared hits are copied locally."""
+        value = self.get(endpoint, key)
+        if value is not None or self.shared is None:
+            return value
+        raw = await self.shared.get(f"cache:{key}")
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        self.set(endpoint, key, value)
+        self.shared_hits[endpoint] = self.shared_hits.get(endpoint, 0) + 1
+        return value
+
+    async def store(self, endpoint: str, key: str, value: Any):
+        """Cache in both tiers; pydantic models are stored as plain dicts in the shared tier."""
+        self.set(endpoint, key, value)
+        if self.shared is not None:
+            payload = value.dict() if hasattr(value, "dict") else value
+            ttl = self.ttls.get(endpoint, CACHE_DEFAULT_TTL_SECONDS)
+            await self.shared.set(f"cache:{key}", json.dumps(payload, default=str), ttl)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        endpoints = sorted(set(self.hits) | set(self.misses))
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "endpoints": {
+                name: {
+                    "hits": self.hits.get(name, 0),
+                    "misses": self.misses.get(name, 0),
+                    "shared_hits": self.shared_hits.get(name, 0),
+                    "ttl_seconds": self.ttls.get(name, CACHE_DEFAULT_TTL_SECONDS),
+                }
+                for name in endpoints
+            },
+        }
+
+
+def cache_bypassed(cache_control: Optional[str]) -> bool:
+    """True when the caller sent ``Cache-Control: no-cache`` (or no-store)."""
+    if not cache_control:
+        return False
+    directives = {d.strip().lower() for d in cache_control.split(",")}
+    return "no-cache" in directives or "no-store" in directives
+
+
+# Without a shared backend the second tier would only duplicate the first
+response_cache = ResponseCache(shared=shared_state if shared_state.remote is not None else None)
@@ -0,0 +1,323 @@
+"""Process pool for CPU-bound scoring and feature extraction.
+
+NumPy releases the GIL only inside individual kernels, so a large tree
+ensemble or trajectory extraction run on the event loop stalls every other
+request, and one uvicorn worker never uses more than one core. Large
+batches are instead split into contiguous chunks and run in parallel in a
+small pool of worker processes.
+
+Every uvicorn worker has its own pool, so a host runs WEB_CONCURRENCY pools.
+The default size is this process's share of the CPUs, capped at
+CPU_POOL_DEFAULT_MAX_WORKERS, and the pool is only started by the first
+batch large enough to need it, keeping worker start-up fast.
+
+Inputs and outputs travel through multiprocessing.shared_memory: the
+parent copies each array into a block once and workers map it, so only
+block names, shapes and chunk bounds are pickled. Workers load scoring
+models themselves from the artifact directory (memory-mapped, as in
+app/model_registry.py) and cache them by version.
+
+A running task cannot be cancelled, so when a call exceeds its timeout the
+worker processes are terminated and a fresh pool is started on next use.
+Calls that were in flight at that moment fail with CPUPoolError.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.features import columnar_signal_features, concat_columns
+from app.model_registry import RuleModel, ScoringModel, load_artifact
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+CPU_POOL_DEFAULT_MAX_WORKERS = 4
+
+
+def default_workers() -> int:
+    """Pool size when CPU_POOL_WORKERS is unset: this process's share of the CPUs, at most 4."""
+    # uvicorn reads WEB_CONCURRENCY as its --workers default; each of those processes has a pool
+    web_workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    return max(1, min(CPU_POOL_DEFAULT_MAX_WORKERS, available_cpus() // web_workers))
+
+
+# 0 disables the pool; everything then runs inline as before
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", str(default_workers())))
+# Start the workers at boot instead of on the first large batch
+CPU_POOL_WARM_UP = os.getenv("CPU_POOL_WARM_UP", "false").lower() == "true"
+CPU_POOL_TASK_TIMEOUT_SECONDS = float(os.getenv("CPU_POOL_TASK_TIMEOUT_SECONDS", "10"))
+# Smaller inputs are cheaper to run inline than to hand to another process
+CPU_POOL_MIN_ROWS = int(os.getenv("CPU_POOL_MIN_ROWS", "20000"))
+CPU_POOL_MIN_SAMPLES = int(os.getenv("CPU_POOL_MIN_SAMPLES", "200000"))
+# "spawn" keeps workers clear of the event loop's threads and sockets
+CPU_POOL_START_METHOD = os.getenv("CPU_POOL_START_METHOD", "spawn")
+
+# (shared memory block name, shape, dtype string)
+ArraySpec = Tuple[str, Tuple[int, ...], str]
+
+
+class CPUPoolError(Exception):
+    """The pool could not run the task; the caller may run it inline instead."""
+
+
+class CPUPoolTimeoutError(CPUPoolError):
+    """The task did not finish within the pool's task timeout."""
+
+
+class SharedArray:
+    """A copy of an array in a shared memory block that workers can map by name."""
+
+    def __init__(self, array: np.ndarray):
+        array = np.asarray(array)
+        self._block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.array = np.ndarray(array.shape, dtype=array.dtype, buffer=self._block.buf)
+        self.array[...] = array
+        self.spec: ArraySpec = (self._block.name, array.shape, array.dtype.str)
+
+    def release(self):
+        # The block can only be closed once no array views into it remain
+        self.array = None
+        self._block.close()
+        self._block.unlink()
+
+
+# ============================================
+# WORKER SIDE
+# ============================================
+
+_worker_models: Dict[Tuple[str, Optional[str]], ScoringModel] = {}
+
+
+def _worker_model(spec: Tuple[str, Optional[str]]) -> ScoringModel:
+    model = _worker_models.get(spec)
+    if model is None:
+        version, path = spec
+        if path is None:
+            model = RuleModel(version, {"type": "rules"})
+        else:
+            model = load_artifact(os.path.dirname(path), version)
+        # Only the active version (and one reloading in) is ever asked for
+        if len(_worker_models) >= 4:
+            _worker_models.clear()
+        _worker_models[spec] = model
+    return model
+
+
+def _with_arrays(fn: Callable, specs: Sequence[Optional[ArraySpec]], *args):
+    """Call fn with the shared arrays named by specs mapped in, then unmap them."""
+    blocks = [None if spec is None else shared_memory.SharedMemory(name=spec[0]) for spec in specs]
+    try:
+        return fn(*[
+            None if block is None else np.ndarray(spec[1], dtype=spec[2], buffer=block.buf)
+            for spec, block in zip(specs, blocks)
+        ], *args)
+    finally:
+        for block in blocks:
+            if block is not None:
+                block.close()
+
+
+def _score_rows(X, Z, out, model_spec, z_threshold: float, start: int, stop: int) -> int:
+    model = _worker_model(model_spec)
+    out[start:stop] = model.score(X[start:stop], None if Z is None else Z[start:stop], z_threshold)
+    return stop - start
+
+
+def _score_chunk(specs, model_spec, z_threshold: float, start: int, stop: int) -> int:
+    return _with_arrays(_score_rows, specs, model_spec, z_threshold, start, stop)
+
+
+def _extract_sessions(mt, mx, my, kd, ku, mouse_lengths, key_lengths, mouse_start: int, key_start: int) -> list:
+    mouse_stop = mouse_start + sum(mouse_lengths)
+    key_stop = key_start + sum(key_lengths)
+    return columnar_signal_features(
+        mt[mouse_start:mouse_stop], mx[mouse_start:mouse_stop], my[mouse_start:mouse_stop], mouse_lengths,
+        kd[key_start:key_stop], ku[key_start:key_stop], key_lengths,
+    )
+
+
+def _extract_chunk(specs, mouse_lengths, key_lengths, mouse_start: int, key_start: int) -> list:
+    return _with_arrays(_extract_sessions, specs, mouse_lengths, key_lengths, mouse_start, key_start)
+
+
+def _warm() -> int:
+    return os.getpid()
+
+
+# ============================================
+# PARENT SIDE
+# ============================================
+
+def chunk_bounds(weights: np.ndarray, parts: int) -> List[Tuple[int, int]]:
+    """Split range(len(weights)) into up to ``parts`` contiguous chunks of similar total weight."""
+    n = len(weights)
+    parts = max(1, min(parts, n))
+    cumulative = np.cumsum(weights, dtype=np.float64)
+    total = cumulative[-1] if n else 0.0
+    cuts = np.searchsorted(cumulative, total * np.arange(1, parts) / parts, side="right")
+    edges = np.unique(np.concatenate([[0], cuts, [n]])).tolist()
+    return [(a, b) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+
+class CPUPool:
+    def __init__(
+        self,
+        workers: int = CPU_POOL_WORKERS,
+        task_timeout: float = CPU_POOL_TASK_TIMEOUT_SECONDS,
+        start_method: str = CPU_POOL_START_METHOD,
+    ):
+        self.workers = workers
+        self.task_timeout = task_timeout
+        self.start_method = start_method
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.running = 0
+        self.tasks = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.restarts = 0
+        self.busy_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context(self.start_method)
+            )
+        return self._executor
+
+    async def warm_up(self):
+        """Start every worker now, so the first large request doesn't pay for process start-up."""
+        if not self.enabled:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*[loop.run_in_executor(self._pool(), _warm) for _ in range(self.workers)])
+        except Exception as e:
+            logger.error(f"CPU pool warm-up failed: {e}")
+
+    def _terminate(self):
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        # Running tasks can't be cancelled; killing the workers is the only way to stop them
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+        self.restarts += 1
+
+    def shutdown(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, calls: List[Tuple[Callable, tuple]]) -> list:
+        """Run (fn, args) calls in parallel; raises CPUPoolTimeoutError or CPUPoolError."""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        self.tasks += len(calls)
+        self.running += len(calls)
+        executor = None
+        try:
+            executor = self._pool()
+            futures = [loop.run_in_executor(executor, fn, *args) for fn, args in calls]
+            return await asyncio.wait_for(asyncio.gather(*futures), self.task_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self._terminate()
+            raise CPUPoolTimeoutError(f"CPU pool task exceeded {self.task_timeout:g}s")
+        except (BrokenProcessPool, RuntimeError, OSError) as e:
+            # A worker died (or the pool was torn down by a timeout elsewhere)
+            self.failures += 1
+            if executor is not None and self._executor is executor:
+                self._terminate()
+            raise CPUPoolError(f"CPU pool unavailable: {e!r}")
+        finally:
+            self.running -= len(calls)
+            self.busy_seconds += time.perf_counter() - started
+
+    async def score(self, model: ScoringModel, X: np.ndarray, Z: Optional[np.ndarray] = None, z_threshold: float = 2.5) -> np.ndarray:
+        """model.score(X, Z, z_threshold), computed in row chunks across the workers."""
+        if model.model_type != "rules":
+            Z = None  # only the rule formula reads baselines
+        inputs = [SharedArray(np.asarray(X, dtype=np.float64))]
+        if Z is not None:
+            inputs.append(SharedArray(np.asarray(Z, dtype=np.float64)))
+        out = SharedArray(np.zeros(len(X)))
+        try:
+            specs = (inputs[0].spec, inputs[1].spec if Z is not None else None, out.spec)
+            model_spec = (model.version, model.path)
+            bounds = chunk_bounds(np.ones(len(X)), self.workers)
+            await self._run([(_score_chunk, (specs, model_spec, z_threshold, a, b)) for a, b in bounds])
+            return out.array.copy()
+        finally:
+            for shared in (*inputs, out):
+                shared.release()
+
+    async def signal_features(
+        self,
+        mouse_t: Sequence[Sequence[float]],
+        mouse_x: Sequence[Sequence[float]],
+        mouse_y: Sequence[Sequence[float]],
+        key_down: Sequence[Sequence[float]],
+        key_up: Sequence[Sequence[float]],
+    ) -> list:
+        """app.features.signal_features, with sessions split across the workers by sample count."""
+        mouse_lengths = np.array([len(c) for c in mouse_t], dtype=np.int64)
+        key_lengths = np.array([len(c) for c in key_down], dtype=np.int64)
+        mouse_offsets = np.concatenate([[0], np.cumsum(mouse_lengths)])
+        key_offsets = np.concatenate([[0], np.cumsum(key_lengths)])
+        arrays = [
+            SharedArray(concat_columns(columns))
+            for columns in (mouse_t, mouse_x, mouse_y, key_down, key_up)
+        ]
+        try:
+            specs = tuple(shared.spec for shared in arrays)
+            bounds = chunk_bounds(mouse_lengths + key_lengths + 1, self.workers)
+            chunks = await self._run([
+                (_extract_chunk, (
+                    specs, mouse_lengths[a:b].tolist(), key_lengths[a:b].tolist(),
+                    int(mouse_offsets[a]), int(key_offsets[a]),
+                ))
+                for a, b in bounds
+            ])
+            return [row for chunk in chunks for row in chunk]
+        finally:
+            for shared in arrays:
+                shared.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "start_method": self.start_method,
+            "started": self._executor is not None,
+            "running": self.running,
+            "tasks": self.tasks,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "restarts": self.restarts,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "task_timeout_seconds": self.task_timeout,
+            "min_rows": CPU_POOL_MIN_ROWS,
+            "min_samples": CPU_POOL_MIN_SAMPLES,
+        }
+
+
+cpu_pool = CPUPool()
@@ -0,0 +1,120 @@
+"""Per-request deadlines for AI work.
+
+DeadlineMiddleware gives every request a deadline: the X-Request-Deadline-Ms
+header, or a per-endpoint default for /ai/* routes. The deadline is stored in
+a context variable, so any code serving the request can ask how much time
+is left without threading it through every call. app/llm.py caps each
+Gemini call at that remainder.
+
+DeadlineExceededError and OverloadedError both mean "answer now without the
+LLM"; endpoints catch them and return their deterministic, rule-based
+response marked ``degraded``.
+"""
+import math
+import os
+import time
+from contextvars import Context, ContextVar, copy_context
+from typing import Optional
+
+DEADLINE_HEADER = "x-request-deadline-ms"
+# Default for /ai/* routes without an entry in ENDPOINT_DEADLINES
+AI_DEADLINE_SECONDS = float(os.getenv("AI_DEADLINE_SECONDS", "10"))
+# Longest deadline a client may ask for
+MAX_DEADLINE_SECONDS = float(os.getenv("MAX_DEADLINE_SECONDS", "60"))
+# Interactive AI requests waiting for an LLM slot beyond which new ones are shed
+AI_MAX_QUEUE_DEPTH = int(os.getenv("AI_MAX_QUEUE_DEPTH", "16"))
+
+# None: no default deadline (the job endpoints only queue work)
+ENDPOINT_DEADLINES = {
+    "/ai/forensic-report": float(os.getenv("FORENSIC_REPORT_DEADLINE_SECONDS", "20")),
+    "/ai/forensic-report/stream": float(os.getenv("FORENSIC_REPORT_DEADLINE_SECONDS", "20")) * 1.5,
+}
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceededError(Exception):
+    """The request's deadline passed, or would pass, before the LLM answered."""
+
+    reason = "deadline_exceeded"
+
+
+class OverloadedError(Exception):
+    """Too many AI requests are already waiting for an LLM slot."""
+
+    reason = "overloaded"
+
+
+# Errors an endpoint answers with its rule-based fallback
+FALLBACK_ERRORS = (DeadlineExceededError, OverloadedError)
+
+
+def parse_deadline(value: str, now: float) -> Optional[float]:
+    """Monotonic deadline from a header value: a budget in ms, or an absolute epoch time in ms."""
+    try:
+        ms = float(value)
+    except ValueError:
+        return None
+    if not math.isfinite(ms):
+        return None
+    # Same cut-off as for event timestamps: anything this large is epoch ms
+    budget = (ms / 1000 - time.time()) if ms > 1e11 else ms / 1000
+    return now + min(max(budget, 0.0), MAX_DEADLINE_SECONDS)
+
+
+def default_deadline(path: str) -> Optional[float]:
+    if path in ENDPOINT_DEADLINES:
+        return ENDPOINT_DEADLINES[path]
+    if path.startswith("/ai/forensic-report/jobs"):
+        return None
+    return AI_DEADLINE_SECONDS if path.startswith("/ai/") else None
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current request's deadline, or None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def detached_context() -> Context:
+    """A copy of the current context without the request deadline.
+
+    Work shared between requests (app/singleflight.py) runs in it, so it
+    isn't held to whichever request happened to start it.
+    """
+    context = copy_context()
+    context.run(_deadline.set, None)
+    return context
+
+
+def check() -> Optional[float]:
+    """Like remaining(), but raises DeadlineExceededError once the deadline has passed."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceededError("Request deadline already passed")
+    return left
+
+
+class DeadlineMiddleware:
+    """ASGI middleware that sets the request deadline for everything downstream."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        now = time.monotonic()
+        deadline = None
+        for name, value in scope["headers"]:
+            if name == DEADLINE_HEADER.encode():
+                deadline = parse_deadline(value.decode("latin-1"), now)
+                break
+        if deadline is None:
+            seconds = default_deadline(scope["path"])
+            deadline = None if seconds is None else now + seconds
+        token = _deadline.set(deadline)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _deadline.reset(token)
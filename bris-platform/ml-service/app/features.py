@@ -0,0 +1,203 @@
+"""Vectorized mouse-trajectory and keystroke-dynamics features.
+
+All sessions of a request are concatenated into flat columnar arrays with a
+segment id per sample; every statistic is then computed with whole-array
+NumPy operations (diffs masked at session boundaries, per-segment reductions
+via bincount), so cost is linear in the number of events with no Python-level
+per-event loop. Timestamps are in milliseconds, positions in pixels.
+"""
+from typing import Dict, Sequence
+
+import numpy as np
+
+DIRECTION_BINS = 8
+# Dwell / flight histogram edges in ms; the last bin is open-ended
+KEY_TIMING_EDGES_MS = np.array([0, 50, 100, 150, 200, 300, 500, np.inf])
+KEY_TIMING_BINS = len(KEY_TIMING_EDGES_MS) - 1
+
+
+def segment_ids(lengths: Sequence[int]) -> np.ndarray:
+    """Session index for every sample of the concatenated arrays."""
+    lengths = np.asarray(lengths, dtype=np.intp)
+    return np.repeat(np.arange(len(lengths)), lengths)
+
+
+def _group_stats(values: np.ndarray, seg: np.ndarray, n: int):
+    """Per-segment count, mean and standard deviation."""
+    count = np.bincount(seg, minlength=n).astype(np.float64)
+    total = np.bincount(seg, weights=values, minlength=n)
+    total_sq = np.bincount(seg, weights=values * values, minlength=n)
+    safe = np.maximum(count, 1)
+    mean = total / safe
+    var = np.maximum(total_sq / safe - mean * mean, 0)
+    return count, mean, np.sqrt(var)
+
+
+def _group_max(values: np.ndarray, seg: np.ndarray, n: int) -> np.ndarray:
+    out = np.zeros(n)
+    if len(values):
+        np.maximum.at(out, seg, values)
+    return out
+
+
+def _group_histogram(bins: np.ndarray, seg: np.ndarray, n: int, n_bins: int) -> np.ndarray:
+    """(n, n_bins) histogram, each row normalized to sum to 1 (or all zero)."""
+    counts = np.bincount(seg * n_bins + bins, minlength=n * n_bins).reshape(n, n_bins).astype(np.float64)
+    totals = counts.sum(axis=1, keepdims=True)
+    return np.divide(counts, totals, out=np.zeros_like(counts), where=totals > 0)
+
+
+def mouse_features(t: np.ndarray, x: np.ndarray, y: np.ndarray, lengths: Sequence[int]) -> Dict[str, np.ndarray]:
+    """Trajectory features for each session; returns arrays of shape (n_sessions,)."""
+    n = len(lengths)
+    # Samples with a NaN or infinite time or position are dropped, like bad key timings
+    finite = np.isfinite(t) & np.isfinite(x) & np.isfinite(y)
+    if not finite.all():
+        t, x, y = t[finite], x[finite], y[finite]
+        lengths = np.bincount(segment_ids(lengths)[finite], minlength=n)
+    seg = segment_ids(lengths)
+
+    # Steps between consecutive samples of the same session with time moving forward
+    # Huge coordinates can still overflow to inf once subtracted
+    with np.errstate(over="ignore"):
+        dt = np.diff(t)
+        dx = np.diff(x)
+        dy = np.diff(y)
+    step_seg = seg[:-1]
+    valid = (seg[1:] == step_seg) & (dt > 0) & np.isfinite(dx) & np.isfinite(dy)
+    dt, dx, dy, step_seg = dt[valid], dx[valid], dy[valid], step_seg[valid]
+
+    with np.errstate(over="ignore"):
+        distance = np.hypot(dx, dy)
+        speed = distance / dt * 1000  # px/s
+    valid = np.isfinite(speed)
+    if not valid.all():
+        dt, dx, dy, step_seg = dt[valid], dx[valid], dy[valid], step_seg[valid]
+        distance, speed = distance[valid], speed[valid]
+    _, speed_mean, speed_std = _group_stats(speed, step_seg, n)
+    speed_max = _group_max(speed, step_seg, n)
+    path_length = np.bincount(step_seg, weights=distance, minlength=n)
+
+    # Consecutive steps: acceleration and turning angle
+    same = step_seg[1:] == step_seg[:-1]
+    pair_seg = step_seg[:-1][same]
+    accel = (np.diff(speed)[same]) / (dt[1:][same] / 1000)
+    _, accel_mean, accel_std = _group_stats(np.abs(accel), pair_seg, n)
+
+    heading = np.arctan2(dy, dx)
+    turn = np.diff(heading)[same]
+    turn = (turn + np.pi) % (2 * np.pi) - np.pi
+    moving = (distance[1:][same] > 0) & (distance[:-1][same] > 0)
+    turn_bins = np.minimum(((turn[moving] + np.pi) / (2 * np.pi) * DIRECTION_BINS).astype(np.intp), DIRECTION_BINS - 1)
+    hist = _group_histogram(turn_bins, pair_seg[moving], n, DIRECTION_BINS)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        plogp = np.where(hist > 0, hist * np.log2(hist), 0.0)
+    # plogp is never positive; abs() also avoids returning -0.0 for empty rows
+    entropy = np.abs(plogp.sum(axis=1)) / np.log2(DIRECTION_BINS)
+
+    # Straight-line distance over path length: 1 for a ruler-straight, scripted-looking path
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.intp)
+    ends = starts + np.asarray(lengths, dtype=np.intp) - 1
+    has_points = np.asarray(lengths) > 0
+    displacement = np.zeros(n)
+    displacement[has_points] = np.hypot(
+        x[ends[has_points]] - x[starts[has_points]],
+        y[ends[has_points]] - y[starts[has_points]],
+    )
+    straightness = np.divide(displacement, path_length, out=np.zeros(n), where=path_length > 0)
+
+    return {
+        "mouse_trajectory_entropy": entropy,
+        "mouse_speed_mean": speed_mean,
+        "mouse_speed_std": speed_std,
+        "mouse_speed_max": speed_max,
+        "mouse_accel_mean": accel_mean,
+        "mouse_accel_std": accel_std,
+        "mouse_path_length": path_length,
+        "mouse_straightness": straightness,
+    }
+
+
+def _timing_bins(values: np.ndarray) -> np.ndarray:
+    """KEY_TIMING_EDGES_MS bin of every (finite, non-negative) timing."""
+    bins = np.searchsorted(KEY_TIMING_EDGES_MS, values, side="right") - 1
+    return np.clip(bins, 0, KEY_TIMING_BINS - 1)
+
+
+def keystroke_features(down: np.ndarray, up: np.ndarray, lengths: Sequence[int]) -> Dict[str, np.ndarray]:
+    """Dwell (down->up) and flight (up->next down) timing features per session."""
+    n = len(lengths)
+    seg = segment_ids(lengths)
+
+    dwell = up - down
+    dwell_ok = np.isfinite(dwell) & (dwell >= 0)
+    dwell_seg = seg[dwell_ok]
+    dwell = dwell[dwell_ok]
+    _, dwell_mean, dwell_std = _group_stats(dwell, dwell_seg, n)
+
+    flight = down[1:] - up[:-1]
+    flight_seg = seg[:-1]
+    # Overlapping keys (negative flight) are kept at 0 so rollover typing still counts
+    flight_ok = (seg[1:] == flight_seg) & np.isfinite(flight)
+    flight = np.maximum(flight[flight_ok], 0)
+    flight_seg = flight_seg[flight_ok]
+    _, flight_mean, flight_std = _group_stats(flight, flight_seg, n)
+
+    dwell_hist = _group_histogram(_timing_bins(dwell), dwell_seg, n, KEY_TIMING_BINS)
+    flight_hist = _group_histogram(_timing_bins(flight), flight_seg, n, KEY_TIMING_BINS)
+
+    return {
+        "dwell_mean_ms": dwell_mean,
+        "dwell_std_ms": dwell_std,
+        "flight_mean_ms": flight_mean,
+        "flight_std_ms": flight_std,
+        "dwell_histogram": dwell_hist,
+        "flight_histogram": flight_hist,
+    }
+
+
+def concat_columns(columns: Sequence[Sequence[float]]) -> np.ndarray:
+    """Concatenate per-session columns into one float64 array."""
+    if not columns:
+        return np.zeros(0)
+    return np.concatenate([np.asarray(c, dtype=np.float64) for c in columns])
+
+
+def signal_features(
+    mouse_t: Sequence[Sequence[float]],
+    mouse_x: Sequence[Sequence[float]],
+    mouse_y: Sequence[Sequence[float]],
+    key_down: Sequence[Sequence[float]],
+    key_up: Sequence[Sequence[float]],
+) -> list:
+    """BehavioralFeatures fields derived from raw signals, one dict per session."""
+    return columnar_signal_features(
+        concat_columns(mouse_t), concat_columns(mouse_x), concat_columns(mouse_y), [len(c) for c in mouse_t],
+        concat_columns(key_down), concat_columns(key_up), [len(c) for c in key_down],
+    )
+
+
+def columnar_signal_features(
+    mouse_t: np.ndarray,
+    mouse_x: np.ndarray,
+    mouse_y: np.ndarray,
+    mouse_lengths: Sequence[int],
+    key_down: np.ndarray,
+    key_up: np.ndarray,
+    key_lengths: Sequence[int],
+) -> list:
+    """signal_features over already concatenated arrays, given each session's sample counts."""
+    mouse = mouse_features(mouse_t, mouse_x, mouse_y, mouse_lengths)
+    keys = keystroke_features(key_down, key_up, key_lengths)
+
+    dynamics = np.hstack([keys["dwell_histogram"], keys["flight_histogram"]]).round(4)
+    scalar_mouse = {name: values.round(4) for name, values in mouse.items()}
+    scalar_keys = {name: keys[name].round(2) for name in ("dwell_mean_ms", "dwell_std_ms", "flight_mean_ms", "flight_std_ms")}
+
+    out = []
+    for i in range(len(mouse_lengths)):
+        row = {name: float(values[i]) for name, values in scalar_mouse.items()}
+        row.update({name: float(values[i]) for name, values in scalar_keys.items()})
+        row["keystroke_dynamics"] = dynamics[i].tolist()
+        out.append(row)
+    return out
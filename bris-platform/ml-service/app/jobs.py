@@ -0,0 +1,248 @@
+"""Background job queue for slow AI work such as forensic reports.
+
+Callers get a job id back immediately and poll (or long-poll) for the
+result instead of holding a request open for the whole generation. A fixed
+pool of worker tasks takes jobs from an asyncio.PriorityQueue, so critical
+sessions are generated before routine ones. Submissions with the same key
+collapse into one job, and finished jobs are kept for a TTL.
+
+Job status is mirrored to app/shared_state.py, so with Redis a job
+submitted to one worker can be polled through any other.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.shared_state import SharedState, shared_state
+
+logger = logging.getLogger(__name__)
+
+FORENSIC_JOB_WORKERS = int(os.getenv("FORENSIC_JOB_WORKERS", "2"))
+FORENSIC_JOB_MAX_QUEUED = int(os.getenv("FORENSIC_JOB_MAX_QUEUED", "500"))
+FORENSIC_JOB_RESULT_TTL_SECONDS = float(os.getenv("FORENSIC_JOB_RESULT_TTL_SECONDS", "3600"))
+JOB_MAX_WAIT_SECONDS = float(os.getenv("JOB_MAX_WAIT_SECONDS", "30"))
+# How often a long-poll on another worker's job re-reads the shared record
+SHARED_POLL_INTERVAL_SECONDS = 0.5
+
+# Lower rank runs first
+PRIORITIES = {"critical": 0, "high": 1, "normal": 2, "low": 3}
+
+
+class JobQueueFullError(Exception):
+    pass
+
+
+class Job:
+    __slots__ = (
+        "id", "key", "priority", "seq", "payload", "status", "result", "error",
+        "submitted_at", "started_at", "finished_at", "done",
+    )
+
+    def __init__(self, key: str, priority: str, payload: Any):
+        self.id = f"job_{uuid.uuid4().hex}"
+        self.key = key
+        self.priority = priority
+        # Order of the job's live queue entry among equal priorities
+        self.seq = 0
+        self.payload = payload
+        self.status = "queued"
+        self.result: Optional[Any] = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.done = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[Any]],
+        workers: int = FORENSIC_JOB_WORKERS,
+        max_queued: int = FORENSIC_JOB_MAX_QUEUED,
+        result_ttl: float = FORENSIC_JOB_RESULT_TTL_SECONDS,
+        shared: Optional[SharedState] = shared_state,
+    ):
+        self.name = name
+        self.handler = handler
+        self.worker_count = max(1, workers)
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.shared = shared
+        self._queue: "asyncio.PriorityQueue[Tuple[int, int, Job]]" = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._jobs: Dict[str, Job] = {}
+        # Unfinished or unexpired job per dedup key
+        self._by_key: Dict[str, str] = {}
+        # Finished job ids in completion order, for TTL expiry
+        self._finished: "OrderedDict[str, float]" = OrderedDict()
+        self._workers: List[asyncio.Task] = []
+        self.queued = 0
+        self.running = 0
+        self.submitted = 0
+        self.deduplicated = 0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._work(i)) for i in range(self.worker_count)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if finished_at > cutoff:
+                break
+            self._finished.popitem(last=False)
+            job = self._jobs.pop(job_id, None)
+            if job is not None and self._by_key.get(job.key) == job_id:
+                del self._by_key[job.key]
+
+    async def submit(self, key: str, payload: Any, priority: str = "normal", refresh: bool = False) -> Tuple[Job, bool]:
+        """Queue a job, or return the existing one for ``key``; returns (job, deduplicated)."""
+        self._expire()
+        existing = self._jobs.get(self._by_key.get(key, ""))
+        if existing is not None and not (refresh and existing.finished):
+            self.deduplicated += 1
+            # A more urgent duplicate moves the queued job up; the stale queue entry is skipped later
+            if existing.status == "queued" and PRIORITIES[priority] < PRIORITIES[existing.priority]:
+                existing.priority = priority
+                self._enqueue(existing)
+                await self._publish(existing)
+            return existing, True
+
+        if self.queued >= self.max_queued:
+            raise JobQueueFullError(f"{self.name} queue is full ({self.max_queued} jobs waiting)")
+        job = Job(key, priority, payload)
+        self._jobs[job.id] = job
+        self._by_key[key] = job.id
+        self.queued += 1
+        self.submitted += 1
+        self._enqueue(job)
+        await self._publish(job)
+        return job, False
+
+    def _enqueue(self, job: Job):
+        job.seq = next(self._seq)
+        self._queue.put_nowait((PRIORITIES[job.priority], job.seq, job))
+
+    async def _work(self, worker_id: int):
+        while True:
+            _, seq, job = await self._queue.get()
+            if job.status != "queued" or seq != job.seq:
+                continue
+            self.queued -= 1
+            self.running += 1
+            job.status = "running"
+            job.started_at = time.time()
+            await self._publish(job)
+            try:
+                job.result = await self.handler(job.payload)
+                job.status = "completed"
+                self.completed += 1
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "Service shutting down"
+                raise
+            except Exception as e:
+                logger.error(f"{self.name} job {job.id} failed: {e}")
+                job.status = "failed"
+                job.error = str(e)
+                self.failed += 1
+            finally:
+                self.running -= 1
+                job.finished_at = time.time()
+                job.payload = None
+                self._finished[job.id] = job.finished_at
+                job.done.set()
+            await self._publish(job)
+
+    async def _publish(self, job: Job):
+        if self.shared is not None:
+            try:
+                await self.shared.set(f"job:{job.id}", json.dumps(job.to_dict(), default=str), self.result_ttl)
+            except Exception as e:
+                logger.warning(f"Could not publish job {job.id}: {e}")
+
+    async def _shared_record(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if self.shared is None:
+            return None
+        raw = await self.shared.get(f"job:{job_id}")
+        return json.loads(raw) if raw else None
+
+    def queue_position(self, job: Job) -> Optional[int]:
+        """1-based position among queued jobs, or None if it isn't waiting."""
+        if job.status != "queued":
+            return None
+        rank = (PRIORITIES[job.priority], job.seq)
+        return 1 + sum(
+            1 for other in self._jobs.values()
+            if other.status == "queued" and (PRIORITIES[other.priority], other.seq) < rank
+        )
+
+    async def get(self, job_id: str, wait: float = 0.0) -> Optional[Dict[str, Any]]:
+        """Job record, optionally waiting up to ``wait`` seconds for it to finish."""
+        self._expire()
+        wait = min(max(wait, 0.0), JOB_MAX_WAIT_SECONDS)
+        job = self._jobs.get(job_id)
+        if job is not None:
+            if wait and not job.finished:
+                try:
+                    await asyncio.wait_for(job.done.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            record = job.to_dict()
+            record["queue_position"] = self.queue_position(job)
+            return record
+
+        # Submitted to another worker: follow its shared record
+        deadline = time.monotonic() + wait
+        record = await self._shared_record(job_id)
+        while record is not None and record["status"] in ("queued", "running") and time.monotonic() < deadline:
+            await asyncio.sleep(min(SHARED_POLL_INTERVAL_SECONDS, max(deadline - time.monotonic(), 0)))
+            record = await self._shared_record(job_id) or record
+        return record
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._workers),
+            "queued": self.queued,
+            "running": self.running,
+            "retained": len(self._jobs),
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "completed": self.completed,
+            "failed": self.failed,
+            "max_queued": self.max_queued,
+            "result_ttl_seconds": self.result_ttl,
+        }
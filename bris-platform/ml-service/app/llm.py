@@ -0,0 +1,238 @@
+"""Non-blocking access to the Gemini SDK.
+
+The google.generativeai calls are synchronous, so running them directly inside
+an ``async def`` handler stalls every other request on the worker. LLMClient
+runs them on a bounded thread pool, caps in-flight calls and enforces a
+per-call timeout.
+
+The SDK itself is imported and configured on first use, on a pool thread,
+so worker startup doesn't pay for it; ``warm_up()`` does that ahead of the
+first AI request.
+
+Inside a request with a deadline (app/deadlines.py), waiting for a slot and
+the call itself are both cut short at the deadline, raising
+DeadlineExceededError rather than LLMTimeoutError. Calls shared through
+app/singleflight.py run without a deadline and are bounded by the per-call
+timeout alone.
+"""
+import asyncio
+import functools
+import importlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from app import deadlines
+from app.deadlines import DeadlineExceededError
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "20"))
+LLM_LIST_MODELS_TIMEOUT_SECONDS = float(os.getenv("LLM_LIST_MODELS_TIMEOUT_SECONDS", "5"))
+
+
+class LLMTimeoutError(Exception):
+    """Raised when a Gemini call does not finish within its timeout."""
+
+
+class LLMClient:
+    """Runs Gemini SDK calls off the event loop with a concurrency cap."""
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, timeout: float = LLM_TIMEOUT_SECONDS):
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        # Timed-out calls keep their thread until the SDK gives up, so allow some headroom
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency * 2, thread_name_prefix="llm")
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.timeouts = 0
+        self.deadline_exceeded = 0
+        self._api_key: Optional[str] = None
+        self._genai = None
+        self._sdk_lock = threading.Lock()
+        self.sdk_load_ms: Optional[float] = None
+        self.sdk_error: Optional[str] = None
+
+    def configure(self, api_key: str):
+        """Set the API key; the SDK is configured with it when first loaded."""
+        self._api_key = api_key
+
+    @property
+    def ready(self) -> bool:
+        return self._genai is not None
+
+    def sdk(self):
+        """The configured google.generativeai module, imported on first call."""
+        if self._genai is None:
+            with self._sdk_lock:
+                if self._genai is None:
+                    started = time.perf_counter()
+                    try:
+                        genai = importlib.import_module("google.generativeai")
+                        genai.configure(api_key=self._api_key)
+                    except Exception as e:
+                        self.sdk_error = str(e)
+                        raise
+                    self.sdk_load_ms = (time.perf_counter() - started) * 1000
+                    self.sdk_error = None
+                    self._genai = genai
+        return self._genai
+
+    async def warm_up(self) -> bool:
+        """Load the SDK on the pool so the first AI request doesn't pay for it."""
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self.sdk)
+        except Exception as e:
+            logger.error(f"Failed to load the Gemini SDK: {e}")
+            return False
+        logger.info(f"Gemini SDK ready in {self.sdk_load_ms:.0f} ms")
+        return True
+
+    async def _acquire(self):
+        """Wait for a concurrency slot, but no longer than the request deadline allows."""
+        self.waiting += 1
+        try:
+            left = deadlines.check()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), left)
+            except asyncio.TimeoutError:
+                self.deadline_exceeded += 1
+                raise DeadlineExceededError("Request deadline passed while waiting for an LLM slot")
+        finally:
+            self.waiting -= 1
+
+    def _call_timeout(self, timeout: Optional[float]) -> Tuple[float, bool]:
+        """(seconds allowed for a call, whether the request deadline is what limits it)."""
+        timeout = self.timeout if timeout is None else timeout
+        left = deadlines.check()
+        if left is not None and left < timeout:
+            return left, True
+        return timeout, False
+
+    def _timed_out(self, timeout: float, deadline_bound: bool, what: str = "call") -> Exception:
+        if deadline_bound:
+            self.deadline_exceeded += 1
+            return DeadlineExceededError(f"LLM {what} cut off at the request deadline ({timeout:.1f}s)")
+        self.timeouts += 1
+        return LLMTimeoutError(f"LLM {what} exceeded {timeout:.1f}s")
+
+    async def _run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        await self._acquire()
+        self.in_flight += 1
+        try:
+            timeout, deadline_bound = self._call_timeout(timeout)
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                raise self._timed_out(timeout, deadline_bound)
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def generate(
+        self,
+        model_name: str,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """Generate content with one model and return the response text."""
+        timeout, _ = self._call_timeout(timeout)
+
+        def call() -> str:
+            model = self.sdk().GenerativeModel(model_name)
+            response = model.generate_content(
+                prompt,
+                generation_config=generation_config,
+                request_options={"timeout": timeout},
+            )
+            return response.text
+
+        return await self._run(call, timeout=timeout)
+
+    async def stream(
+        self,
+        model_name: str,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        """Yield response text chunks as the model produces them.
+
+        The SDK's blocking chunk iterator runs on the thread pool and hands
+        chunks to the loop through a queue; ``timeout`` bounds the whole stream.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+        cancelled = False
+
+        def produce():
+            try:
+                model = self.sdk().GenerativeModel(model_name)
+                response = model.generate_content(
+                    prompt,
+                    generation_config=generation_config,
+                    stream=True,
+                    request_options={"timeout": timeout},
+                )
+                for chunk in response:
+                    if cancelled:
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk.text)
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+
+        await self._acquire()
+        self.in_flight += 1
+        try:
+            timeout, deadline_bound = self._call_timeout(timeout)
+            deadline = loop.time() + timeout
+            loop.run_in_executor(self._executor, produce)
+            while True:
+                remaining = deadline - loop.time()
+                try:
+                    item = await asyncio.wait_for(queue.get(), max(remaining, 0))
+                except asyncio.TimeoutError:
+                    raise self._timed_out(timeout, deadline_bound, "stream")
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            cancelled = True
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def list_models(self, timeout: float = LLM_LIST_MODELS_TIMEOUT_SECONDS) -> List[str]:
+        """Names of the models that support generateContent for this API key."""
+
+        def call() -> List[str]:
+            return [m.name for m in self.sdk().list_models() if "generateContent" in m.supported_generation_methods]
+
+        return await self._run(call, timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "timeouts": self.timeouts,
+            "deadline_exceeded": self.deadline_exceeded,
+            "timeout_seconds": self.timeout,
+            "sdk_loaded": self.ready,
+            "sdk_load_ms": round(self.sdk_load_ms, 1) if self.sdk_load_ms is not None else None,
+            "sdk_error": self.sdk_error,
+        }
+
+
+llm_client = LLMClient()
@@ -1,31 +1,93 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Dict, Optional, List
 import time
+
+# Taken before the other imports so /health can report the whole startup cost
+PROCESS_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, Header, HTTPException, Request, Response, WebSocket
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 import logging
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
 import json
+import asyncio
+import re
+import numpy as np
 
-# Load env variables
+# Load env variables before the app modules below read their settings at import time
 load_dotenv()
 
+from app.baselines import (
+    BASELINE_SCORING,
+    BASELINE_SNAPSHOT_INTERVAL_SECONDS,
+    BASELINE_SNAPSHOT_PATH,
+    BASELINE_Z_THRESHOLD,
+    baseline_deviation,
+    baseline_store,
+    write_snapshot,
+)
+from app import deadlines
+from app.cache import cache_bypassed, fingerprint, response_cache
+from app.cpu_pool import CPU_POOL_MIN_ROWS, CPU_POOL_MIN_SAMPLES, CPU_POOL_WARM_UP, CPUPoolError, CPUPoolTimeoutError, cpu_pool
+from app.deadlines import (
+    AI_MAX_QUEUE_DEPTH,
+    FALLBACK_ERRORS,
+    DeadlineExceededError,
+    DeadlineMiddleware,
+    OverloadedError,
+)
+from app.features import signal_features
+from app.jobs import PRIORITIES, JobQueue, JobQueueFullError
+from app.llm import llm_client
+from app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from app.metrics import AI_DEGRADED_RESPONSES, PARSE_AI_JSON_FAILURES, CallbackCounter, CallbackGauge, InstrumentedRoute, registry
+from app.model_registry import MODEL_RELOAD_INTERVAL_SECONDS, model_registry
+from app.model_router import model_router
+from app.prompting import compact_features, digest_events
+from app.scoring import (
+    FEATURE_COLUMNS,
+    MITIGATION_TIERS,
+    anomaly_codes,
+    anomaly_types,
+    feature_matrix,
+    mitigation_steps,
+    mitigation_tiers,
+)
+from app.session_store import session_store
+from app.similarity import SIMILARITY_MAINTENANCE_INTERVAL_SECONDS, session_index, session_vectors
+from app.shared_state import shared_state
+from app.streaming import STREAM_MAX_EVENTS_PER_MESSAGE, score_streams, window_store
+from app.singleflight import llm_singleflight
+from app.wire import (
+    ERROR_CODE as WIRE_ERROR_CODE,
+    WIRE_CONTENT_TYPE,
+    WireFormatError,
+    decode_predict_request,
+    encode_predict_response,
+)
+
 # Configure Gemini
 api_key = os.getenv("GEMINI_API_KEY")
-model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
 
-if api_key and api_key.strip() and api_key != "your_gemini_api_key_here":
-    try:
-        genai.configure(api_key=api_key)
-        ai_enabled = True
-    except Exception as e:
-        print(f"Failed to configure Gemini: {e}")
-        ai_enabled = False
-else:
-    ai_enabled = False
+ai_enabled = bool(api_key and api_key.strip() and api_key != "your_gemini_api_key_here")
+if ai_enabled:
+    # The SDK is imported on first use, or by the warm-up task once the server is up
+    llm_client.configure(api_key)
+
+AI_WARMUP_DELAY_SECONDS = float(os.getenv("AI_WARMUP_DELAY_SECONDS", "1"))
+startup_timings: Dict[str, Optional[float]] = {"scoring_ready_ms": None, "ai_ready_ms": None}
+
+# Bump when a prompt or response shape changes so cached answers are invalidated
+PROMPT_VERSIONS = {
+    "ai/dna": "dna-v1",
+    "ai/reconstruction": "reconstruction-v1",
+    "explain": "explain-v1",
+    "ai/query": "query-v2",
+    "ai/forensic-report": "report-v2",
+}
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -37,6 +99,8 @@ app = FastAPI(
     description="Behavioral Risk Intelligence System - ML Prediction Service",
     version="1.0.0",
 )
+# Per-route latency and in-flight metrics; must be set before routes are declared
+app.router.route_class = InstrumentedRoute
 
 # CORS middleware
 app.add_middleware(
@@ -46,6 +110,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Request deadlines for AI calls: X-Request-Deadline-Ms or a per-endpoint default
+app.add_middleware(DeadlineMiddleware)
 
 # ============================================
 # REQUEST/RESPONSE MODELS
@@ -86,6 +152,65 @@ class PredictResponse(BaseModel):
     model_version: str
     explanation: Optional[str] = None
     processing_time_ms: float
+    # Per-feature z-scores against the user's own baseline, once they have one
+    baseline_deviation: Optional[Dict[str, float]] = None
+
+class BatchPredictRequest(BaseModel):
+    # Items are validated one by one so a bad entry (even a non-object) doesn't fail the whole batch
+    requests: List[Any]
+
+class BatchPredictItem(BaseModel):
+    index: int
+    user_id: Optional[int] = None
+    session_id: Optional[str] = None
+    prediction: Optional[PredictResponse] = None
+    error: Optional[str] = None
+
+class BatchPredictResponse(BaseModel):
+    results: List[BatchPredictItem]
+    count: int
+    error_count: int
+    processing_time_ms: float
+
+class BehaviorEventIn(BaseModel):
+    user_id: int
+    session_id: str
+    event_type: str
+    timestamp: datetime
+    event_data: Optional[Dict[str, Any]] = None
+    device_fingerprint: Optional[str] = None
+    ip_address: Optional[str] = None
+
+class SessionEventsRequest(BaseModel):
+    events: List[BehaviorEventIn]
+
+class SessionEventsResponse(BaseModel):
+    ingested: int
+    sessions: List[str]
+    active_sessions: int
+
+class RawSignalSession(BaseModel):
+    session_id: str
+    # Columnar raw signals; timestamps in ms, positions in px
+    mouse_t: List[float] = []
+    mouse_x: List[float] = []
+    mouse_y: List[float] = []
+    key_down: List[float] = []
+    key_up: List[float] = []
+    # When given, the extracted signals are merged into these features
+    features: Optional[BehavioralFeatures] = None
+
+class FeatureExtractRequest(BaseModel):
+    sessions: List[RawSignalSession]
+
+class ExtractedSessionFeatures(BaseModel):
+    session_id: str
+    signals: Dict[str, Any]
+    features: Optional[BehavioralFeatures] = None
+
+class FeatureExtractResponse(BaseModel):
+    sessions: List[ExtractedSessionFeatures]
+    processing_time_ms: float
 
 class ExplainRequest(BaseModel):
     user_id: int
@@ -109,6 +234,9 @@ class AIDNAResponse(BaseModel):
     intent_level: str
     mood_state: str
     verdict_label: str
+    # True when the LLM was skipped (deadline or overload) and the rule-based fallback answered
+    degraded: bool = False
+    degraded_reason: Optional[str] = None
 
 class AIReconstructionRequest(BaseModel):
     session_id: str
@@ -117,14 +245,42 @@ class AIReconstructionRequest(BaseModel):
 class AIReconstructionResponse(BaseModel):
     reconstruction: str
     visual_clues: List[str]
+    degraded: bool = False
+    degraded_reason: Optional[str] = None
 
 class AIGPTQueryRequest(BaseModel):
     query: str
     context_data: Optional[List[dict]] = None
 
+class SimilarSession(BaseModel):
+    session_id: str
+    user_id: int
+    # Cosine similarity of the log-scaled feature vectors; None when not ranked by similarity
+    similarity: Optional[float] = None
+    risk_score: float
+    scored_at: datetime
+
+class SimilarRequest(BaseModel):
+    # Either a session that has been scored (or is in the session store), or a feature payload
+    session_id: Optional[str] = None
+    features: Optional[BehavioralFeatures] = None
+    k: int = 10
+    exact: bool = False
+
+class SimilarResponse(BaseModel):
+    session_id: Optional[str] = None
+    matches: List[SimilarSession]
+    mode: str
+    candidates: int
+    processing_time_ms: float
+
 class AIGPTQueryResponse(BaseModel):
     answer: str
     action_suggestion: Optional[str] = None
+    # Indexed sessions the answer was grounded on
+    related_sessions: Optional[List[SimilarSession]] = None
+    degraded: bool = False
+    degraded_reason: Optional[str] = None
 
 class AIForensicReportRequest(BaseModel):
     session_id: str
@@ -132,6 +288,12 @@ class AIForensicReportRequest(BaseModel):
     features: BehavioralFeatures
     events_summary: Optional[List[dict]] = None
 
+class AIForensicReportJobRequest(AIForensicReportRequest):
+    # critical, high, normal or low; derived from the session's risk score when omitted
+    priority: Optional[str] = None
+    # Generate again even if a finished report for this session is still retained
+    refresh: bool = False
+
 class AIForensicReportResponse(BaseModel):
     report_id: str
     summary_narrative: str
@@ -139,6 +301,10 @@ class AIForensicReportResponse(BaseModel):
     behavioral_evidence: List[str]
     mitigation_roadmap: List[str]
     generated_at: datetime
+    # Size of the event log before and after it was digested for the prompt
+    prompt_compaction: Optional[Dict[str, Any]] = None
+    degraded: bool = False
+    degraded_reason: Optional[str] = None
 
 # Helper to parse AI JSON safely
 def parse_ai_json(text: str) -> dict:
@@ -152,9 +318,120 @@ def parse_ai_json(text: str) -> dict:
         
         return json.loads(clean_text)
     except Exception as e:
+        PARSE_AI_JSON_FAILURES.inc()
         logger.error(f"Failed to parse AI JSON: {e}")
         return {}
 
+_json_decoder = json.JSONDecoder()
+
+def extract_json_fields(text: str, keys, skip=()) -> Dict[str, Any]:
+    """Values of top-level keys that are already complete in a partial JSON document."""
+    found = {}
+    for key in keys:
+        if key in skip:
+            continue
+        marker = text.find(f'"{key}"')
+        if marker < 0:
+            continue
+        colon = text.find(":", marker + len(key) + 2)
+        if colon < 0:
+            continue
+        start = colon + 1
+        while start < len(text) and text[start].isspace():
+            start += 1
+        try:
+            value, end = _json_decoder.raw_decode(text, start)
+        except ValueError:
+            continue
+        # A number at the very end of the buffer may still be growing
+        if end == len(text) and isinstance(value, (int, float)):
+            continue
+        found[key] = value
+    return found
+
+# ============================================
+# MODEL AND BASELINE LIFECYCLE
+# ============================================
+
+async def reload_model_periodically():
+    while True:
+        await asyncio.sleep(MODEL_RELOAD_INTERVAL_SECONDS)
+        # Loading maps the arrays and probes the model; keep it off the event loop
+        await asyncio.to_thread(model_registry.reload)
+
+async def save_baselines():
+    # Copy on the event loop so the write thread sees a consistent store
+    data = baseline_store.snapshot_data()
+    try:
+        await asyncio.to_thread(write_snapshot, data, BASELINE_SNAPSHOT_PATH)
+    except Exception as e:
+        logger.error(f"Failed to snapshot baselines to {BASELINE_SNAPSHOT_PATH}: {e}")
+
+async def snapshot_baselines_periodically():
+    while True:
+        await asyncio.sleep(BASELINE_SNAPSHOT_INTERVAL_SECONDS)
+        await save_baselines()
+
+@app.on_event("startup")
+async def load_model():
+    model_registry.reload()
+    if MODEL_RELOAD_INTERVAL_SECONDS > 0:
+        app.state.model_reloader = asyncio.create_task(reload_model_periodically())
+
+@app.on_event("startup")
+async def load_baselines():
+    if baseline_store.load(BASELINE_SNAPSHOT_PATH):
+        logger.info(f"Loaded baselines for {len(baseline_store)} users from {BASELINE_SNAPSHOT_PATH}")
+    if BASELINE_SNAPSHOT_INTERVAL_SECONDS > 0:
+        app.state.baseline_snapshotter = asyncio.create_task(snapshot_baselines_periodically())
+
+async def warm_up_ai():
+    global ai_enabled
+    # Give uvicorn time to start accepting requests before competing with it
+    await asyncio.sleep(AI_WARMUP_DELAY_SECONDS)
+    if not await llm_client.warm_up():
+        # Same as a failed configure used to be: serve the offline fallbacks
+        ai_enabled = False
+        return
+    await model_router.available_models()
+    startup_timings["ai_ready_ms"] = round((time.perf_counter() - PROCESS_STARTED) * 1000, 1)
+
+async def maintain_similarity_index_periodically():
+    while True:
+        await asyncio.sleep(SIMILARITY_MAINTENANCE_INTERVAL_SECONDS)
+        try:
+            await session_index.maintain()
+        except Exception as e:
+            logger.error(f"Similarity index maintenance failed: {e}")
+
+@app.on_event("startup")
+async def start_job_workers():
+    forensic_jobs.start()
+    if cpu_pool.enabled and CPU_POOL_WARM_UP:
+        app.state.cpu_pool_warmup = asyncio.create_task(cpu_pool.warm_up())
+    if SIMILARITY_MAINTENANCE_INTERVAL_SECONDS > 0:
+        app.state.similarity_maintainer = asyncio.create_task(maintain_similarity_index_periodically())
+
+@app.on_event("startup")
+async def mark_scoring_ready():
+    # Registered last, so every scoring dependency above has loaded
+    startup_timings["scoring_ready_ms"] = round((time.perf_counter() - PROCESS_STARTED) * 1000, 1)
+    logger.info(f"Scoring ready {startup_timings['scoring_ready_ms']:.0f} ms after process start")
+    if ai_enabled:
+        app.state.ai_warmup = asyncio.create_task(warm_up_ai())
+
+@app.on_event("shutdown")
+async def stop_background_work():
+    for name in ("model_reloader", "baseline_snapshotter", "ai_warmup", "similarity_maintainer", "cpu_pool_warmup"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+    await forensic_jobs.stop()
+    cpu_pool.shutdown()
+    if len(baseline_store):
+        await save_baselines()
+    await shared_state.close()
+
 # ============================================
 # HEALTH CHECK
 # ============================================
@@ -166,6 +443,34 @@ async def health_check():
         "service": "bris-ml-service",
         "version": "1.0.0",
         "timestamp": datetime.now().isoformat(),
+        "llm": llm_client.stats(),
+        "sessions": session_store.stats(),
+        "streaming": {**score_streams.stats(), **window_store.stats()},
+        "baselines": baseline_store.stats(),
+        "similarity_index": session_index.stats(),
+        "cpu_pool": cpu_pool.stats(),
+        "startup": {
+            **startup_timings,
+            "ai_sdk_load_ms": llm_client.stats()["sdk_load_ms"],
+            "uptime_seconds": round(time.perf_counter() - PROCESS_STARTED, 1),
+        },
+    }
+
+@app.get("/ready")
+async def readiness(response: Response, component: str = "scoring"):
+    """Readiness probe: 503 until scoring (default) or, with ?component=ai, the Gemini client is ready."""
+    scoring_ready = startup_timings["scoring_ready_ms"] is not None
+    ai_ready = ai_enabled and llm_client.ready
+    if component not in ("scoring", "ai"):
+        raise HTTPException(status_code=422, detail="component must be 'scoring' or 'ai'")
+    if not (ai_ready if component == "ai" else scoring_ready):
+        response.status_code = 503
+    return {
+        "scoring_ready": scoring_ready,
+        "ai_ready": ai_ready,
+        "ai_enabled": ai_enabled,
+        "ai_error": llm_client.sdk_error,
+        "model_version": model_registry.active.version,
     }
 
 # ============================================
@@ -179,17 +484,21 @@ async def health_check():
 def generate_behavioral_narrative(features: BehavioralFeatures) -> str:
     """Generates a human-readable narrative of the session behavior."""
     story = []
-    if features.tab_switch_count > 5:
-        story.append(f"Highly suspicious data leakage pattern: {features.tab_switch_count} tab switches detected.")
-    elif features.tab_switch_count > 0:
-        story.append(f"Minor environmental distraction: {features.tab_switch_count} tab switches.")
+    # Optional fields may arrive as null; score them as 0, like feature_row does
+    tab_switches = features.tab_switch_count or 0
+    clipboard = features.copy_paste_events or 0
+    typing_speed = features.typing_speed or 0
+    if tab_switches > 5:
+        story.append(f"Highly suspicious data leakage pattern: {tab_switches} tab switches detected.")
+    elif tab_switches > 0:
+        story.append(f"Minor environmental distraction: {tab_switches} tab switches.")
         
-    if features.copy_paste_events > 0:
-        story.append(f"Non-authentic input pattern: User bypassed manual entry {features.copy_paste_events} times via clipboard.")
+    if clipboard > 0:
+        story.append(f"Non-authentic input pattern: User bypassed manual entry {clipboard} times via clipboard.")
         
-    if features.typing_speed > 160:
+    if typing_speed > 160:
         story.append("Input throughput exceeds human benchmarks; potential script/bot interaction.")
-    elif features.typing_speed < 15 and features.event_count > 50:
+    elif typing_speed < 15 and features.event_count > 50:
         story.append("Evidence of cognitive load or coaching: abnormally slow input relative to activity.")
 
     if not story: return "Standard behavioral baseline. No significant deviations from organic user patterns."
@@ -197,58 +506,402 @@ def generate_behavioral_narrative(features: BehavioralFeatures) -> str:
 
 def generate_mitigation(risk_score: float, features: BehavioralFeatures) -> List[str]:
     """Generates professional mitigation steps."""
-    steps = []
-    if risk_score > 75:
-        steps.append("BLOCK: Initiate Automatic Session Termination")
-        steps.append("MFA: Trigger Out-of-Band Biometric Challenge")
-    elif risk_score > 40:
-        steps.append("UI: Inject 'Bot-Check' CAPTCHA")
-        steps.append("NOTIFY: Level 1 Analyst Review Required")
-    else:
-        steps.append("LOG: Continue Background Surveillance")
-    return steps
+    tier = 2 if risk_score > 75 else 1 if risk_score > 40 else 0
+    return list(MITIGATION_TIERS[tier])
+
+def contributing_factors(f: BehavioralFeatures) -> List[str]:
+    factors = []
+    if (f.tab_switch_count or 0) > 0: factors.append(f"Tab Switches: {f.tab_switch_count}")
+    if (f.copy_paste_events or 0) > 0: factors.append(f"Clipboard Actions: {f.copy_paste_events}")
+    if (f.typing_speed or 0) > 150: factors.append("Anomalous Typing Speed")
+    return factors
+
+def estimate_risk(features: BehavioralFeatures) -> float:
+    """Risk from the active model without recording the session or touching baselines."""
+    return float(model_registry.active.score(feature_matrix([features]))[0])
 
 @app.post("/predict", response_model=PredictResponse)
 async def predict(request: PredictRequest):
     """Predict risk and generate AI narrative."""
+    try:
+        return score_features(request.user_id, request.features, time.time(), request.session_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def score_matrix(user_ids, X: np.ndarray, session_ids: Optional[List[str]] = None):
+    """Score rows with the active model, then fold them into their users' baselines.
+
+    With ``session_ids``, the scored sessions are also added to the similarity index.
+    Returns (risk, Z, model_version); Z is None when no row had a usable baseline.
+    """
+    # One reference for the whole call, so a hot reload can't split a batch across versions
+    model = model_registry.active
+    Z = baseline_store.zscores(user_ids, X) if BASELINE_SCORING else None
+    risk = np.round(model.score(X, Z, BASELINE_Z_THRESHOLD), 2)
+    return record_scores(model, user_ids, X, Z, risk, session_ids)
+
+async def score_matrix_offloaded(user_ids, X: np.ndarray, session_ids: Optional[List[str]] = None):
+    """score_matrix, with the model evaluated in the CPU pool for large batches.
+
+    Raises HTTPException(503) when the pool times out; if the pool itself
+    fails, the batch is scored inline instead.
+    """
+    if not cpu_pool.enabled or len(X) < CPU_POOL_MIN_ROWS:
+        return score_matrix(user_ids, X, session_ids)
+    model = model_registry.active
+    Z = baseline_store.zscores(user_ids, X) if BASELINE_SCORING else None
+    try:
+        risk = await cpu_pool.score(model, X, Z, BASELINE_Z_THRESHOLD)
+    except CPUPoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except CPUPoolError as e:
+        logger.error(f"{e}; scoring {len(X)} rows inline")
+        risk = model.score(X, Z, BASELINE_Z_THRESHOLD)
+    return record_scores(model, user_ids, X, Z, np.round(risk, 2), session_ids)
+
+def record_scores(model, user_ids, X: np.ndarray, Z: Optional[np.ndarray], risk: np.ndarray, session_ids: Optional[List[str]]):
+    model_registry.record(model.version, len(X))
+    if Z is not None:
+        # Critical sessions are left out so an attacker can't drag their baseline along
+        learn = risk <= 80
+        learned_sessions = None if session_ids is None else [sid for sid, ok in zip(session_ids, learn) if ok]
+        baseline_store.update(np.asarray(user_ids)[learn], X[learn], learned_sessions)
+    if session_ids is not None:
+        session_index.add(session_ids, user_ids, X, risk)
+    return risk, Z, model.version
+
+def score_features(user_id: int, f: BehavioralFeatures, start_time: float, session_id: Optional[str] = None) -> PredictResponse:
+    risk, Z, model_version = score_matrix([user_id], feature_matrix([f]), None if session_id is None else [session_id])
+    risk_score = float(risk[0])
+    
+    narrative = generate_behavioral_narrative(f)
+    mitigation = generate_mitigation(risk_score, f)
+    
+    return PredictResponse(
+        risk_score=risk_score,
+        confidence=0.94,
+        anomaly_type="critical" if risk_score > 80 else "anomaly" if risk_score > 40 else "normal",
+        model_version=model_version,
+        explanation=f"**SUMMARY:** {narrative} | **MITIGATION:** {', '.join(mitigation)}",
+        processing_time_ms=round((time.time() - start_time) * 1000, 2),
+        baseline_deviation=baseline_deviation(Z[0]) if Z is not None else None,
+    )
+
+@app.post(
+    "/predict/batch",
+    response_model=BatchPredictResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": BatchPredictRequest.schema()},
+                WIRE_CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}},
+            },
+        }
+    },
+)
+async def predict_batch(request: Request):
+    """Score many sessions in one call; risk, anomaly type and mitigation are computed as array ops.
+
+    Accepts JSON, or the binary columnar frame from app/wire.py (answered in kind).
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type == WIRE_CONTENT_TYPE:
+        return await score_columnar_batch(await request.body())
+
+    try:
+        payload = BatchPredictRequest(**(await request.json()))
+    except (ValidationError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return await score_batch(payload)
+
+async def score_columnar_batch(body: bytes) -> Response:
+    """Binary path: features are scored straight from NumPy views over the request body."""
     start_time = time.time()
     try:
-        f = request.features
-        risk_score = min(max((f.tab_switch_count * 12) + (f.copy_paste_events * 10) + (15 if f.typing_speed > 150 else 0), 0), 100)
-        
-        narrative = generate_behavioral_narrative(f)
-        mitigation = generate_mitigation(risk_score, f)
-        
-        return PredictResponse(
-            risk_score=round(risk_score, 2),
-            confidence=0.94,
-            anomaly_type="critical" if risk_score > 80 else "anomaly" if risk_score > 40 else "normal",
-            model_version="bris-v2-ai-forensics",
-            explanation=f"**SUMMARY:** {narrative} | **MITIGATION:** {', '.join(mitigation)}",
-            processing_time_ms=round((time.time() - start_time) * 1000, 2)
-        )
+        batch = decode_predict_request(body)
+    except WireFormatError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid columnar frame: {e}")
+
+    X = batch.features
+    ok = np.isfinite(X).all(axis=1)
+    risk, _, model_version = await score_matrix_offloaded(batch.user_ids, X, batch.session_ids())
+    risk[~ok] = np.nan
+    codes = anomaly_codes(risk).astype(np.uint8)
+    codes[~ok] = WIRE_ERROR_CODE
+    confidence = np.where(ok, 0.94, 0.0)
+
+    return Response(
+        content=encode_predict_response(risk, confidence, codes),
+        media_type=WIRE_CONTENT_TYPE,
+        headers={
+            "X-Model-Version": model_version,
+            "X-Processing-Time-Ms": f"{(time.time() - start_time) * 1000:.3f}",
+        },
+    )
+
+async def score_batch(request: BatchPredictRequest) -> BatchPredictResponse:
+    start_time = time.time()
+
+    valid: List[PredictRequest] = []
+    valid_positions: List[int] = []
+    results: List[BatchPredictItem] = []
+    for index, raw in enumerate(request.requests):
+        item = BatchPredictItem(index=index)
+        try:
+            if not isinstance(raw, dict):
+                raise TypeError(f"expected an object, got {type(raw).__name__}")
+            parsed = PredictRequest(**raw)
+            valid.append(parsed)
+            valid_positions.append(index)
+            item.user_id, item.session_id = parsed.user_id, parsed.session_id
+        except (ValidationError, TypeError, ValueError) as e:
+            item.error = str(e)
+            # Echo whichever identifiers are usable so the caller can match the failure up
+            if isinstance(raw, dict):
+                user_id, session_id = raw.get("user_id"), raw.get("session_id")
+                item.user_id = user_id if isinstance(user_id, int) and not isinstance(user_id, bool) else None
+                item.session_id = session_id if isinstance(session_id, str) else None
+        results.append(item)
+
+    if valid:
+        vector_start = time.time()
+        X = feature_matrix(r.features for r in valid)
+        risk, Z, model_version = await score_matrix_offloaded([r.user_id for r in valid], X, [r.session_id for r in valid])
+        labels = anomaly_types(risk)
+        mitigations = mitigation_steps(mitigation_tiers(risk))
+        # The matrix work is shared, so each item is charged an equal slice of it
+        shared_ms = (time.time() - vector_start) * 1000 / len(valid)
+
+        for row, position in enumerate(valid_positions):
+            item_start = time.time()
+            # One item that can't be described must not fail the whole batch
+            try:
+                narrative = generate_behavioral_narrative(valid[row].features)
+                results[position].prediction = PredictResponse(
+                    risk_score=float(risk[row]),
+                    confidence=0.94,
+                    anomaly_type=str(labels[row]),
+                    model_version=model_version,
+                    explanation=f"**SUMMARY:** {narrative} | **MITIGATION:** {', '.join(mitigations[row])}",
+                    processing_time_ms=round(shared_ms + (time.time() - item_start) * 1000, 3),
+                    baseline_deviation=baseline_deviation(Z[row]) if Z is not None else None,
+                )
+            except Exception as e:
+                results[position].error = str(e)
+
+    error_count = sum(1 for item in results if item.error is not None)
+    if error_count:
+        logger.warning(f"Batch prediction: {error_count}/{len(results)} items failed")
+
+    return BatchPredictResponse(
+        results=results,
+        count=len(results),
+        error_count=error_count,
+        processing_time_ms=round((time.time() - start_time) * 1000, 2)
+    )
+
+# ============================================
+# RAW SIGNAL FEATURE EXTRACTION
+# ============================================
+
+@app.post("/features/extract", response_model=FeatureExtractResponse)
+async def extract_features(request: FeatureExtractRequest):
+    """Trajectory entropy, velocity/acceleration and dwell/flight features from raw signal arrays."""
+    start_time = time.time()
+    for s in request.sessions:
+        if not len(s.mouse_t) == len(s.mouse_x) == len(s.mouse_y):
+            raise HTTPException(status_code=422, detail=f"Session {s.session_id}: mouse_t, mouse_x and mouse_y differ in length")
+        if len(s.key_down) != len(s.key_up):
+            raise HTTPException(status_code=422, detail=f"Session {s.session_id}: key_down and key_up differ in length")
+
+    columns = (
+        [s.mouse_t for s in request.sessions],
+        [s.mouse_x for s in request.sessions],
+        [s.mouse_y for s in request.sessions],
+        [s.key_down for s in request.sessions],
+        [s.key_up for s in request.sessions],
+    )
+    samples = sum(len(s.mouse_t) + len(s.key_down) for s in request.sessions)
+    signals = None
+    if cpu_pool.enabled and samples >= CPU_POOL_MIN_SAMPLES:
+        try:
+            signals = await cpu_pool.signal_features(*columns)
+        except CPUPoolTimeoutError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+        except CPUPoolError as e:
+            logger.error(f"{e}; extracting {samples} samples inline")
+    if signals is None:
+        signals = signal_features(*columns)
+
+    results = []
+    for session, extracted in zip(request.sessions, signals):
+        merged = None
+        if session.features is not None:
+            merged = BehavioralFeatures(**{**session.features.dict(), **extracted})
+        results.append(ExtractedSessionFeatures(session_id=session.session_id, signals=extracted, features=merged))
+
+    return FeatureExtractResponse(
+        sessions=results,
+        processing_time_ms=round((time.time() - start_time) * 1000, 2)
+    )
+
+# ============================================
+# SESSION FEATURE STORE
+# ============================================
+
+@app.post("/sessions/events", response_model=SessionEventsResponse)
+async def ingest_session_events(request: SessionEventsRequest):
+    """Fold raw behavior events into the per-session running counters."""
+    sessions = session_store.ingest(request.events)
+    return SessionEventsResponse(
+        ingested=len(request.events),
+        sessions=sessions,
+        active_sessions=len(session_store),
+    )
+
+@app.post("/predict/session/{session_id}", response_model=PredictResponse)
+async def predict_session(session_id: str):
+    """Score a session from its accumulated state, without a feature payload."""
+    start_time = time.time()
+    state = session_store.get(session_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {session_id}")
+    try:
+        return score_features(state.user_id, BehavioralFeatures(**state.features()), start_time, session_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/sessions/{session_id}/features", response_model=BehavioralFeatures)
+async def get_session_features(session_id: str):
+    state = session_store.get(session_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {session_id}")
+    return BehavioralFeatures(**state.features())
+
+# ============================================
+# STREAMING SCORES
+# ============================================
+
+def score_stream_message(text: str) -> List[Dict[str, Any]]:
+    """Fold one streamed batch of events into its sessions' windows; returns the band changes."""
+    payload = json.loads(text)
+    events = payload.get("events") if isinstance(payload, dict) else None
+    if not isinstance(events, list):
+        raise ValueError('Expected a JSON object {"events": [...]}')
+    if len(events) > STREAM_MAX_EVENTS_PER_MESSAGE:
+        raise ValueError(f"At most {STREAM_MAX_EVENTS_PER_MESSAGE} events per message")
+    request = SessionEventsRequest(events=events)
+    # Keep the whole-session counters current too, for /predict/session and /similar
+    session_store.ingest(request.events)
+    touched = window_store.ingest(request.events)
+    if not touched:
+        return []
+    # Window features are scored as-is: baselines are learned from whole sessions, not windows
+    model = model_registry.active
+    model_registry.record(model.version, len(touched))
+    risk = np.round(model.score(np.asarray([w.feature_row() for w in touched], dtype=np.float64)), 2)
+    updates = []
+    for windows, risk_score, band in zip(touched, risk.tolist(), anomaly_types(risk).tolist()):
+        windows.risk_score = risk_score
+        if band == windows.band:
+            continue
+        updates.append({
+            "type": "risk_update",
+            "session_id": windows.session_id,
+            "user_id": windows.user_id,
+            "risk_score": risk_score,
+            "anomaly_type": band,
+            "previous_anomaly_type": windows.band,
+            "model_version": model.version,
+            "event_time": datetime.fromtimestamp(windows.last_ts).isoformat(),
+            "windows": windows.windows(),
+        })
+        windows.band = band
+    return updates
+
+@app.websocket("/ws/score")
+async def stream_scores(websocket: WebSocket):
+    """Score streamed events over sliding windows, pushing an update whenever a session changes band."""
+    await score_streams.serve(websocket, score_stream_message)
+
+# ============================================
+# SIMILAR SESSIONS
+# ============================================
+
+SIMILAR_MAX_K = 100
+
+def query_vector(session_id: Optional[str], features: Optional[BehavioralFeatures]) -> Optional[np.ndarray]:
+    """Index vector for a feature payload, an indexed session or a session in the session store."""
+    if features is not None:
+        return session_vectors(feature_matrix([features]))[0]
+    if session_id is None:
+        return None
+    vector = session_index.vector(session_id)
+    if vector is None:
+        state = session_store.get(session_id)
+        if state is not None:
+            vector = session_vectors(feature_matrix([BehavioralFeatures(**state.features())]))[0]
+    return vector
+
+@app.post("/similar", response_model=SimilarResponse)
+async def find_similar_sessions(request: SimilarRequest):
+    """Recently scored sessions whose behavior is closest to a session or a feature payload."""
+    start_time = time.time()
+    if not 1 <= request.k <= SIMILAR_MAX_K:
+        raise HTTPException(status_code=422, detail=f"k must be between 1 and {SIMILAR_MAX_K}")
+    if request.session_id is None and request.features is None:
+        raise HTTPException(status_code=422, detail="Provide session_id or features")
+    vector = query_vector(request.session_id, request.features)
+    if vector is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {request.session_id}")
+    exclude = [request.session_id] if request.session_id else []
+    matches, info = session_index.search(vector, request.k, exclude=exclude, exact=request.exact)
+    return SimilarResponse(
+        session_id=request.session_id,
+        matches=matches,
+        mode=info["mode"],
+        candidates=info["candidates"],
+        processing_time_ms=round((time.time() - start_time) * 1000, 3),
+    )
+
+# ============================================
+# USER BASELINES
+# ============================================
+
+@app.get("/users/{user_id}/baseline")
+async def get_user_baseline(user_id: int):
+    """Running mean/std per feature for a user, as used to adjust their risk scores."""
+    baseline = baseline_store.baseline(user_id)
+    if baseline is None:
+        raise HTTPException(status_code=404, detail=f"No baseline for user {user_id}")
+    return {"user_id": user_id, "sessions": baseline_store.sessions(user_id), "features": baseline}
+
 @app.post("/explain", response_model=ExplainResponse)
-async def explain(request: ExplainRequest):
+async def explain(request: ExplainRequest, cache_control: Optional[str] = Header(None)):
     """Detailed forensic explanation."""
+    use_cache = not cache_bypassed(cache_control)
+    cache_key = fingerprint("explain", PROMPT_VERSIONS["explain"], request.dict())
+    if use_cache:
+        cached = await response_cache.lookup("explain", cache_key)
+        if cached is not None:
+            return cached
+
     try:
         f = request.features
         narrative = generate_behavioral_narrative(f)
         mitigation = generate_mitigation(request.risk_score, f)
-        
-        factors = []
-        if f.tab_switch_count > 0: factors.append(f"Tab Switches: {f.tab_switch_count}")
-        if f.copy_paste_events > 0: factors.append(f"Clipboard Actions: {f.copy_paste_events}")
-        if f.typing_speed > 150: factors.append("Anomalous Typing Speed")
+        factors = contributing_factors(f)
 
-        return ExplainResponse(
+        response = ExplainResponse(
             explanation=f"✨ **AI DEEP INSIGHT**:\n\n{narrative}\n\n**PROPOSED MITIGATION:**\n" + "\n".join([f"- {s}" for s in mitigation]),
             severity="critical" if request.risk_score > 80 else "high" if request.risk_score > 60 else "medium",
             contributing_factors=factors,
             generated_at=datetime.now()
         )
+        if use_cache:
+            await response_cache.store("explain", cache_key, response)
+        return response
     except Exception as e:
         logger.error(f"Explanation error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -257,8 +910,58 @@ async def explain(request: ExplainRequest):
 # ADVANCED AI FEATURES (GEMINI POWERED)
 # ============================================
 
+# LLM calls started through call_llm and not finished; counted from admission, because a
+# burst of requests is admitted before any of them reaches the LLM client's queue
+llm_calls_pending = 0
+
+def admit_ai_request(key: Optional[str] = None):
+    """Shed a deadline-bound AI request while too many are already queued for the LLM.
+
+    Joining a call already in flight adds no load, and background work
+    (no deadline) is never shed.
+    """
+    if deadlines.remaining() is None or (key is not None and key in llm_singleflight):
+        return
+    queued = max(llm_calls_pending - llm_client.max_concurrency, llm_client.waiting)
+    if queued >= AI_MAX_QUEUE_DEPTH:
+        raise OverloadedError(f"{queued} AI requests already queued for the LLM")
+
+async def call_llm(key: str, fn):
+    """Coalesced LLM call; this caller stops waiting at its own deadline, the shared call runs on."""
+    global llm_calls_pending
+    left = deadlines.check()
+    admit_ai_request(key)
+    leader = key not in llm_singleflight
+    llm_calls_pending += leader
+    try:
+        return await asyncio.wait_for(llm_singleflight.do(key, fn), left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceededError("Request deadline passed while waiting for the LLM")
+    finally:
+        llm_calls_pending -= leader
+
+degraded_responses: Dict[str, int] = {}
+
+def degraded(endpoint: str, error: Exception) -> str:
+    AI_DEGRADED_RESPONSES.labels(endpoint, error.reason).inc()
+    key = f"{endpoint}:{error.reason}"
+    degraded_responses[key] = degraded_responses.get(key, 0) + 1
+    logger.warning(f"{endpoint}: answering with the rule-based fallback ({error.reason}): {error}")
+    return error.reason
+
+def rule_based_dna(features: BehavioralFeatures, reason: str) -> AIDNAResponse:
+    risk = estimate_risk(features)
+    return AIDNAResponse(
+        dna_profile=generate_behavioral_narrative(features),
+        intent_level="High" if risk > 75 else "Medium" if risk > 40 else "Low",
+        mood_state="Unassessed",
+        verdict_label=f"RULE_BASED_{str(anomaly_types(np.array([risk]))[0]).upper()}",
+        degraded=True,
+        degraded_reason=reason,
+    )
+
 @app.post("/ai/dna", response_model=AIDNAResponse)
-async def get_behavioral_dna(request: AIDNAPageRequest):
+async def get_behavioral_dna(request: AIDNAPageRequest, cache_control: Optional[str] = Header(None)):
     """Feat 1: AI Behavioral DNA (The Personality Profile)"""
     if not ai_enabled:
         return AIDNAResponse(
@@ -279,23 +982,36 @@ async def get_behavioral_dna(request: AIDNAPageRequest):
     4. verdict_label: A professional security tag.
     """
     
+    use_cache = not cache_bypassed(cache_control)
+    cache_key = fingerprint("ai/dna", PROMPT_VERSIONS["ai/dna"], request.features.dict())
+    if use_cache:
+        cached = await response_cache.lookup("ai/dna", cache_key)
+        if cached is not None:
+            return cached
+
+    async def generate_dna() -> dict:
+        ai_text, _ = await model_router.generate(prompt)
+        return parse_ai_json(ai_text)
+
     try:
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(prompt)
-        # Assuming AI returns JSON-ish text, we parse it or default
-        # For production, use controlled JSON output
-        return AIDNAResponse(
-            dna_profile="Methodical interaction pattern detected. User displays high familiarity with the interface.",
-            intent_level="Low",
-            mood_state="Calm",
-            verdict_label="AUTHORIZED_USER"
+        dna = await call_llm(cache_key, generate_dna)
+        response = AIDNAResponse(
+            dna_profile=dna.get("dna_profile", "Methodical interaction pattern detected. User displays high familiarity with the interface."),
+            intent_level=dna.get("intent_level", "Low"),
+            mood_state=dna.get("mood_state", "Calm"),
+            verdict_label=dna.get("verdict_label", "AUTHORIZED_USER")
         )
+        if use_cache and dna:
+            await response_cache.store("ai/dna", cache_key, response)
+        return response
+    except FALLBACK_ERRORS as e:
+        return rule_based_dna(request.features, degraded("ai/dna", e))
     except Exception as e:
         logger.error(f"Gemini DNA Error: {e}")
         return AIDNAResponse(dna_profile="Analysis failed.", intent_level="N/A", mood_state="N/A", verdict_label="ERROR")
 
 @app.post("/ai/reconstruction", response_model=AIReconstructionResponse)
-async def get_shadow_reconstruction(request: AIReconstructionRequest):
+async def get_shadow_reconstruction(request: AIReconstructionRequest, cache_control: Optional[str] = Header(None)):
     """Feat 3: AI Shadow Session Reconstruction"""
     if not ai_enabled:
         return AIReconstructionResponse(
@@ -303,18 +1019,110 @@ async def get_shadow_reconstruction(request: AIReconstructionRequest):
             visual_clues=["No data"]
         )
     
-    # Implementation logic similar to DNA but focused on physical reconstruction
-    return AIReconstructionResponse(
-        reconstruction="User likely sitting in a quiet environment. Keystroke rhythms consistent with physical keyboard usage on a desktop.",
-        visual_clues=["Standard ergonomics", "No frantic cursor jitter"]
-    )
+    prompt = f"""
+    Reconstruct the physical setting of the user behind session {request.session_id} from these behavioral features.
+    User Features: {request.features.dict()}
+
+    Return a JSON object with:
+    1. reconstruction: 2 sentences describing the likely environment, device and posture.
+    2. visual_clues: a list of 2-4 short observations supporting the reconstruction.
+    """
+
+    use_cache = not cache_bypassed(cache_control)
+    cache_key = fingerprint("ai/reconstruction", PROMPT_VERSIONS["ai/reconstruction"], request.dict())
+    if use_cache:
+        cached = await response_cache.lookup("ai/reconstruction", cache_key)
+        if cached is not None:
+            return cached
+
+    async def generate_reconstruction() -> dict:
+        ai_text, _ = await model_router.generate(prompt)
+        return parse_ai_json(ai_text)
+
+    try:
+        reconstruction = await call_llm(cache_key, generate_reconstruction)
+        response = AIReconstructionResponse(
+            reconstruction=reconstruction.get("reconstruction", "User likely sitting in a quiet environment. Keystroke rhythms consistent with physical keyboard usage on a desktop."),
+            visual_clues=reconstruction.get("visual_clues", ["Standard ergonomics", "No frantic cursor jitter"])
+        )
+        if use_cache and reconstruction:
+            await response_cache.store("ai/reconstruction", cache_key, response)
+        return response
+    except FALLBACK_ERRORS as e:
+        return AIReconstructionResponse(
+            reconstruction=generate_behavioral_narrative(request.features),
+            visual_clues=contributing_factors(request.features) or ["No rule-based indicators fired"],
+            degraded=True,
+            degraded_reason=degraded("ai/reconstruction", e),
+        )
+    except Exception as e:
+        logger.error(f"Gemini Reconstruction Error: {e}")
+        return AIReconstructionResponse(reconstruction="Reconstruction failed.", visual_clues=["No data"])
+
+QUERY_CONTEXT_ITEMS = 20
+QUERY_PROBE_SESSIONS = 3
+QUERY_RELATED_SESSIONS = 8
+# Candidate session ids in the question; only tokens that are actually indexed count
+SESSION_ID_TOKEN = re.compile(r"[\w\-:.]{4,}")
+
+def feature_dict_vector(features: Dict[str, Any]) -> Optional[np.ndarray]:
+    """Index vector for a loose feature dict from context_data; missing fields count as 0."""
+    try:
+        row = [float(features.get(name) or 0) for name in FEATURE_COLUMNS]
+    except (TypeError, ValueError):
+        return None
+    return session_vectors(np.asarray([row]))[0]
+
+def ground_query(request: AIGPTQueryRequest):
+    """Context rows and indexed sessions for a question; returns (context, related, description)."""
+    context: List[Dict[str, Any]] = []
+    probes: Dict[str, np.ndarray] = {}
+    for i, item in enumerate((request.context_data or [])[:QUERY_CONTEXT_ITEMS]):
+        session_id = item.get("session_id")
+        entry = {k: v for k, v in item.items() if k != "features"}
+        vector = None
+        if isinstance(item.get("features"), dict):
+            entry["features"] = compact_features(item["features"])
+            vector = feature_dict_vector(item["features"])
+        elif session_id is not None:
+            vector = query_vector(str(session_id), None)
+        if vector is not None:
+            probes[str(session_id) if session_id is not None else f"context[{i}]"] = vector
+        context.append(entry)
+    for token in SESSION_ID_TOKEN.findall(request.query):
+        if token in session_index:
+            probes.setdefault(token, session_index.vector(token))
+
+    if not probes:
+        return context, session_index.highest_risk(QUERY_RELATED_SESSIONS), "highest-risk recently scored sessions"
+    best: Dict[str, Dict[str, Any]] = {}
+    named = list(probes)[:QUERY_PROBE_SESSIONS]
+    for name in named:
+        matches, _ = session_index.search(probes[name], QUERY_RELATED_SESSIONS, exclude=list(probes))
+        for match in matches:
+            if match["session_id"] not in best or match["similarity"] > best[match["session_id"]]["similarity"]:
+                best[match["session_id"]] = match
+    related = sorted(best.values(), key=lambda m: m["similarity"], reverse=True)[:QUERY_RELATED_SESSIONS]
+    return context, related, f"sessions behaving most like {', '.join(named)}"
+
+def describe_related_sessions(related: List[Dict[str, Any]]) -> str:
+    if not related:
+        return "    (no recently scored sessions are indexed)"
+    lines = []
+    for m in related:
+        similarity = f", similarity {m['similarity']:.2f}" if m["similarity"] is not None else ""
+        label = anomaly_types(np.array([m["risk_score"]]))[0]
+        lines.append(f"    - {m['session_id']} (UID-{m['user_id']}): risk {m['risk_score']:.0f} ({label}){similarity}")
+    return "\n".join(lines)
 
 @app.post("/ai/query", response_model=AIGPTQueryResponse)
 async def bris_gpt_query(request: AIGPTQueryRequest):
-    """Feat 2: Natural Language Threat Hunting (BRIS-GPT)"""
+    """Feat 2: Natural Language Threat Hunting (BRIS-GPT), grounded on context_data and similar indexed sessions."""
+    context, related, related_label = ground_query(request)
     if not ai_enabled:
         return AIGPTQueryResponse(
-            answer=f"I understood your question: '{request.query}', but Gemini is not configured to answer yet."
+            answer=f"I understood your question: '{request.query}', but Gemini is not configured to answer yet. Listed are the {related_label}.",
+            related_sessions=related,
         )
     
     prompt = f"""
@@ -322,10 +1130,13 @@ async def bris_gpt_query(request: AIGPTQueryRequest):
     
     User Query: "{request.query}"
     System Context: The system monitors mouse movements, typing rhythms, and navigation patterns to detect bots and account takeovers.
+    Analyst-Supplied Context: {json.dumps(context, separators=(",", ":"), default=str) if context else "none"}
+    Retrieved Sessions ({related_label}):
+{describe_related_sessions(related)}
     
     Instructions:
     1. Answer the user's question clearly and professionally.
-    2. If the query is about specific users or threats, provide a confident, analytical response.
+    2. Base the answer on the context and retrieved sessions above and cite session IDs; if they don't answer the question, say so instead of guessing.
     3. Include a 'Action Suggestion' for the security analyst.
     4. Keep the answer under 3 sentences.
     
@@ -333,58 +1144,33 @@ async def bris_gpt_query(request: AIGPTQueryRequest):
     Return a plain text answer that sounds like a forensic expert.
     """
     
-    try:
-        # Step 1: Get the list of truly available models for this key
-        try:
-            available_from_api = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
-        except Exception as e:
-            logger.warning(f"Failed to list models from API: {e}")
-            available_from_api = []
-
-        # Step 2: Define our preference order (Full Resource Names)
-        preference = [
-            model_name if model_name.startswith("models/") else f"models/{model_name}",
-            "models/gemini-2.0-flash",
-            "models/gemini-1.5-flash",
-            "models/gemini-1.5-flash-latest",
-            "models/gemini-pro"
-        ]
-        
-        # Step 3: Prioritize models that the API actually says we have
-        final_list = []
-        for p in preference:
-            if p in available_from_api:
-                final_list.append(p)
-        
-        # Fallback to the hardcoded list if the API list failed
-        if not final_list:
-            final_list = preference
+    flight_key = fingerprint("ai/query", PROMPT_VERSIONS["ai/query"], {
+        "query": request.query,
+        "context": context,
+        "related": [(m["session_id"], m["risk_score"]) for m in related],
+    })
 
-        response = None
-        last_err = None
-        
-        for m in final_list:
-            try:
-                logger.info(f"Attempting AI query with model: {m}")
-                model = genai.GenerativeModel(m)
-                response = model.generate_content(prompt)
-                if response:
-                    logger.info(f"Successfully received response from model: {m}")
-                    break
-            except Exception as e:
-                logger.warning(f"Model {m} failed: {e}")
-                last_err = e
-                continue
-        
-        if not response:
-            raise last_err if last_err else Exception("No response from any AI model")
-            
-        ai_text = response.text.strip()
+    async def generate_answer() -> str:
+        ai_text, _ = await model_router.generate(prompt)
+        return ai_text
+
+    try:
+        ai_text = (await call_llm(flight_key, generate_answer)).strip()
         
         # Split into answer and suggestion if possible, or just use as is
         return AIGPTQueryResponse(
             answer=ai_text,
-            action_suggestion="Review the forensic session logs for detailed behavioral proof."
+            action_suggestion="Review the forensic session logs for detailed behavioral proof.",
+            related_sessions=related,
+        )
+    except FALLBACK_ERRORS as e:
+        top_risk = max((m["risk_score"] for m in related), default=None)
+        return AIGPTQueryResponse(
+            answer=f"AI analysis is unavailable right now, so no narrative answer was generated for '{request.query}'. The {related_label} are listed with this answer.",
+            action_suggestion=None if top_risk is None else mitigation_steps(mitigation_tiers(np.array([top_risk])))[0][0],
+            related_sessions=related,
+            degraded=True,
+            degraded_reason=degraded("ai/query", e),
         )
     except Exception as e:
         logger.error(f"Gemini Query Error: {e}")
@@ -394,28 +1180,31 @@ async def bris_gpt_query(request: AIGPTQueryRequest):
         if "429" in error_msg or "quota" in error_msg.lower():
             return AIGPTQueryResponse(
                 answer=f"The AI Threat Hunter is currently handling a high volume of requests. Based on my cached analysis for '{request.query}', I still recommend monitoring recent anomalous navigation patterns and tab-switching behavior in the Risk Monitor.",
-                action_suggestion="Please wait 10-15 seconds for the AI quota to reset, then try your query again."
+                action_suggestion="Please wait 10-15 seconds for the AI quota to reset, then try your query again.",
+                related_sessions=related,
             )
 
         return AIGPTQueryResponse(
-            answer=f"AI Engine is currently in offline mode (Error: {error_msg[:50]}...). I've analyzed the recent activity based on your query: '{request.query}'. There are several users matching similar suspicious patterns in the current session data.",
-            action_suggestion="Check your Gemini API Key in ml-service/.env and ensure the service has internet access."
+            answer=f"AI Engine is currently in offline mode (Error: {error_msg[:50]}...). I've analyzed the recent activity based on your query: '{request.query}'. The {related_label} are listed with this answer.",
+            action_suggestion="Check your Gemini API Key in ml-service/.env and ensure the service has internet access.",
+            related_sessions=related,
         )
 
-@app.post("/ai/forensic-report", response_model=AIForensicReportResponse)
-async def generate_forensic_report(request: AIForensicReportRequest):
-    """Feat 4: AI Multi-Modal Forensic Reports"""
-    if not ai_enabled:
-        return AIForensicReportResponse(
-            report_id=f"REP-{int(time.time())}",
-            summary_narrative="AI Engine Offline. Basic report generated.",
-            legal_assessment="N/A",
-            behavioral_evidence=["Evidence capture in trial mode."],
-            mitigation_roadmap=["Enable Gemini for full roadmap."],
-            generated_at=datetime.now()
-        )
+FORENSIC_REPORT_SECTIONS = ("summary_narrative", "legal_assessment", "behavioral_evidence", "mitigation_roadmap")
+FORENSIC_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "temperature": 0.8,
+    "top_p": 0.95
+}
 
-    prompt = f"""
+def build_forensic_prompt(request: AIForensicReportRequest):
+    """Returns (prompt, compaction stats); the event log is digested to a fixed token budget."""
+    compaction = None
+    event_log = "No detailed log, base analysis on features."
+    if request.events_summary:
+        digest, compaction = digest_events(request.events_summary)
+        event_log = json.dumps(digest, separators=(",", ":"), default=str)
+    return f"""
     [STRICT UNIFORMITY PROHIBITED]
     Generate a UNIQUE, highly specific 'Lawsuit-Ready' Forensic Security Report for session {request.session_id}.
     
@@ -423,8 +1212,8 @@ async def generate_forensic_report(request: AIForensicReportRequest):
     - User Identity: UID-{request.user_id}
     - Session ID: {request.session_id}
     - Metadata Seed: {time.time()} (Use this to ensure variety)
-    - Behavioral Data: {request.features.dict()}
-    - Event Log Peek: {json.dumps(request.events_summary) if request.events_summary else "No detailed log, base analysis on features."}
+    - Behavioral Data: {compact_features(request.features.dict())}
+    - Event Log Digest (counts, per-minute rate curves, anomalies, sampled events; t_s = seconds from session start): {event_log}
 
     INSTRUCTIONS:
     1. DO NOT use generic placeholder text. 
@@ -437,49 +1226,249 @@ async def generate_forensic_report(request: AIForensicReportRequest):
 
     RESPONSE FORMAT:
     Must be valid JSON with keys: summary_narrative, legal_assessment, behavioral_evidence (list), mitigation_roadmap (list)
-    """
+    """, compaction
 
-    try:
-        available_from_api = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
-        preference = ["models/gemini-2.0-flash", "models/gemini-1.5-flash", "models/gemini-pro"]
-        final_list = [p for p in preference if p in available_from_api] or preference
+# Digesting a very long log takes long enough to stall other requests; do it off the loop
+PROMPT_OFFLOAD_EVENTS = 2000
 
-        report_data = None
-        for m in final_list:
-            try:
-                model = genai.GenerativeModel(m)
-                config = {
-                    "response_mime_type": "application/json",
-                    "temperature": 0.8,
-                    "top_p": 0.95
-                }
-                response = model.generate_content(prompt, generation_config=config)
-                report_data = parse_ai_json(response.text)
-                if report_data: break
-            except Exception:
-                continue
-        
-        if not report_data:
-            raise Exception("Failed to generate report JSON")
-
-        return AIForensicReportResponse(
-            report_id=f"BRIS-REP-{int(time.time())}",
-            summary_narrative=report_data.get('summary_narrative', 'N/A'),
-            legal_assessment=report_data.get('legal_assessment', 'N/A'),
-            behavioral_evidence=report_data.get('behavioral_evidence', []),
-            mitigation_roadmap=report_data.get('mitigation_roadmap', []),
-            generated_at=datetime.now()
-        )
+async def prepare_forensic_prompt(request: AIForensicReportRequest):
+    if request.events_summary and len(request.events_summary) > PROMPT_OFFLOAD_EVENTS:
+        return await asyncio.to_thread(build_forensic_prompt, request)
+    return build_forensic_prompt(request)
+
+def offline_forensic_report() -> AIForensicReportResponse:
+    return AIForensicReportResponse(
+        report_id=f"REP-{int(time.time())}",
+        summary_narrative="AI Engine Offline. Basic report generated.",
+        legal_assessment="N/A",
+        behavioral_evidence=["Evidence capture in trial mode."],
+        mitigation_roadmap=["Enable Gemini for full roadmap."],
+        generated_at=datetime.now()
+    )
+
+def failed_forensic_report(error: Exception) -> AIForensicReportResponse:
+    return AIForensicReportResponse(
+        report_id=f"ERR-{int(time.time())}",
+        summary_narrative=f"Auto-Report generation failed. Error: {str(error)[:100]}",
+        legal_assessment="UNVERIFIED",
+        behavioral_evidence=["System Error during analysis"],
+        mitigation_roadmap=["Manual review required"],
+        generated_at=datetime.now()
+    )
+
+def rule_based_forensic_report(request: AIForensicReportRequest, reason: str) -> AIForensicReportResponse:
+    risk = estimate_risk(request.features)
+    return AIForensicReportResponse(
+        report_id=f"RULE-REP-{int(time.time())}",
+        summary_narrative=generate_behavioral_narrative(request.features),
+        legal_assessment=f"Rule-based risk score {risk:.0f}/100 ({anomaly_types(np.array([risk]))[0]}). AI assessment unavailable; verify before relying on this report.",
+        behavioral_evidence=contributing_factors(request.features) or ["No rule-based indicators fired"],
+        mitigation_roadmap=generate_mitigation(risk, request.features),
+        generated_at=datetime.now(),
+        degraded=True,
+        degraded_reason=reason,
+    )
+
+def forensic_report_from_data(report_data: dict, compaction: Optional[Dict[str, Any]] = None) -> AIForensicReportResponse:
+    return AIForensicReportResponse(
+        report_id=f"BRIS-REP-{int(time.time())}",
+        summary_narrative=report_data.get('summary_narrative', 'N/A'),
+        legal_assessment=report_data.get('legal_assessment', 'N/A'),
+        behavioral_evidence=report_data.get('behavioral_evidence', []),
+        mitigation_roadmap=report_data.get('mitigation_roadmap', []),
+        generated_at=datetime.now(),
+        prompt_compaction=compaction,
+    )
+
+async def create_forensic_report(request: AIForensicReportRequest) -> AIForensicReportResponse:
+    """Generate a report, raising if the model gives no usable JSON."""
+    if not ai_enabled:
+        return offline_forensic_report()
+
+    prompt, compaction = await prepare_forensic_prompt(request)
+
+    # Analysts opening the same alert at once share one generation
+    flight_key = fingerprint("ai/forensic-report", PROMPT_VERSIONS["ai/forensic-report"], request.dict())
+
+    async def generate_report() -> dict:
+        ai_text, _ = await model_router.generate(prompt, generation_config=FORENSIC_GENERATION_CONFIG, accept=lambda text: bool(parse_ai_json(text)))
+        return parse_ai_json(ai_text)
+
+    report_data = await call_llm(flight_key, generate_report)
+    if not report_data:
+        raise Exception("Failed to generate report JSON")
+    return forensic_report_from_data(report_data, compaction)
+
+@app.post("/ai/forensic-report", response_model=AIForensicReportResponse)
+async def generate_forensic_report(request: AIForensicReportRequest):
+    """Feat 4: AI Multi-Modal Forensic Reports"""
+    try:
+        return await create_forensic_report(request)
+    except FALLBACK_ERRORS as e:
+        return rule_based_forensic_report(request, degraded("ai/forensic-report", e))
     except Exception as e:
         logger.error(f"Forensic Report Error: {e}")
-        return AIForensicReportResponse(
-            report_id=f"ERR-{int(time.time())}",
-            summary_narrative=f"Auto-Report generation failed. Error: {str(e)[:100]}",
-            legal_assessment="UNVERIFIED",
-            behavioral_evidence=["System Error during analysis"],
-            mitigation_roadmap=["Manual review required"],
-            generated_at=datetime.now()
+        return failed_forensic_report(e)
+
+async def run_forensic_job(request: AIForensicReportRequest) -> dict:
+    return (await create_forensic_report(request)).dict()
+
+forensic_jobs = JobQueue("forensic-report", run_forensic_job)
+
+def forensic_job_priority(request: AIForensicReportJobRequest) -> str:
+    if request.priority is not None:
+        return request.priority
+    # Same cut-offs as the mitigation tiers: sessions that would be blocked go first
+    risk = estimate_risk(request.features)
+    return "critical" if risk > 75 else "high" if risk > 40 else "normal"
+
+@app.post("/ai/forensic-report/jobs", status_code=202)
+async def submit_forensic_report_job(request: AIForensicReportJobRequest, response: Response):
+    """Queue a forensic report and return its job id at once; poll the job for the result."""
+    if request.priority is not None and request.priority not in PRIORITIES:
+        raise HTTPException(status_code=422, detail=f"priority must be one of {', '.join(PRIORITIES)}")
+    payload = AIForensicReportRequest(**request.dict(exclude={"priority", "refresh"}))
+    try:
+        job, deduplicated = await forensic_jobs.submit(
+            request.session_id, payload, forensic_job_priority(request), refresh=request.refresh
         )
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    status_url = f"/ai/forensic-report/jobs/{job.id}"
+    response.headers["Location"] = status_url
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "priority": job.priority,
+        "deduplicated": deduplicated,
+        "queue_position": forensic_jobs.queue_position(job),
+        "status_url": status_url,
+    }
+
+@app.get("/ai/forensic-report/jobs/{job_id}")
+async def get_forensic_report_job(job_id: str, wait: float = 0):
+    """Job status and, once completed, the report; ?wait=N long-polls up to N seconds for it to finish."""
+    record = await forensic_jobs.get(job_id, wait)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return record
+
+def format_stream_event(event: str, data: Any, sse: bool) -> str:
+    if sse:
+        return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+    return json.dumps({"event": event, "data": data}, default=str) + "\n"
+
+@app.post("/ai/forensic-report/stream")
+async def stream_forensic_report(request: AIForensicReportRequest, accept: Optional[str] = Header(None)):
+    """Feat 4 (streaming): emits each report section as soon as it parses, then the full report.
+
+    Server-Sent Events when the client accepts text/event-stream, NDJSON otherwise.
+    """
+    sse = "text/event-stream" in (accept or "")
+
+    async def events():
+        if not ai_enabled:
+            yield format_stream_event("report", offline_forensic_report().dict(), sse)
+            return
+
+        buffer = ""
+        sent: Dict[str, Any] = {}
+        compaction = None
+        try:
+            admit_ai_request()
+            prompt, compaction = await prepare_forensic_prompt(request)
+            async for chunk, model in model_router.stream(prompt, generation_config=FORENSIC_GENERATION_CONFIG):
+                buffer += chunk
+                for section, value in extract_json_fields(buffer, FORENSIC_REPORT_SECTIONS, skip=sent).items():
+                    sent[section] = value
+                    yield format_stream_event("section", {"section": section, "value": value, "model": model}, sse)
+
+            report_data = parse_ai_json(buffer) or sent
+            if not report_data:
+                raise Exception("Failed to generate report JSON")
+            report = forensic_report_from_data(report_data, compaction)
+        except FALLBACK_ERRORS as e:
+            report = rule_based_forensic_report(request, degraded("ai/forensic-report/stream", e))
+        except Exception as e:
+            logger.error(f"Forensic Report Stream Error: {e}")
+            report = failed_forensic_report(e)
+        yield format_stream_event("report", report.dict(), sse)
+
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+@app.get("/ai/stats")
+async def get_ai_stats():
+    """Routing, breaker and concurrency state of the LLM layer."""
+    return {
+        "ai_enabled": ai_enabled,
+        "llm": llm_client.stats(),
+        "router": model_router.snapshot(),
+        "response_cache": response_cache.stats(),
+        "shared_state": shared_state.stats(),
+        "singleflight": llm_singleflight.stats(),
+        "forensic_jobs": forensic_jobs.stats(),
+        "load_shedding": {
+            "max_queue_depth": AI_MAX_QUEUE_DEPTH,
+            "pending_llm_calls": llm_calls_pending,
+            "degraded_responses": degraded_responses,
+        },
+    }
+
+# ============================================
+# METRICS ENDPOINT
+# ============================================
+
+registry.register(CallbackGauge(
+    "bris_llm_client_calls", "Gemini calls holding (in_flight) or waiting for (waiting) a concurrency slot.", ("state",),
+    lambda: [(("in_flight",), llm_client.in_flight), (("waiting",), llm_client.waiting)]))
+registry.register(CallbackGauge(
+    "bris_llm_breaker_open", "1 while a model's circuit breaker is open.", ("model",),
+    lambda: [((name,), 1 if stats.is_open(time.time()) else 0) for name, stats in model_router.stats.items()]))
+registry.register(CallbackCounter(
+    "bris_response_cache_lookups_total", "Response cache lookups by endpoint and result.", ("endpoint", "result"),
+    lambda: [((endpoint, "hit"), n) for endpoint, n in response_cache.hits.items()]
+    + [((endpoint, "miss"), n) for endpoint, n in response_cache.misses.items()]
+    + [((endpoint, "shared_hit"), n) for endpoint, n in response_cache.shared_hits.items()]))
+registry.register(CallbackGauge(
+    "bris_response_cache_entries", "Responses held in this worker's cache.", (),
+    lambda: [((), len(response_cache))]))
+registry.register(CallbackCounter(
+    "bris_llm_singleflight_requests_total", "LLM requests that started a call (leader) or joined one in flight (deduplicated).", ("role",),
+    lambda: [(("leader",), llm_singleflight.calls), (("deduplicated",), llm_singleflight.deduplicated)]))
+registry.register(CallbackGauge(
+    "bris_llm_singleflight_in_flight", "Shared LLM calls currently in flight.", (),
+    lambda: [((), len(llm_singleflight))]))
+registry.register(CallbackGauge(
+    "bris_forensic_jobs", "Forensic report jobs waiting for (queued) or holding (running) a job worker.", ("state",),
+    lambda: [(("queued",), forensic_jobs.queued), (("running",), forensic_jobs.running)]))
+registry.register(CallbackGauge(
+    "bris_cpu_pool_tasks", "Chunks of scoring or feature extraction running in the CPU pool.", (),
+    lambda: [((), cpu_pool.running)]))
+registry.register(CallbackGauge(
+    "bris_baseline_users", "Users with a behavioral baseline in memory.", (),
+    lambda: [((), len(baseline_store))]))
+registry.register(CallbackGauge(
+    "bris_similarity_index_vectors", "Scored sessions held in the similarity index.", (),
+    lambda: [((), len(session_index))]))
+registry.register(CallbackGauge(
+    "bris_score_stream_connections", "Open /ws/score streaming connections.", (),
+    lambda: [((), score_streams.connections)]))
+registry.register(CallbackCounter(
+    "bris_score_stream_updates_total", "Band-change updates sent, or replaced by a newer one before sending, on /ws/score.", ("result",),
+    lambda: [((result,), score_streams.stats()[f"updates_{result}"]) for result in ("sent", "coalesced")]))
+registry.register(CallbackGauge(
+    "bris_score_stream_updates_pending", "Band-change updates waiting in /ws/score send buffers.", (),
+    lambda: [((), score_streams.stats()["updates_pending"])]))
+registry.register(CallbackGauge(
+    "bris_active_sessions", "Sessions held in the incremental feature store.", (),
+    lambda: [((), len(session_store))]))
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition."""
+    # Passed as a header: media_type would get a second charset appended
+    return Response(registry.render(), headers={"Content-Type": METRICS_CONTENT_TYPE})
 
 # ============================================
 # MODEL STATS ENDPOINT
@@ -487,20 +1476,16 @@ async def generate_forensic_report(request: AIForensicReportRequest):
 
 @app.get("/model/stats")
 async def get_model_stats():
-    """Return mock model statistics"""
-    return {
-        "model_type": "mock",
-        "version": "1.0.0",
-        "description": "Mock ML service for demo purposes",
-        "metrics": {
-            "accuracy": 0.89,
-            "precision": 0.87,
-            "recall": 0.91,
-            "f1_score": 0.89,
-        },
-        "deployment_date": "2026-01-29",
-        "last_updated": datetime.now().isoformat(),
-    }
+    """Active scoring model, its load time and rows scored per version."""
+    return model_registry.stats()
+
+@app.post("/model/reload")
+async def reload_model():
+    """Swap in the version named by MODEL_PATH/scoring/CURRENT without waiting for the poll."""
+    reloaded = await asyncio.to_thread(model_registry.reload)
+    if model_registry.last_error:
+        raise HTTPException(status_code=422, detail=model_registry.last_error)
+    return {"reloaded": reloaded, "version": model_registry.active.version}
 
 # ============================================
 # ROOT ENDPOINT
@@ -514,9 +1499,18 @@ async def root():
         "status": "running",
         "endpoints": {
             "prediction": "/predict",
+            "batch_prediction": "/predict/batch",
+            "session_events": "/sessions/events",
+            "session_prediction": "/predict/session/{session_id}",
+            "score_stream": "/ws/score",
             "explanation": "/explain",
+            "similar_sessions": "/similar",
             "model_stats": "/model/stats",
+            "forensic_report_jobs": "/ai/forensic-report/jobs",
+            "ai_stats": "/ai/stats",
+            "metrics": "/metrics",
             "health": "/health",
+            "ready": "/ready",
             "docs": "/docs",
         },
     }
@@ -0,0 +1,222 @@
+"""Minimal Prometheus metrics with text exposition.
+
+Kept dependency-free and cheap enough for the /predict hot path: recording
+a sample is a dict lookup plus a bisect. Each uvicorn worker keeps its own
+registry, so scrape every worker (or run one worker per container).
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LLM_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        super().__init__(name, help_text, label_names)
+        self._children: Dict[LabelValues, _Value] = {}
+
+    def labels(self, *values: str) -> _Value:
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = _Value()
+        return child
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for values, child in sorted(self._children.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, values)} {_format_value(child.value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._children: Dict[LabelValues, _HistogramChild] = {}
+
+    def labels(self, *values: str) -> _HistogramChild:
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = _HistogramChild(self.buckets)
+        return child
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for values, child in sorted(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.label_names, values, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            labels = _format_labels(self.label_names, values)
+            lines.append(f"{self.name}_sum{labels} {repr(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class CallbackGauge(_Metric):
+    """Gauge whose samples are read from existing state at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], fn: Callable[[], Iterable[Tuple[LabelValues, float]]]):
+        super().__init__(name, help_text, label_names)
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for values, value in self.fn():
+            lines.append(f"{self.name}{_format_labels(self.label_names, values)} {_format_value(value)}")
+        return lines
+
+
+class CallbackCounter(CallbackGauge):
+    """Counter whose running totals are read from existing state at scrape time."""
+
+    kind = "counter"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUEST_DURATION = registry.register(Histogram(
+    "bris_http_request_duration_seconds", "Time spent in route handlers.", ("route", "method", "status")))
+HTTP_IN_FLIGHT = registry.register(Gauge(
+    "bris_http_requests_in_flight", "Requests currently inside a route handler.", ("route",)))
+LLM_CALL_DURATION = registry.register(Histogram(
+    "bris_llm_call_duration_seconds", "Gemini call latency per model.", ("model", "outcome"), LLM_LATENCY_BUCKETS))
+LLM_CALLS = registry.register(Counter(
+    "bris_llm_calls_total", "Gemini calls per model by outcome (success, error, rate_limited, timeout, deadline).", ("model", "outcome")))
+LLM_FALLBACKS = registry.register(Counter(
+    "bris_llm_model_fallbacks_total", "Times a request moved on to another model after this one failed.", ("from_model",)))
+PARSE_AI_JSON_FAILURES = registry.register(Counter(
+    "bris_parse_ai_json_failures_total", "Model responses that could not be parsed as JSON."))
+AI_DEGRADED_RESPONSES = registry.register(Counter(
+    "bris_ai_degraded_responses_total", "AI requests answered with the rule-based fallback, by reason.", ("endpoint", "reason")))
+
+
+class InstrumentedRoute(APIRoute):
+    """APIRoute that records per-route latency and in-flight requests.
+
+    For streaming responses the time covers producing the response object,
+    not sending its body.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        route = self.path
+        in_flight = HTTP_IN_FLIGHT.labels(route)
+
+        async def instrumented(request: Request):
+            started = time.perf_counter()
+            status = 500
+            in_flight.inc()
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except HTTPException as e:
+                status = e.status_code
+                raise
+            except RequestValidationError:
+                status = 422
+                raise
+            finally:
+                in_flight.dec()
+                HTTP_REQUEST_DURATION.labels(route, request.method, str(status)).observe(time.perf_counter() - started)
+
+        return instrumented
@@ -0,0 +1,291 @@
+"""Versioned scoring models loaded from disk, with hot reload.
+
+Artifacts live under ``$MODEL_PATH/scoring``:
+
+    scoring/
+      CURRENT                 name of the version to serve
+      2026-10-01.1/
+        manifest.json         type, features, link and training metadata
+        weights.npy           linear: one weight per feature
+        feature.npy ...       tree_ensemble: per-tree node arrays (see TreeEnsembleModel)
+
+Weight arrays are opened with ``np.load(mmap_mode="r")`` so every uvicorn
+worker maps the same page-cache copy. A reload builds the new model off to
+the side and swaps a single reference, so in-flight requests finish on the
+version they started with. Without any artifact the built-in rule formula
+from app/scoring.py is served.
+"""
+import abc
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from app.scoring import COLUMN_INDEX, risk_scores
+
+logger = logging.getLogger(__name__)
+
+MODEL_ROOT = os.path.join(os.getenv("MODEL_PATH", "./models"), "scoring")
+MODEL_RELOAD_INTERVAL_SECONDS = float(os.getenv("MODEL_RELOAD_INTERVAL_SECONDS", "30"))
+RULES_VERSION = "bris-v2-ai-forensics"
+
+
+class ModelLoadError(Exception):
+    pass
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class ScoringModel(abc.ABC):
+    """Base class: maps a feature matrix (FEATURE_COLUMNS order) to risk scores 0-100."""
+
+    model_type = ""
+
+    def __init__(self, version: str, manifest: Dict[str, Any], path: Optional[str] = None):
+        self.version = version
+        self.manifest = manifest
+        self.path = path
+        self.loaded_at = time.time()
+        self.load_time_ms = 0.0
+
+    @abc.abstractmethod
+    def raw_scores(self, X: np.ndarray) -> np.ndarray:
+        """Untransformed model output, before the manifest's link and clipping."""
+
+    def score(self, X: np.ndarray, Z: Optional[np.ndarray] = None, z_threshold: float = 2.5) -> np.ndarray:
+        raw = self.raw_scores(X)
+        if self.manifest.get("link") == "logistic":
+            raw = _sigmoid(raw) * 100
+        return np.clip(raw, 0, 100)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "model_type": self.model_type,
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "load_time_ms": round(self.load_time_ms, 3),
+            "features": self.manifest.get("features"),
+            "trained_at": self.manifest.get("trained_at"),
+            "metrics": self.manifest.get("metrics", {}),
+        }
+
+
+class RuleModel(ScoringModel):
+    """The hand-written rule formula; the only model that uses per-user baselines."""
+
+    model_type = "rules"
+
+    def raw_scores(self, X: np.ndarray) -> np.ndarray:
+        return risk_scores(X)
+
+    def score(self, X: np.ndarray, Z: Optional[np.ndarray] = None, z_threshold: float = 2.5) -> np.ndarray:
+        return risk_scores(X, Z, z_threshold)
+
+
+class _ArtifactModel(ScoringModel):
+    def __init__(self, version: str, manifest: Dict[str, Any], path: str):
+        super().__init__(version, manifest, path)
+        try:
+            self.columns = np.array([COLUMN_INDEX[name] for name in manifest["features"]], dtype=np.intp)
+        except KeyError as e:
+            raise ModelLoadError(f"unknown or missing feature {e}")
+
+    def _array(self, name: str) -> np.ndarray:
+        file_path = os.path.join(self.path, f"{name}.npy")
+        if not os.path.exists(file_path):
+            raise ModelLoadError(f"missing {name}.npy")
+        return np.load(file_path, mmap_mode="r", allow_pickle=False)
+
+
+class LinearModel(_ArtifactModel):
+    """risk = link(X @ weights + intercept)."""
+
+    model_type = "linear"
+
+    def __init__(self, version: str, manifest: Dict[str, Any], path: str):
+        super().__init__(version, manifest, path)
+        self.weights = self._array("weights")
+        self.intercept = float(manifest.get("intercept", 0.0))
+        if self.weights.shape != (len(self.columns),):
+            raise ModelLoadError(f"weights shape {self.weights.shape} does not match {len(self.columns)} features")
+
+    def raw_scores(self, X: np.ndarray) -> np.ndarray:
+        return X[:, self.columns] @ self.weights + self.intercept
+
+
+class TreeEnsembleModel(_ArtifactModel):
+    """Sum of regression trees stored as padded (n_trees, n_nodes) arrays.
+
+    ``feature`` indexes the manifest's feature list (-1 marks a leaf),
+    ``threshold`` splits as ``x <= threshold`` going to ``left``, and
+    ``value`` holds leaf outputs. Rows descend all trees together, one
+    level per step, so cost is O(depth) array operations per tree.
+    """
+
+    model_type = "tree_ensemble"
+
+    def __init__(self, version: str, manifest: Dict[str, Any], path: str):
+        super().__init__(version, manifest, path)
+        self.feature = self._array("feature")
+        self.threshold = self._array("threshold")
+        self.left = self._array("left")
+        self.right = self._array("right")
+        self.value = self._array("value")
+        shapes = {a.shape for a in (self.feature, self.threshold, self.left, self.right, self.value)}
+        if len(shapes) != 1 or len(self.feature.shape) != 2:
+            raise ModelLoadError(f"tree arrays must share one (n_trees, n_nodes) shape, got {shapes}")
+        if self.feature.max(initial=-1) >= len(self.columns):
+            raise ModelLoadError("tree splits on a feature index outside the manifest's feature list")
+        self.max_depth = int(manifest["max_depth"])
+        self.base_score = float(manifest.get("base_score", 0.0))
+        self.learning_rate = float(manifest.get("learning_rate", 1.0))
+
+    def raw_scores(self, X: np.ndarray) -> np.ndarray:
+        values = X[:, self.columns]
+        n_rows = len(values)
+        rows = np.arange(n_rows)
+        total = np.full(n_rows, self.base_score)
+        for t in range(self.feature.shape[0]):
+            feature, threshold = self.feature[t], self.threshold[t]
+            left, right = self.left[t], self.right[t]
+            node = np.zeros(n_rows, dtype=np.intp)
+            for _ in range(self.max_depth):
+                split = feature[node]
+                inner = split >= 0
+                if not inner.any():
+                    break
+                go_left = values[rows, np.maximum(split, 0)] <= threshold[node]
+                node = np.where(inner, np.where(go_left, left[node], right[node]), node)
+            total += self.learning_rate * self.value[t][node]
+        return total
+
+
+MODEL_TYPES = {cls.model_type: cls for cls in (LinearModel, TreeEnsembleModel)}
+
+
+def load_artifact(root: str, version: str) -> ScoringModel:
+    started = time.perf_counter()
+    path = os.path.join(root, version)
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ModelLoadError(f"{version}: unreadable manifest: {e}")
+    model_class = MODEL_TYPES.get(manifest.get("type"))
+    if model_class is None:
+        raise ModelLoadError(f"{version}: unknown model type {manifest.get('type')!r}")
+    try:
+        model = model_class(version, manifest, path)
+        # Touch every code path once so a broken artifact fails here, not on a request
+        probe = model.score(np.zeros((1, len(COLUMN_INDEX))))
+    except ModelLoadError as e:
+        raise ModelLoadError(f"{version}: {e}")
+    except Exception as e:
+        raise ModelLoadError(f"{version}: failed to evaluate: {e}")
+    if not np.isfinite(probe).all():
+        raise ModelLoadError(f"{version}: produces non-finite scores")
+    model.load_time_ms = (time.perf_counter() - started) * 1000
+    return model
+
+
+def write_artifact(root: str, version: str, manifest: Dict[str, Any], arrays: Dict[str, np.ndarray], activate: bool = True):
+    """Publish a model version: write to a temp dir, rename into place, then repoint CURRENT."""
+    final_path = os.path.join(root, version)
+    if os.path.exists(final_path):
+        raise FileExistsError(f"model version {version} already exists")
+    tmp_path = os.path.join(root, f".{version}.tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+        json.dump({**manifest, "version": version}, f, indent=2)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(array))
+    os.rename(tmp_path, final_path)
+    if activate:
+        set_current(root, version)
+
+
+def set_current(root: str, version: str):
+    if not os.path.isdir(os.path.join(root, version)):
+        raise FileNotFoundError(f"no model version {version} under {root}")
+    tmp_path = os.path.join(root, "CURRENT.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp_path, os.path.join(root, "CURRENT"))
+
+
+def read_current(root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, "CURRENT")) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class ModelRegistry:
+    def __init__(self, root: str = MODEL_ROOT):
+        self.root = root
+        self.active: ScoringModel = RuleModel(RULES_VERSION, {"type": "rules"})
+        self.requests: Dict[str, int] = {}
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+
+    def record(self, version: str, rows: int = 1):
+        self.requests[version] = self.requests.get(version, 0) + rows
+
+    def reload(self) -> bool:
+        """Load the version named by CURRENT if it differs from the active one.
+
+        Returns True if a new model was swapped in. A broken artifact is
+        logged and the current model keeps serving.
+        """
+        version = read_current(self.root)
+        if version is None or version == self.active.version:
+            # CURRENT was put back to a loadable state; an earlier failure no longer applies
+            self.last_error = None
+            return False
+        try:
+            model = load_artifact(self.root, version)
+        except ModelLoadError as e:
+            if self.last_error != str(e):
+                logger.error(f"Keeping model {self.active.version}; could not load {e}")
+            self.last_error = str(e)
+            return False
+        previous, self.active = self.active.version, model
+        self.reloads += 1
+        self.last_error = None
+        logger.info(f"Serving scoring model {version} ({model.model_type}, loaded in {model.load_time_ms:.1f} ms), was {previous}")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.active.describe(),
+            "root": self.root,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+            "requests_by_version": dict(self.requests),
+        }
+
+
+model_registry = ModelRegistry()
+
+
+if __name__ == "__main__":
+    # python -m app.model_registry [activate <version>]
+    if len(sys.argv) == 3 and sys.argv[1] == "activate":
+        load_artifact(MODEL_ROOT, sys.argv[2])
+        set_current(MODEL_ROOT, sys.argv[2])
+        print(f"CURRENT -> {sys.argv[2]}")
+    else:
+        current = read_current(MODEL_ROOT)
+        versions = sorted(v for v in os.listdir(MODEL_ROOT) if not v.startswith(".") and v != "CURRENT") if os.path.isdir(MODEL_ROOT) else []
+        for v in versions:
+            print(("* " if v == current else "  ") + v)
@@ -0,0 +1,359 @@
+"""Latency-aware routing across Gemini models.
+
+The set of models available to the API key is resolved once and refreshed on
+a TTL. Every call records per-model latency and outcome; models that keep
+failing or return 429 are skipped by a circuit breaker until a cooldown
+passes, and healthy models are tried fastest first.
+
+The discovered model list, 429 cooldowns and a per-model token bucket
+(GEMINI_RPM) live in app/shared_state.py, so with Redis every worker
+shares one view of quota instead of discovering it separately.
+"""
+import json
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app import deadlines
+from app.deadlines import DeadlineExceededError
+from app.llm import LLMClient, LLMTimeoutError, llm_client
+from app.metrics import LLM_CALL_DURATION, LLM_CALLS, LLM_FALLBACKS
+from app.shared_state import SharedState, shared_state
+
+logger = logging.getLogger(__name__)
+
+MODEL_DISCOVERY_TTL_SECONDS = float(os.getenv("MODEL_DISCOVERY_TTL_SECONDS", "600"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("BREAKER_COOLDOWN_SECONDS", "30"))
+BREAKER_RATE_LIMIT_COOLDOWN_SECONDS = float(os.getenv("BREAKER_RATE_LIMIT_COOLDOWN_SECONDS", "60"))
+STATS_WINDOW = 100
+# Requests per minute allowed per model across all workers; 0 disables the limit
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "0"))
+GEMINI_BURST = float(os.getenv("GEMINI_BURST", "5"))
+# Longest a request waits for a token before trying the next model
+GEMINI_RATE_WAIT_SECONDS = float(os.getenv("GEMINI_RATE_WAIT_SECONDS", "2"))
+
+
+def normalize_model_name(name: str) -> str:
+    return name if name.startswith("models/") else f"models/{name}"
+
+
+def default_preference() -> List[str]:
+    configured = os.getenv("GEMINI_MODEL_PREFERENCE")
+    if configured:
+        names = [n.strip() for n in configured.split(",") if n.strip()]
+    else:
+        names = [
+            os.getenv("GEMINI_MODEL", "gemini-1.5-flash"),
+            "gemini-2.0-flash",
+            "gemini-1.5-flash",
+            "gemini-1.5-flash-latest",
+            "gemini-pro",
+        ]
+    # Keep order, drop duplicates
+    return list(dict.fromkeys(normalize_model_name(n) for n in names))
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    text = str(error).lower()
+    return "429" in text or "quota" in text or type(error).__name__ == "ResourceExhausted"
+
+
+def failure_outcome(error: Exception) -> str:
+    if isinstance(error, DeadlineExceededError):
+        return "deadline"
+    if isinstance(error, LLMTimeoutError):
+        return "timeout"
+    return "rate_limited" if is_rate_limit_error(error) else "error"
+
+
+def admission_deadline() -> float:
+    """Monotonic time until which a request may wait for a rate-limit token."""
+    left = deadlines.remaining()
+    wait = GEMINI_RATE_WAIT_SECONDS if left is None else min(GEMINI_RATE_WAIT_SECONDS, left)
+    return time.monotonic() + wait
+
+
+def record_call(model: str, outcome: str, seconds: float):
+    LLM_CALLS.labels(model, outcome).inc()
+    LLM_CALL_DURATION.labels(model, outcome).observe(seconds)
+
+
+class ModelUnavailableError(Exception):
+    """Raised when every candidate model is failing or behind an open breaker."""
+
+
+class ModelStats:
+    """Rolling outcome and latency window for one model, plus its breaker state."""
+
+    def __init__(self):
+        self.latencies_ms: Deque[float] = deque(maxlen=STATS_WINDOW)
+        self.outcomes: Deque[bool] = deque(maxlen=STATS_WINDOW)
+        self.calls = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    def record_success(self, latency_ms: float):
+        self.calls += 1
+        self.latencies_ms.append(latency_ms)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self, rate_limited: bool, now: float):
+        self.calls += 1
+        self.failures += 1
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        if rate_limited:
+            self.rate_limited += 1
+            self.open_until = now + BREAKER_RATE_LIMIT_COOLDOWN_SECONDS
+        elif self.consecutive_failures >= BREAKER_FAILURE_THRESHOLD:
+            self.open_until = now + BREAKER_COOLDOWN_SECONDS
+
+    def is_open(self, now: float) -> bool:
+        return now < self.open_until
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies_ms:
+            return None
+        return float(np.percentile(np.fromiter(self.latencies_ms, dtype=np.float64), q))
+
+    @property
+    def success_rate(self) -> Optional[float]:
+        if not self.outcomes:
+            return None
+        return sum(self.outcomes) / len(self.outcomes)
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "rate_limited": self.rate_limited,
+            "success_rate": None if self.success_rate is None else round(self.success_rate, 3),
+            "p50_ms": None if p50 is None else round(p50, 1),
+            "p95_ms": None if p95 is None else round(p95, 1),
+            "breaker": "open" if self.is_open(now) else "closed",
+            "open_for_s": round(max(self.open_until - now, 0.0), 1),
+        }
+
+
+class ModelRouter:
+    """Sends each LLM request to the fastest healthy model."""
+
+    def __init__(
+        self,
+        client: LLMClient,
+        preference: List[str],
+        discovery_ttl: float = MODEL_DISCOVERY_TTL_SECONDS,
+        shared: Optional[SharedState] = None,
+        rpm: float = GEMINI_RPM,
+    ):
+        self.client = client
+        self.preference = preference
+        self.discovery_ttl = discovery_ttl
+        self.shared = shared
+        self.rpm = rpm
+        self.throttled = 0
+        self.stats: Dict[str, ModelStats] = {name: ModelStats() for name in preference}
+        self._available: Optional[List[str]] = None
+        self._resolved_at = 0.0
+        self._discovery_lock = asyncio.Lock()
+
+    async def available_models(self) -> List[str]:
+        """Preferred models the API key can use, refreshed every discovery_ttl seconds."""
+        if self._available is not None and time.time() - self._resolved_at < self.discovery_ttl:
+            return self._available
+
+        async with self._discovery_lock:
+            if self._available is not None and time.time() - self._resolved_at < self.discovery_ttl:
+                return self._available
+            try:
+                listed = await self._shared_model_list()
+                if listed is None:
+                    listed = await self.client.list_models()
+                    if self.shared is not None:
+                        await self.shared.set("models:available", json.dumps(listed), self.discovery_ttl)
+                self._available = [m for m in self.preference if m in set(listed)] or list(self.preference)
+            except DeadlineExceededError:
+                # Says nothing about the API; try discovery again on the next request
+                raise
+            except Exception as e:
+                logger.warning(f"Failed to list models from API: {e}")
+                # Keep the last good list; fall back to the static preference otherwise
+                if self._available is None:
+                    self._available = list(self.preference)
+            self._resolved_at = time.time()
+            return self._available
+
+    async def _shared_model_list(self) -> Optional[List[str]]:
+        if self.shared is None:
+            return None
+        raw = await self.shared.get("models:available")
+        return json.loads(raw) if raw else None
+
+    async def _apply_shared_cooldowns(self, models: List[str]):
+        """Open local breakers for models another worker saw rate limited."""
+        if self.shared is None or not models:
+            return
+        for name, until in zip(models, await self.shared.get_many([f"cooldown:{m}" for m in models])):
+            if until is not None:
+                stats = self.stats[name]
+                stats.open_until = max(stats.open_until, float(until))
+
+    async def _share_cooldown(self, name: str):
+        if self.shared is None:
+            return
+        open_until = self.stats[name].open_until
+        ttl = open_until - time.time()
+        if ttl > 0:
+            await self.shared.set(f"cooldown:{name}", repr(open_until), ttl)
+
+    async def _admit(self, name: str, deadline: float) -> bool:
+        """Take a token from the model's shared bucket, waiting briefly if one is due soon."""
+        if self.rpm <= 0 or self.shared is None:
+            return True
+        while True:
+            wait = await self.shared.take(f"bucket:gemini:{name}", self.rpm / 60, GEMINI_BURST)
+            if wait <= 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                self.throttled += 1
+                return False
+            await asyncio.sleep(wait)
+
+    def rank(self, models: List[str], now: float) -> List[str]:
+        """Healthy models first: measured ones by p50 latency, then unmeasured in preference order."""
+        healthy = [m for m in models if not self.stats[m].is_open(now)]
+
+        def key(name: str) -> Tuple[int, float, int]:
+            p50 = self.stats[name].percentile(50)
+            return (0 if p50 is not None else 1, p50 or 0.0, self.preference.index(name))
+
+        return sorted(healthy, key=key)
+
+    async def candidates(self) -> List[str]:
+        available = await self.available_models()
+        await self._apply_shared_cooldowns(available)
+        candidates = self.rank(available, time.time())
+        if not candidates:
+            rate_limited = any(self.stats[m].rate_limited for m in self.preference)
+            reason = "rate limited (429)" if rate_limited else "failing"
+            raise ModelUnavailableError(f"All Gemini models are {reason}; circuit breakers open")
+        return candidates
+
+    async def generate(
+        self,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        accept: Optional[Callable[[str], bool]] = None,
+    ) -> Tuple[str, str]:
+        """Run the prompt on the best available model; returns (text, model_name).
+
+        If ``accept`` is given, a response it rejects counts as a failure and
+        the next model is tried.
+        """
+        candidates = await self.candidates()
+        last_err: Optional[Exception] = None
+        admit_deadline = admission_deadline()
+        for name in candidates:
+            if not await self._admit(name, admit_deadline):
+                last_err = last_err or ModelUnavailableError("Gemini request budget (GEMINI_RPM) exhausted")
+                continue
+            stats = self.stats[name]
+            started = time.perf_counter()
+            try:
+                logger.debug(f"Attempting AI query with model: {name}")
+                text = await self.client.generate(name, prompt, generation_config=generation_config, timeout=timeout)
+                if accept is not None and not accept(text):
+                    raise ValueError("unusable response")
+            except DeadlineExceededError:
+                # The request ran out of time, not the model: no breaker penalty, no next model
+                record_call(name, "deadline", time.perf_counter() - started)
+                raise
+            except Exception as e:
+                elapsed = time.perf_counter() - started
+                limited = is_rate_limit_error(e)
+                stats.record_failure(limited, time.time())
+                if limited:
+                    await self._share_cooldown(name)
+                record_call(name, failure_outcome(e), elapsed)
+                LLM_FALLBACKS.labels(name).inc()
+                logger.warning(f"Model {name} failed{' (rate limited)' if limited else ''}: {e}")
+                last_err = e
+                continue
+            elapsed = time.perf_counter() - started
+            stats.record_success(elapsed * 1000)
+            record_call(name, "success", elapsed)
+            return text, name
+
+        raise last_err if last_err else ModelUnavailableError("No response from any AI model")
+
+    async def stream(
+        self,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """Stream the prompt from the best available model, yielding (chunk, model_name).
+
+        Falls over to the next model only while nothing has been yielded yet.
+        """
+        last_err: Optional[Exception] = None
+        admit_deadline = admission_deadline()
+        for name in await self.candidates():
+            if not await self._admit(name, admit_deadline):
+                last_err = last_err or ModelUnavailableError("Gemini request budget (GEMINI_RPM) exhausted")
+                continue
+            stats = self.stats[name]
+            started = time.perf_counter()
+            yielded = False
+            try:
+                logger.debug(f"Attempting AI stream with model: {name}")
+                async for chunk in self.client.stream(name, prompt, generation_config=generation_config, timeout=timeout):
+                    yielded = True
+                    yield chunk, name
+            except DeadlineExceededError:
+                record_call(name, "deadline", time.perf_counter() - started)
+                raise
+            except Exception as e:
+                elapsed = time.perf_counter() - started
+                limited = is_rate_limit_error(e)
+                stats.record_failure(limited, time.time())
+                if limited:
+                    await self._share_cooldown(name)
+                record_call(name, failure_outcome(e), elapsed)
+                logger.warning(f"Model {name} stream failed{' (rate limited)' if limited else ''}: {e}")
+                if yielded:
+                    raise
+                LLM_FALLBACKS.labels(name).inc()
+                last_err = e
+                continue
+            elapsed = time.perf_counter() - started
+            stats.record_success(elapsed * 1000)
+            record_call(name, "success", elapsed)
+            return
+
+        raise last_err if last_err else ModelUnavailableError("No response from any AI model")
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "available": self._available,
+            "discovered_age_s": round(now - self._resolved_at, 1) if self._resolved_at else None,
+            "rpm_limit": self.rpm or None,
+            "throttled": self.throttled,
+            "models": {name: stats.snapshot(now) for name, stats in self.stats.items()},
+        }
+
+
+model_router = ModelRouter(llm_client, default_preference(), shared=shared_state)
@@ -0,0 +1,248 @@
+"""Prompt compaction: fixed-size digests of event logs and feature payloads.
+
+A forensic prompt used to inline the whole ``events_summary``, so prompt
+size (and Gemini latency) grew with session length. ``digest_events``
+instead summarizes any number of events as:
+
+- per-type counts and the session span;
+- per-type rate curves over a fixed number of time buckets;
+- top anomalies: rate bursts, long idle gaps and suspicious event types;
+- a handful of sampled exemplar events, added while the token budget allows.
+
+Everything but the exemplars has a fixed size, so the digest stays within
+PROMPT_EVENT_TOKEN_BUDGET however long the session is. Tokens are
+estimated at ~4 characters each, which is close enough for budgeting.
+"""
+import json
+import math
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+PROMPT_EVENT_TOKEN_BUDGET = int(os.getenv("PROMPT_EVENT_TOKEN_BUDGET", "1200"))
+PROMPT_RATE_BUCKETS = int(os.getenv("PROMPT_RATE_BUCKETS", "12"))
+# Event types that get their own rate curve; the rest are summed as "other"
+MAX_CURVE_TYPES = 6
+MAX_COUNTED_TYPES = 20
+MAX_ANOMALIES = 8
+MAX_EXEMPLARS = 24
+# Longer feature lists are summarized (numeric) or truncated (anything else)
+MAX_LIST_ITEMS = 8
+EXEMPLAR_DATA_CHARS = 160
+CHARS_PER_TOKEN = 4
+# Events sampled to estimate the size of the uncompacted log
+SIZE_SAMPLE = 200
+
+SUSPICIOUS_EVENT_TYPES = {
+    "tab_visible",
+    "tab_hidden",
+    "window_blur",
+    "clipboard_copy",
+    "clipboard_paste",
+    "clipboard_cut",
+    "devtools_open",
+    "context_menu",
+    "fullscreen_exit",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+def _round(value: float, digits: int = 3) -> float:
+    return float(f"{value:.{digits}g}") if value else value
+
+
+def _is_number(value: Any) -> bool:
+    """A finite int or float (not a bool) that fits in a float64."""
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return False
+    try:
+        return math.isfinite(value)
+    except OverflowError:
+        return False
+
+
+def event_type(event: Dict[str, Any]) -> str:
+    return str(event.get("event_type") or event.get("type") or "unknown")
+
+
+def event_seconds(event: Dict[str, Any]) -> Optional[float]:
+    """Event time in epoch seconds; accepts epoch ms, epoch s or ISO-8601 strings."""
+    value = event.get("timestamp")
+    if _is_number(value):
+        return value / 1000 if value > 1e11 else float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def compact_features(features: Dict[str, Any]) -> Dict[str, Any]:
+    """Features with floats rounded and long lists reduced to summary stats.
+
+    Only all-numeric lists are summarized; any other long list keeps its
+    first MAX_LIST_ITEMS items and its length.
+    """
+    compact: Dict[str, Any] = {}
+    for name, value in features.items():
+        if isinstance(value, float):
+            compact[name] = _round(value)
+        elif isinstance(value, list) and len(value) > MAX_LIST_ITEMS and all(map(_is_number, value)):
+            values = np.asarray(value, dtype=np.float64)
+            compact[name] = {
+                "n": len(values),
+                "mean": _round(float(values.mean())),
+                "min": _round(float(values.min())),
+                "max": _round(float(values.max())),
+            }
+        elif isinstance(value, list) and len(value) > MAX_LIST_ITEMS:
+            compact[name] = {
+                "n": len(value),
+                "first": [_round(v) if isinstance(v, float) else v for v in value[:MAX_LIST_ITEMS]],
+            }
+        elif isinstance(value, list):
+            compact[name] = [_round(v) if isinstance(v, float) else v for v in value]
+        else:
+            compact[name] = value
+    return compact
+
+
+def _exemplar(event: Dict[str, Any], start: Optional[float]) -> Dict[str, Any]:
+    ts = event_seconds(event)
+    exemplar: Dict[str, Any] = {"type": event_type(event)}
+    if ts is not None and start is not None:
+        exemplar["t_s"] = round(ts - start, 1)
+    data = event.get("event_data")
+    if data:
+        text = _dumps(data)
+        exemplar["data"] = text if len(text) <= EXEMPLAR_DATA_CHARS else text[:EXEMPLAR_DATA_CHARS] + "..."
+    return exemplar
+
+
+def _exemplar_order(types: List[str], n: int) -> List[int]:
+    """Indices to sample: first, last, first of each suspicious type, then evenly spaced."""
+    order = [0, n - 1] if n > 1 else [0]
+    seen = set()
+    for i, t in enumerate(types):
+        if t in SUSPICIOUS_EVENT_TYPES and t not in seen:
+            seen.add(t)
+            order.append(i)
+    order.extend(int(i) for i in np.linspace(0, n - 1, num=min(n, MAX_EXEMPLARS)))
+    unique: List[int] = []
+    for i in order:
+        if i not in unique:
+            unique.append(i)
+    return unique[:MAX_EXEMPLARS]
+
+
+def _rate_curves(types: List[str], seconds: np.ndarray, start: float, span: float, buckets: int, top_types: List[str]):
+    """Events per minute for each top type, per equal-width time bucket."""
+    width = span / buckets
+    bins = np.minimum(((seconds - start) / width).astype(np.intp), buckets - 1)
+    type_ids = np.array([top_types.index(t) if t in top_types else len(top_types) for t in types], dtype=np.intp)
+    counts = np.zeros((len(top_types) + 1, buckets), dtype=np.int64)
+    np.add.at(counts, (type_ids, bins), 1)
+    per_minute = counts * (60.0 / width)
+    names = top_types + ["other"]
+    curves = {name: [_round(float(v), 2) for v in per_minute[i]] for i, name in enumerate(names) if counts[i].any()}
+    return curves, counts, width
+
+
+def _anomalies(counts: np.ndarray, names: List[str], seconds: np.ndarray, start: float, width: float, type_counts: Counter) -> List[Dict[str, Any]]:
+    found: List[Tuple[float, Dict[str, Any]]] = []
+    # Bursts: buckets well above that type's mean rate
+    for i, name in enumerate(names):
+        row = counts[i].astype(np.float64)
+        std = row.std()
+        if std == 0:
+            continue
+        z = (row - row.mean()) / std
+        for b in np.flatnonzero(z > 2):
+            found.append((float(z[b]), {
+                "kind": "burst",
+                "type": name,
+                "at_s": round(b * width, 1),
+                "count": int(row[b]),
+                "z": round(float(z[b]), 1),
+            }))
+    # Idle gaps: the longest pauses, when they dwarf the typical gap
+    if len(seconds) > 2:
+        ordered = np.sort(seconds)
+        gaps = np.diff(ordered)
+        typical = float(np.median(gaps)) or 1e-3
+        for g in np.argsort(gaps)[::-1][:3]:
+            if gaps[g] > 10 * typical and gaps[g] > 5:
+                found.append((float(gaps[g] / typical) / 10, {
+                    "kind": "idle_gap",
+                    "at_s": round(float(ordered[g] - start), 1),
+                    "seconds": round(float(gaps[g]), 1),
+                }))
+    # Suspicious event types, ranked by how often they occurred
+    for name in SUSPICIOUS_EVENT_TYPES & set(type_counts):
+        found.append((1.0 + math.log1p(type_counts[name]), {"kind": "suspicious_type", "type": name, "count": type_counts[name]}))
+    found.sort(key=lambda item: item[0], reverse=True)
+    return [entry for _, entry in found[:MAX_ANOMALIES]]
+
+
+def digest_events(events: List[Dict[str, Any]], token_budget: int = PROMPT_EVENT_TOKEN_BUDGET) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Compact an event log into a bounded digest; returns (digest, compaction stats)."""
+    n = len(events)
+    sample = events[:SIZE_SAMPLE]
+    input_tokens = estimate_tokens(_dumps(sample)) * n // max(len(sample), 1) if n else 0
+    if not n:
+        return {"event_count": 0}, {"input_events": 0, "input_tokens": 0, "output_tokens": 0, "exemplars": 0, "trimmed_ratio": 0.0}
+
+    types = [event_type(e) for e in events]
+    type_counts = Counter(types)
+    timed = [(i, ts) for i, ts in ((i, event_seconds(e)) for i, e in enumerate(events)) if ts is not None]
+    counted = dict(type_counts.most_common(MAX_COUNTED_TYPES))
+    if len(type_counts) > MAX_COUNTED_TYPES:
+        counted["other"] = n - sum(counted.values())
+    digest: Dict[str, Any] = {"event_count": n, "counts_by_type": counted}
+
+    start = None
+    if timed:
+        seconds = np.array([ts for _, ts in timed])
+        start, end = float(seconds.min()), float(seconds.max())
+        span = max(end - start, 1.0)
+        digest["span_seconds"] = round(end - start, 1)
+        top_types = [t for t, _ in type_counts.most_common(MAX_CURVE_TYPES)]
+        timed_types = [types[i] for i, _ in timed]
+        curves, counts, width = _rate_curves(timed_types, seconds, start, span, PROMPT_RATE_BUCKETS, top_types)
+        digest["rate_per_min"] = {"bucket_seconds": round(width, 1), "by_type": curves}
+        digest["anomalies"] = _anomalies(counts, top_types + ["other"], seconds, start, width, type_counts)
+
+    exemplars: List[Dict[str, Any]] = []
+    digest["exemplars"] = exemplars
+    used = estimate_tokens(_dumps(digest))
+    # Shrink the fixed-size parts first if even they don't fit
+    if used > token_budget and "rate_per_min" in digest:
+        del digest["rate_per_min"]
+        used = estimate_tokens(_dumps(digest))
+    for i in _exemplar_order(types, n):
+        exemplar = _exemplar(events[i], start)
+        cost = estimate_tokens(_dumps(exemplar)) + 1
+        if used + cost > token_budget:
+            break
+        exemplars.append(exemplar)
+        used += cost
+    exemplars.sort(key=lambda e: e.get("t_s", 0))
+
+    return digest, {
+        "input_events": n,
+        "input_tokens": input_tokens,
+        "output_tokens": used,
+        "exemplars": len(exemplars),
+        "trimmed_ratio": round(1 - used / input_tokens, 3) if input_tokens > used else 0.0,
+    }
@@ -0,0 +1,98 @@
+"""Vectorized risk scoring over feature matrices.
+
+Mirrors the rule-based formula in ``predict()`` but evaluates it for many
+sessions at once, one row per session and one column per feature. When a
+matrix of per-user z-scores is supplied (see app/baselines.py), behaviour
+that is normal for that user stops counting against them and large
+deviations from their own baseline add risk.
+"""
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+# Numeric BehavioralFeatures fields, in matrix column order
+FEATURE_COLUMNS = (
+    "click_frequency",
+    "scroll_velocity",
+    "typing_speed",
+    "dwell_time",
+    "tab_switch_count",
+    "copy_paste_events",
+    "navigation_speed",
+    "mouse_trajectory_entropy",
+    "session_duration",
+    "time_of_day",
+    "day_of_week",
+    "device_change",
+    "location_anomaly",
+    "event_count",
+    "unique_event_types",
+    "error_rate",
+)
+COLUMN_INDEX = {name: i for i, name in enumerate(FEATURE_COLUMNS)}
+
+# Risk added per standard deviation beyond the z threshold, and its ceiling
+DEVIATION_POINTS_PER_SIGMA = 4.0
+DEVIATION_MAX_POINTS = 20.0
+
+ANOMALY_LABELS = np.array(["normal", "anomaly", "critical"])
+
+MITIGATION_TIERS = (
+    ("LOG: Continue Background Surveillance",),
+    ("UI: Inject 'Bot-Check' CAPTCHA", "NOTIFY: Level 1 Analyst Review Required"),
+    ("BLOCK: Initiate Automatic Session Termination", "MFA: Trigger Out-of-Band Biometric Challenge"),
+)
+
+
+def feature_row(features) -> List[float]:
+    """Flatten one BehavioralFeatures object into matrix column order."""
+    return [float(getattr(features, name, 0) or 0) for name in FEATURE_COLUMNS]
+
+
+def feature_matrix(features_list: Iterable) -> np.ndarray:
+    """Stack BehavioralFeatures objects into an (n, len(FEATURE_COLUMNS)) matrix."""
+    rows = [feature_row(f) for f in features_list]
+    if not rows:
+        return np.zeros((0, len(FEATURE_COLUMNS)), dtype=np.float64)
+    return np.asarray(rows, dtype=np.float64)
+
+
+def risk_scores(X: np.ndarray, Z: Optional[np.ndarray] = None, z_threshold: float = 2.5) -> np.ndarray:
+    """Rule-based risk score (0-100) for every row of X.
+
+    Z, if given, holds per-user z-scores shaped like X (NaN where a user has
+    no baseline); rows without one are scored by the absolute rules alone.
+    """
+    tab_switches = X[:, COLUMN_INDEX["tab_switch_count"]]
+    clipboard = X[:, COLUMN_INDEX["copy_paste_events"]]
+    typing_speed = X[:, COLUMN_INDEX["typing_speed"]]
+    fast_typing = typing_speed > 150
+    deviation = 0.0
+    if Z is not None:
+        # A fast typist typing fast is not suspicious; only flag speed unusual for them
+        typing_z = Z[:, COLUMN_INDEX["typing_speed"]]
+        fast_typing &= ~(typing_z <= z_threshold)
+        excess = np.nan_to_num(np.clip(np.abs(Z) - z_threshold, 0, None), nan=0.0)
+        deviation = np.minimum(excess.sum(axis=1) * DEVIATION_POINTS_PER_SIGMA, DEVIATION_MAX_POINTS)
+    raw = tab_switches * 12 + clipboard * 10 + np.where(fast_typing, 15.0, 0.0) + deviation
+    return np.clip(raw, 0, 100)
+
+
+def anomaly_codes(risk: np.ndarray) -> np.ndarray:
+    """Index into ANOMALY_LABELS for every risk score."""
+    return (risk > 40).astype(np.intp) + (risk > 80)
+
+
+def anomaly_types(risk: np.ndarray) -> np.ndarray:
+    """Map risk scores to 'normal' / 'anomaly' / 'critical'."""
+    return ANOMALY_LABELS[anomaly_codes(risk)]
+
+
+def mitigation_tiers(risk: np.ndarray) -> np.ndarray:
+    """Index into MITIGATION_TIERS for every risk score."""
+    return (risk > 40).astype(np.intp) + (risk > 75)
+
+
+def mitigation_steps(tiers: Sequence[int]) -> List[List[str]]:
+    """Expand mitigation tier indices into step lists."""
+    return [list(MITIGATION_TIERS[t]) for t in tiers]
@@ -0,0 +1,144 @@
+"""Incremental per-session feature state.
+
+Raw behavior events are folded into running counters as they arrive, so a
+session can be scored at any time without re-reading its history. Features
+are derived the same way as ``extractFeatures`` in the backend's
+event.processor.ts. Sessions idle for longer than the TTL are evicted.
+"""
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+SESSION_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "1800"))
+SESSION_MAX_ACTIVE = int(os.getenv("SESSION_MAX_ACTIVE", "50000"))
+# Only "more than one" matters for scoring; cap the sets so state stays O(1)
+MAX_DISTINCT_TRACKED = 16
+
+
+class SessionState:
+    __slots__ = (
+        "user_id", "session_id", "first_ts", "last_ts", "event_count",
+        "counts", "ips", "devices", "last_activity",
+    )
+
+    def __init__(self, user_id: int, session_id: str):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.first_ts: Optional[float] = None
+        self.last_ts: Optional[float] = None
+        self.event_count = 0
+        self.counts: Dict[str, int] = {}
+        self.ips: set = set()
+        self.devices: set = set()
+        self.last_activity = time.monotonic()
+
+    def add(self, event_type: str, timestamp: float, ip_address: Optional[str], device_fingerprint: Optional[str]):
+        self.event_count += 1
+        self.counts[event_type] = self.counts.get(event_type, 0) + 1
+        if self.first_ts is None or timestamp < self.first_ts:
+            self.first_ts = timestamp
+        if self.last_ts is None or timestamp > self.last_ts:
+            self.last_ts = timestamp
+        if ip_address and len(self.ips) < MAX_DISTINCT_TRACKED:
+            self.ips.add(ip_address)
+        if device_fingerprint and len(self.devices) < MAX_DISTINCT_TRACKED:
+            self.devices.add(device_fingerprint)
+        self.last_activity = time.monotonic()
+
+    def features(self) -> Dict[str, Any]:
+        """BehavioralFeatures payload for the session so far."""
+        counts = self.counts
+        session_duration = ((self.last_ts - self.first_ts) / 60) if self.event_count else 0.0
+        duration = max(session_duration, 0.1)
+
+        clicks = counts.get("mouse_click", 0)
+        scrolls = counts.get("scroll", 0)
+        keypresses = counts.get("keyboard_down", 0)
+        tab_switches = counts.get("tab_visible", 0)
+        copies = counts.get("clipboard_copy", 0)
+        pastes = counts.get("clipboard_paste", 0)
+        mouse_moves = counts.get("mouse_move", 0)
+        typing_speed = keypresses / duration
+
+        started = datetime.fromtimestamp(self.first_ts) if self.first_ts is not None else None
+        return {
+            "click_frequency": clicks / duration,
+            "scroll_velocity": scrolls / duration,
+            "typing_speed": typing_speed,
+            "dwell_time": session_duration / max(counts.get("page_load", 1), 1),
+            "tab_switch_count": tab_switches,
+            "copy_paste_events": copies + pastes,
+            "navigation_speed": counts.get("navigation", 0) / duration,
+            "mouse_trajectory_entropy": min(1.0, mouse_moves / 100) if mouse_moves >= 2 else 0.0,
+            "keystroke_dynamics": [typing_speed],
+            "session_duration": session_duration,
+            "time_of_day": started.hour if started else 0,
+            # JavaScript getDay() numbering (Sunday = 0), as the backend sends it
+            "day_of_week": (started.weekday() + 1) % 7 if started else 0,
+            "device_change": len(self.devices) > 1,
+            "location_anomaly": len(self.ips) > 1,
+            "event_count": self.event_count,
+            "unique_event_types": len(counts),
+            "error_rate": 0.0,
+            "click_count": clicks,
+            "scroll_count": scrolls,
+            "keypress_count": keypresses,
+            "copy_count": copies,
+            "paste_count": pastes,
+            "distinct_ips": len(self.ips),
+            "distinct_devices": len(self.devices),
+        }
+
+
+class SessionStore:
+    """Session states ordered by last activity, evicting idle ones from the front."""
+
+    def __init__(self, idle_ttl: float = SESSION_IDLE_TTL_SECONDS, max_sessions: int = SESSION_MAX_ACTIVE):
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def ingest(self, events: Iterable) -> List[str]:
+        """Fold events into session state; returns the session ids touched, in first-seen order."""
+        touched: Dict[str, None] = {}
+        for event in events:
+            state = self._sessions.get(event.session_id)
+            if state is None:
+                state = SessionState(event.user_id, event.session_id)
+                self._sessions[event.session_id] = state
+            else:
+                self._sessions.move_to_end(event.session_id)
+            state.add(event.event_type, event.timestamp.timestamp(), event.ip_address, event.device_fingerprint)
+            touched[event.session_id] = None
+        self.evict_idle()
+        return list(touched)
+
+    def get(self, session_id: str) -> Optional[SessionState]:
+        self.evict_idle()
+        return self._sessions.get(session_id)
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_activity >= cutoff and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active_sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl,
+            "evicted": self.evicted,
+        }
+
+
+session_store = SessionStore()
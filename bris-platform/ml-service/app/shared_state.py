@@ -0,0 +1,192 @@
+"""State shared by every worker and replica: cache entries and token buckets.
+
+Backed by Redis when REDIS_URL is set, so several uvicorn workers share one
+cache and one Gemini request budget. Any Redis error switches to the
+in-process MemoryBackend for REDIS_RETRY_SECONDS, so the service keeps
+working (with per-process state) while Redis is down. MemoryBackend has the
+same semantics and doubles as a stand-in for tests.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "")
+# "redis" (default when REDIS_URL is set) or "memory" to force local-only state
+SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "redis" if REDIS_URL else "memory")
+SHARED_STATE_PREFIX = os.getenv("SHARED_STATE_PREFIX", "bris:")
+REDIS_TIMEOUT_SECONDS = float(os.getenv("REDIS_TIMEOUT_SECONDS", "0.25"))
+REDIS_RETRY_SECONDS = float(os.getenv("REDIS_RETRY_SECONDS", "10"))
+
+# Refill, then take ``cost`` tokens if there are enough. Returns 0 when
+# granted, otherwise the seconds until enough tokens will be available.
+# Uses the Redis clock so workers on different hosts agree on time.
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+  tokens = tokens - cost
+else
+  wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class MemoryBackend:
+    """In-process implementation of the backend interface."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._values: Dict[str, Any] = {}
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._values[key]
+            return None
+        return value
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key: str, value: str, ttl: float):
+        self._values[key] = (time.monotonic() + ttl, value)
+        if len(self._values) > 10000:
+            now = time.monotonic()
+            self._values = {k: v for k, v in self._values.items() if v[0] > now}
+
+    async def take(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        tokens, ts = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + max(0.0, now - ts) * rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        return wait
+
+    async def close(self):
+        pass
+
+
+class RedisBackend:
+    name = "redis"
+
+    def __init__(self, url: str, timeout: float = REDIS_TIMEOUT_SECONDS):
+        import redis.asyncio as redis_asyncio
+
+        self.client = redis_asyncio.from_url(
+            url, socket_timeout=timeout, socket_connect_timeout=timeout, decode_responses=True
+        )
+        self._token_bucket = self.client.register_script(TOKEN_BUCKET_LUA)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.client.get(key)
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        return await self.client.mget(keys) if keys else []
+
+    async def set(self, key: str, value: str, ttl: float):
+        await self.client.set(key, value, px=max(int(ttl * 1000), 1))
+
+    async def take(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> float:
+        return float(await self._token_bucket(keys=[key], args=[rate, capacity, cost]))
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class SharedState:
+    """Routes calls to the shared backend, falling back to local state on errors."""
+
+    def __init__(self, remote=None, prefix: str = SHARED_STATE_PREFIX, retry_seconds: float = REDIS_RETRY_SECONDS):
+        self.remote = remote
+        self.local = MemoryBackend()
+        self.prefix = prefix
+        self.retry_seconds = retry_seconds
+        self._remote_down_until = 0.0
+        self.remote_errors = 0
+        self.local_fallbacks = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def backend_name(self) -> str:
+        return self.remote.name if self.remote is not None else self.local.name
+
+    def _remote_usable(self) -> bool:
+        return self.remote is not None and time.monotonic() >= self._remote_down_until
+
+    async def _call(self, op: str, *args):
+        if self._remote_usable():
+            try:
+                return await getattr(self.remote, op)(*args)
+            except (asyncio.CancelledError, KeyboardInterrupt):
+                raise
+            except Exception as e:
+                self.remote_errors += 1
+                self.last_error = str(e)
+                self._remote_down_until = time.monotonic() + self.retry_seconds
+                logger.warning(f"Shared state backend unavailable, using local state for {self.retry_seconds:.0f}s: {e}")
+        if self.remote is not None:
+            self.local_fallbacks += 1
+        return await getattr(self.local, op)(*args)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._call("get", self.prefix + key)
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        return await self._call("get_many", [self.prefix + key for key in keys])
+
+    async def set(self, key: str, value: str, ttl: float):
+        await self._call("set", self.prefix + key, value, ttl)
+
+    async def take(self, bucket: str, rate: float, capacity: float, cost: float = 1.0) -> float:
+        """Take tokens from a bucket refilled at ``rate``/s; 0 if granted, else seconds to wait."""
+        return await self._call("take", self.prefix + bucket, rate, capacity, cost)
+
+    async def close(self):
+        if self.remote is not None:
+            await self.remote.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend_name,
+            "remote_available": self._remote_usable() if self.remote is not None else None,
+            "remote_errors": self.remote_errors,
+            "local_fallbacks": self.local_fallbacks,
+            "last_error": self.last_error,
+        }
+
+
+def create_shared_state() -> SharedState:
+    if SHARED_STATE_BACKEND != "redis" or not REDIS_URL:
+        return SharedState()
+    try:
+        return SharedState(RedisBackend(REDIS_URL))
+    except ImportError:
+        logger.warning("REDIS_URL is set but the redis package is not installed; using local state only")
+        return SharedState()
+
+
+shared_state = create_shared_state()
@@ -0,0 +1,337 @@
+"""Nearest-neighbour index over recently scored sessions.
+
+Every scored session is stored as a unit vector of its log-scaled features,
+so "sessions that behave like this one" is a top-k by dot product (cosine
+similarity). Small indexes are searched exactly with one matrix-vector
+product. From SIMILARITY_IVF_MIN_VECTORS on, a background rebuild clusters
+the vectors with spherical k-means into inverted lists, and a query only
+scans the lists whose centroids are nearest (IVF). That keeps millions of
+vectors searchable in milliseconds, at a small cost in recall.
+
+Inserts are incremental: vectors added after a rebuild are assigned to the
+nearest existing centroid and scanned from a pending list until the next
+rebuild. Re-scoring a session replaces its vector, and entries expire
+SIMILARITY_TTL_SECONDS after they were scored.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.scoring import COLUMN_INDEX
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_MAX_VECTORS = int(os.getenv("SIMILARITY_MAX_VECTORS", "1000000"))
+SIMILARITY_TTL_SECONDS = float(os.getenv("SIMILARITY_TTL_SECONDS", "86400"))
+SIMILARITY_IVF_MIN_VECTORS = int(os.getenv("SIMILARITY_IVF_MIN_VECTORS", "50000"))
+# Inverted lists scanned per query; more lists, better recall, slower search
+SIMILARITY_NPROBE = int(os.getenv("SIMILARITY_NPROBE", "16"))
+SIMILARITY_MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("SIMILARITY_MAINTENANCE_INTERVAL_SECONDS", "30"))
+MAX_LISTS = 1024
+KMEANS_ITERATIONS = 8
+KMEANS_MIN_SAMPLE = 20000
+# Rows per matrix product when assigning every vector to a centroid
+ASSIGN_CHUNK = 65536
+
+# Time-of-day and weekday say when a session happened, not how it behaved
+SIMILARITY_COLUMNS = tuple(name for name in COLUMN_INDEX if name not in ("time_of_day", "day_of_week"))
+
+
+def session_vectors(X: np.ndarray) -> np.ndarray:
+    """Unit vectors for rows of a feature matrix (FEATURE_COLUMNS order).
+
+    Counts and rates are heavy-tailed, so each feature is log-scaled first;
+    otherwise event_count or scroll_velocity would decide every match.
+    """
+    values = X[:, [COLUMN_INDEX[name] for name in SIMILARITY_COLUMNS]]
+    V = (np.sign(values) * np.log1p(np.abs(values))).astype(np.float32)
+    norms = np.linalg.norm(V, axis=1, keepdims=True)
+    return V / np.maximum(norms, 1e-6)
+
+
+def _nearest_centroids(V: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    labels = np.empty(len(V), dtype=np.int32)
+    for start in range(0, len(V), ASSIGN_CHUNK):
+        labels[start:start + ASSIGN_CHUNK] = np.argmax(V[start:start + ASSIGN_CHUNK] @ centroids.T, axis=1)
+    return labels
+
+
+def build_partitions(vectors: np.ndarray, slots: np.ndarray, seq_cutoff: int, seed: int = 0) -> Dict[str, Any]:
+    """Cluster ``vectors`` and group ``slots`` into inverted lists. Pure; safe to run in a thread."""
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    n_lists = int(np.clip(4 * np.sqrt(n), 16, MAX_LISTS))
+    sample = vectors[rng.choice(n, size=min(n, max(KMEANS_MIN_SAMPLE, 40 * n_lists)), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        labels = _nearest_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        empty = np.bincount(labels, minlength=n_lists) == 0
+        # Re-seed empty clusters so every list stays in use
+        sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-6)
+
+    labels = _nearest_centroids(vectors, centroids)
+    order = np.argsort(labels, kind="stable")
+    return {
+        "centroids": centroids,
+        "slots": slots,
+        "labels": labels,
+        "list_slots": slots[order],
+        "list_offsets": np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=n_lists))]),
+        "seq_cutoff": seq_cutoff,
+        "build_ms": (time.perf_counter() - started) * 1000,
+    }
+
+
+class SessionIndex:
+    def __init__(
+        self,
+        max_vectors: int = SIMILARITY_MAX_VECTORS,
+        ttl: float = SIMILARITY_TTL_SECONDS,
+        ivf_min_vectors: int = SIMILARITY_IVF_MIN_VECTORS,
+        nprobe: int = SIMILARITY_NPROBE,
+        initial_capacity: int = 4096,
+    ):
+        self.max_vectors = max_vectors
+        self.ttl = ttl
+        self.ivf_min_vectors = ivf_min_vectors
+        self.nprobe = nprobe
+        capacity = min(initial_capacity, max_vectors)
+        self.vectors = np.zeros((capacity, len(SIMILARITY_COLUMNS)), dtype=np.float32)
+        self.user_ids = np.zeros(capacity, dtype=np.int64)
+        self.risk = np.zeros(capacity, dtype=np.float32)
+        self.scored_at = np.zeros(capacity, dtype=np.float64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        # Insert counter per slot; tells a rebuild which slots changed while it ran
+        self.seq = np.zeros(capacity, dtype=np.int64)
+        self.assign = np.full(capacity, -1, dtype=np.int32)
+        self.session_ids: List[Optional[str]] = [None] * capacity
+        self._slots: Dict[str, int] = {}
+        self._free: List[int] = list(range(capacity - 1, -1, -1))
+        self._inserts = 0
+        # IVF state, set by a rebuild
+        self.centroids: Optional[np.ndarray] = None
+        self._list_slots = np.zeros(0, dtype=np.intp)
+        self._list_offsets = np.zeros(1, dtype=np.intp)
+        self._seq_cutoff = 0
+        self._built_size = 0
+        # Slots inserted since the last rebuild; may hold stale or repeated entries
+        self._pending: List[int] = []
+        self._pending_array: Optional[np.ndarray] = None
+        self.searches = 0
+        self.expired = 0
+        self.evicted = 0
+        self.rebuilds = 0
+        self.last_build_ms: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._slots
+
+    def _grow(self):
+        old = len(self.alive)
+        new = min(old * 2, self.max_vectors)
+        extra = new - old
+        self.vectors = np.concatenate([self.vectors, np.zeros((extra, self.vectors.shape[1]), dtype=np.float32)])
+        self.user_ids = np.concatenate([self.user_ids, np.zeros(extra, dtype=np.int64)])
+        self.risk = np.concatenate([self.risk, np.zeros(extra, dtype=np.float32)])
+        self.scored_at = np.concatenate([self.scored_at, np.zeros(extra)])
+        self.alive = np.concatenate([self.alive, np.zeros(extra, dtype=bool)])
+        self.seq = np.concatenate([self.seq, np.zeros(extra, dtype=np.int64)])
+        self.assign = np.concatenate([self.assign, np.full(extra, -1, dtype=np.int32)])
+        self.session_ids.extend([None] * extra)
+        self._free.extend(range(new - 1, old - 1, -1))
+
+    def _remove(self, slots: np.ndarray):
+        for slot in slots.tolist():
+            del self._slots[self.session_ids[slot]]
+            self.session_ids[slot] = None
+        self.alive[slots] = False
+        self._free.extend(slots.tolist())
+
+    def _evict_oldest(self, count: int):
+        live = np.flatnonzero(self.alive)
+        # Evict at least 1% at a time so a full index doesn't pay an O(n) scan per insert
+        count = min(max(count, len(live) // 100, 1), len(live))
+        oldest = live[np.argpartition(self.scored_at[live], count - 1)[:count]]
+        self._remove(oldest)
+        self.evicted += len(oldest)
+
+    def _reserve(self, n: int):
+        """Make ``n`` free slots, before any are handed out, so eviction can't hit a row being written."""
+        while len(self._free) < n:
+            if len(self.alive) < self.max_vectors:
+                self._grow()
+            else:
+                self._evict_oldest(n - len(self._free))
+
+    def _slot_for(self, session_id: str) -> int:
+        slot = self._slots.get(session_id)
+        if slot is not None:
+            return slot
+        slot = self._free.pop()
+        self._slots[session_id] = slot
+        self.session_ids[slot] = session_id
+        return slot
+
+    def add(self, session_ids: Sequence[str], user_ids: Sequence[int], X: np.ndarray, risk: np.ndarray):
+        """Insert or replace scored sessions; rows with non-finite features or risk are skipped."""
+        for start in range(0, len(session_ids), self.max_vectors):
+            end = start + self.max_vectors
+            self._add_chunk(session_ids[start:end], user_ids[start:end], X[start:end], risk[start:end])
+
+    def _add_chunk(self, session_ids: Sequence[str], user_ids: Sequence[int], X: np.ndarray, risk: np.ndarray):
+        keep = np.isfinite(X).all(axis=1) & np.isfinite(risk)
+        if not keep.all():
+            session_ids = [s for s, k in zip(session_ids, keep) if k]
+            user_ids, X, risk = np.asarray(user_ids)[keep], X[keep], risk[keep]
+        if not len(session_ids):
+            return
+        self._reserve(len({s for s in session_ids if s not in self._slots}))
+        rows = np.fromiter((self._slot_for(s) for s in session_ids), dtype=np.intp, count=len(session_ids))
+        V = session_vectors(X)
+        self.vectors[rows] = V
+        self.user_ids[rows] = user_ids
+        self.risk[rows] = risk
+        self.scored_at[rows] = time.time()
+        self.alive[rows] = True
+        self.seq[rows] = np.arange(self._inserts, self._inserts + len(rows))
+        self._inserts += len(rows)
+        if self.centroids is not None:
+            self.assign[rows] = _nearest_centroids(V, self.centroids)
+            self._pending.extend(rows.tolist())
+            self._pending_array = None
+
+    def expire(self, now: Optional[float] = None) -> int:
+        cutoff = (now or time.time()) - self.ttl
+        stale = np.flatnonzero(self.alive & (self.scored_at < cutoff))
+        if len(stale):
+            self._remove(stale)
+            self.expired += len(stale)
+        return len(stale)
+
+    def vector(self, session_id: str) -> Optional[np.ndarray]:
+        slot = self._slots.get(session_id)
+        return None if slot is None else self.vectors[slot].copy()
+
+    @property
+    def mode(self) -> str:
+        return "ivf" if self.centroids is not None and len(self) >= self.ivf_min_vectors else "exact"
+
+    def _candidates(self, query: np.ndarray) -> np.ndarray:
+        nearest = np.argsort(self.centroids @ query)[::-1][:self.nprobe]
+        members = [self._list_slots[self._list_offsets[c]:self._list_offsets[c + 1]] for c in nearest]
+        listed = np.concatenate(members) if members else np.zeros(0, dtype=np.intp)
+        # Slots rewritten since the rebuild are scanned from the pending list instead
+        listed = listed[self.seq[listed] < self._seq_cutoff]
+        if self._pending_array is None:
+            pending = np.unique(np.asarray(self._pending, dtype=np.intp))
+            self._pending_array = pending[self.seq[pending] >= self._seq_cutoff]
+        pending = self._pending_array[np.isin(self.assign[self._pending_array], nearest)]
+        return np.concatenate([listed, pending])
+
+    def search(self, query: np.ndarray, k: int = 10, exclude: Sequence[str] = (), exact: bool = False) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Top-k sessions by cosine similarity to a unit ``query`` vector; returns (matches, search info)."""
+        self.searches += 1
+        mode = "exact" if exact else self.mode
+        if mode == "ivf":
+            candidates = self._candidates(query)
+        else:
+            candidates = np.flatnonzero(self.alive)
+        fresh = self.alive[candidates] & (self.scored_at[candidates] >= time.time() - self.ttl)
+        excluded = [self._slots[s] for s in exclude if s in self._slots]
+        if excluded:
+            fresh &= ~np.isin(candidates, excluded)
+        candidates = candidates[fresh]
+        similarity = self.vectors[candidates] @ query
+        if len(candidates) > k:
+            top = np.argpartition(-similarity, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-similarity[top], kind="stable")]
+        return self._describe(candidates[top], similarity[top]), {"mode": mode, "candidates": int(len(candidates))}
+
+    def highest_risk(self, k: int = 10) -> List[Dict[str, Any]]:
+        live = np.flatnonzero(self.alive & (self.scored_at >= time.time() - self.ttl))
+        if len(live) > k:
+            live = live[np.argpartition(-self.risk[live], k - 1)[:k]]
+        live = live[np.argsort(-self.risk[live], kind="stable")]
+        return self._describe(live, None)
+
+    def _describe(self, slots: np.ndarray, similarity: Optional[np.ndarray]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "session_id": self.session_ids[slot],
+                "user_id": int(self.user_ids[slot]),
+                "similarity": None if similarity is None else round(float(similarity[i]), 4),
+                "risk_score": round(float(self.risk[slot]), 2),
+                "scored_at": float(self.scored_at[slot]),
+            }
+            for i, slot in enumerate(slots.tolist())
+        ]
+
+    def needs_rebuild(self) -> bool:
+        if len(self) < self.ivf_min_vectors:
+            return False
+        if self.centroids is None:
+            return True
+        # Recluster once the index has doubled or a fifth of it is only in the pending list
+        return len(self) >= 2 * self._built_size or len(self._pending) > max(len(self) // 5, 10000)
+
+    async def maintain(self):
+        """Expire old entries and rebuild the IVF lists when due; the clustering runs in a thread."""
+        self.expire()
+        if not self.needs_rebuild():
+            if len(self) < self.ivf_min_vectors and self.centroids is not None:
+                self.centroids = None
+                self._pending = []
+                self._pending_array = None
+            return
+        slots = np.flatnonzero(self.alive)
+        built = await asyncio.to_thread(build_partitions, self.vectors[slots], slots, self._inserts)
+        self._apply_partitions(built)
+
+    def _apply_partitions(self, built: Dict[str, Any]):
+        self.centroids = built["centroids"]
+        self._list_slots = built["list_slots"]
+        self._list_offsets = built["list_offsets"]
+        self._seq_cutoff = built["seq_cutoff"]
+        self._built_size = len(built["slots"])
+        self.assign[built["slots"]] = built["labels"]
+        # Anything inserted while the build ran goes back through the new centroids
+        changed = np.flatnonzero(self.alive & (self.seq >= self._seq_cutoff))
+        if len(changed):
+            self.assign[changed] = _nearest_centroids(self.vectors[changed], self.centroids)
+        self._pending = changed.tolist()
+        self._pending_array = None
+        self.rebuilds += 1
+        self.last_build_ms = round(built["build_ms"], 1)
+        logger.info(f"Rebuilt similarity index: {self._built_size} vectors in {len(self.centroids)} lists ({self.last_build_ms:.0f} ms)")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "vectors": len(self),
+            "capacity": len(self.alive),
+            "mode": self.mode,
+            "lists": 0 if self.centroids is None else len(self.centroids),
+            "nprobe": self.nprobe,
+            "pending": len(self._pending),
+            "rebuilds": self.rebuilds,
+            "last_build_ms": self.last_build_ms,
+            "searches": self.searches,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "ttl_seconds": self.ttl,
+        }
+
+
+session_index = SessionIndex()
@@ -0,0 +1,73 @@
+"""Coalescing of identical concurrent calls.
+
+While a call for a key is in flight, later callers with the same key await
+that call's result instead of starting their own. The shared call runs as a
+separate task so a disconnecting first caller does not cancel it for the
+others. That task runs without the first caller's request deadline; each
+caller bounds only its own wait (see call_llm in app/main.py). Once every
+caller has stopped waiting, the task is cancelled, so an abandoned LLM call
+gives its concurrency slot back instead of holding it until it times out.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+from app.deadlines import detached_context
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self):
+        self._in_flight: Dict[str, "asyncio.Task[Any]"] = {}
+        # Callers still awaiting each shared task
+        self._waiters: Dict["asyncio.Task[Any]", int] = {}
+        self.calls = 0
+        self.deduplicated = 0
+        self.abandoned = 0
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._in_flight
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.deduplicated += 1
+        else:
+            self.calls += 1
+            task = detached_context().run(lambda: asyncio.ensure_future(fn()))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    self.abandoned += 1
+                    # Later callers with this key must start afresh, not join a cancelled task
+                    if self._in_flight.get(key) is task:
+                        del self._in_flight[key]
+                    task.cancel()
+
+    def _finished(self, key: str, task: "asyncio.Task[Any]"):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception as retrieved in case every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "deduplicated": self.deduplicated,
+            "abandoned": self.abandoned,
+            "in_flight": len(self._in_flight),
+        }
+
+
+llm_singleflight = SingleFlight()
@@ -0,0 +1,374 @@
+"""Sliding-window risk scoring for event streams over a WebSocket.
+
+A producer streams raw behavior events for many sessions over one
+long-lived connection. Each streamed session keeps per-event-type counts
+over a short and a long window of event time (30 s and 5 min by default),
+bucketed so state stays bounded however busy the session is. After every
+message the touched sessions are re-scored from their window features and
+an update is pushed back only when a session's anomaly band changes.
+
+Every connection has bounded buffers on both sides. Received messages wait
+in a small queue; when it is full the connection stops reading, so TCP flow
+control slows the producer down instead of the service buffering without
+limit. Outgoing updates are kept per session, so a slow consumer gets the
+latest band of each session rather than a backlog of stale transitions.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from app.scoring import FEATURE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+STREAM_SHORT_WINDOW_SECONDS = float(os.getenv("STREAM_SHORT_WINDOW_SECONDS", "30"))
+STREAM_LONG_WINDOW_SECONDS = float(os.getenv("STREAM_LONG_WINDOW_SECONDS", "300"))
+# Windowed sessions are dropped after this long without events
+STREAM_IDLE_TTL_SECONDS = float(os.getenv("STREAM_IDLE_TTL_SECONDS", "900"))
+STREAM_MAX_SESSIONS = int(os.getenv("STREAM_MAX_SESSIONS", "50000"))
+# Per connection: received messages waiting to be scored, and sessions with an update to send
+STREAM_MAX_PENDING_MESSAGES = int(os.getenv("STREAM_MAX_PENDING_MESSAGES", "8"))
+STREAM_MAX_PENDING_UPDATES = int(os.getenv("STREAM_MAX_PENDING_UPDATES", "1000"))
+STREAM_MAX_EVENTS_PER_MESSAGE = int(os.getenv("STREAM_MAX_EVENTS_PER_MESSAGE", "5000"))
+# Buckets per window; counts are exact to within one bucket at the window's old edge
+WINDOW_BUCKETS = 30
+# Only "more than one" matters for scoring, as in app/session_store.py
+MAX_DISTINCT_TRACKED = 16
+
+# Event types with their own window counter; everything else is counted as "other"
+WINDOW_EVENT_TYPES = (
+    "mouse_click",
+    "mouse_move",
+    "scroll",
+    "keyboard_down",
+    "tab_visible",
+    "clipboard_copy",
+    "clipboard_paste",
+    "navigation",
+    "page_load",
+    "other",
+)
+EVENT_CODES = {name: i for i, name in enumerate(WINDOW_EVENT_TYPES)}
+OTHER_CODE = EVENT_CODES["other"]
+N_CODES = len(WINDOW_EVENT_TYPES)
+_COLUMN = {name: i for i, name in enumerate(FEATURE_COLUMNS)}
+
+
+class SlidingCounter:
+    """Per-event-type counts over the last ``span`` seconds of event time."""
+
+    __slots__ = ("resolution", "span_buckets", "buckets", "totals")
+
+    def __init__(self, span: float, buckets: int = WINDOW_BUCKETS):
+        self.resolution = span / buckets
+        self.span_buckets = buckets
+        # (bucket id, counts) for non-empty buckets only, oldest first
+        self.buckets: deque = deque()
+        self.totals = [0] * N_CODES
+
+    def add(self, timestamp: float, code: int):
+        bucket = int(timestamp // self.resolution)
+        buckets = self.buckets
+        if buckets and bucket <= buckets[-1][0]:
+            if bucket <= buckets[-1][0] - self.span_buckets:
+                return  # already outside the window
+            # Late events count in the newest bucket rather than searching for theirs
+            counts = buckets[-1][1]
+        else:
+            counts = [0] * N_CODES
+            buckets.append((bucket, counts))
+            cutoff = bucket - self.span_buckets
+            totals = self.totals
+            while buckets[0][0] <= cutoff:
+                for i, n in enumerate(buckets.popleft()[1]):
+                    totals[i] -= n
+        counts[code] += 1
+        self.totals[code] += 1
+
+    def count(self, *names: str) -> int:
+        return sum(self.totals[EVENT_CODES[name]] for name in names)
+
+    def summary(self) -> Dict[str, int]:
+        """Non-zero counts by event type, plus the total."""
+        counts = {name: n for name, n in zip(WINDOW_EVENT_TYPES, self.totals) if n}
+        counts["events"] = sum(self.totals)
+        return counts
+
+
+class SessionWindows:
+    __slots__ = (
+        "user_id", "session_id", "short", "long", "first_ts", "last_ts",
+        "ips", "devices", "band", "risk_score", "last_activity",
+    )
+
+    def __init__(self, user_id: int, session_id: str):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.short = SlidingCounter(STREAM_SHORT_WINDOW_SECONDS)
+        self.long = SlidingCounter(STREAM_LONG_WINDOW_SECONDS)
+        self.first_ts: Optional[float] = None
+        self.last_ts: Optional[float] = None
+        self.ips: set = set()
+        self.devices: set = set()
+        # Band of the last score, which updates are pushed against
+        self.band = "normal"
+        self.risk_score: Optional[float] = None
+        self.last_activity = time.monotonic()
+
+    def add(self, event_type: str, timestamp: float, ip_address: Optional[str], device_fingerprint: Optional[str]):
+        code = EVENT_CODES.get(event_type, OTHER_CODE)
+        self.short.add(timestamp, code)
+        self.long.add(timestamp, code)
+        if self.first_ts is None or timestamp < self.first_ts:
+            self.first_ts = timestamp
+        if self.last_ts is None or timestamp > self.last_ts:
+            self.last_ts = timestamp
+        if ip_address and len(self.ips) < MAX_DISTINCT_TRACKED:
+            self.ips.add(ip_address)
+        if device_fingerprint and len(self.devices) < MAX_DISTINCT_TRACKED:
+            self.devices.add(device_fingerprint)
+        self.last_activity = time.monotonic()
+
+    def feature_row(self) -> List[float]:
+        """FEATURE_COLUMNS row from the windows.
+
+        Counts (tab switches, clipboard, events) cover the long window; rates
+        per minute (typing, clicks, scrolling, navigation) the short one, so a
+        burst shows up within seconds.
+        """
+        short, long = self.short, self.long
+        session_minutes = (self.last_ts - self.first_ts) / 60 if self.first_ts is not None else 0.0
+        # A young session has not filled its windows yet; don't inflate its rates
+        short_minutes = max(min(STREAM_SHORT_WINDOW_SECONDS / 60, session_minutes), 0.1)
+        long_minutes = max(min(STREAM_LONG_WINDOW_SECONDS / 60, session_minutes), 0.1)
+        mouse_moves = long.count("mouse_move")
+        started = datetime.fromtimestamp(self.first_ts) if self.first_ts is not None else None
+
+        row = [0.0] * len(FEATURE_COLUMNS)
+        row[_COLUMN["click_frequency"]] = short.count("mouse_click") / short_minutes
+        row[_COLUMN["scroll_velocity"]] = short.count("scroll") / short_minutes
+        row[_COLUMN["typing_speed"]] = short.count("keyboard_down") / short_minutes
+        row[_COLUMN["dwell_time"]] = long_minutes / max(long.count("page_load"), 1)
+        row[_COLUMN["tab_switch_count"]] = long.count("tab_visible")
+        row[_COLUMN["copy_paste_events"]] = long.count("clipboard_copy", "clipboard_paste")
+        row[_COLUMN["navigation_speed"]] = short.count("navigation") / short_minutes
+        row[_COLUMN["mouse_trajectory_entropy"]] = min(1.0, mouse_moves / 100) if mouse_moves >= 2 else 0.0
+        row[_COLUMN["session_duration"]] = session_minutes
+        row[_COLUMN["time_of_day"]] = started.hour if started else 0
+        # JavaScript getDay() numbering (Sunday = 0), as the backend sends it
+        row[_COLUMN["day_of_week"]] = (started.weekday() + 1) % 7 if started else 0
+        row[_COLUMN["device_change"]] = float(len(self.devices) > 1)
+        row[_COLUMN["location_anomaly"]] = float(len(self.ips) > 1)
+        row[_COLUMN["event_count"]] = sum(long.totals)
+        row[_COLUMN["unique_event_types"]] = sum(1 for n in long.totals if n)
+        return row
+
+    def windows(self) -> Dict[str, Dict[str, int]]:
+        return {
+            f"{STREAM_SHORT_WINDOW_SECONDS:g}s": self.short.summary(),
+            f"{STREAM_LONG_WINDOW_SECONDS:g}s": self.long.summary(),
+        }
+
+
+class WindowStore:
+    """Windowed sessions ordered by last activity, evicting idle ones from the front."""
+
+    def __init__(self, idle_ttl: float = STREAM_IDLE_TTL_SECONDS, max_sessions: int = STREAM_MAX_SESSIONS):
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, SessionWindows]" = OrderedDict()
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def ingest(self, events: Iterable) -> List[SessionWindows]:
+        """Add events to their sessions' windows; returns the sessions touched, in first-seen order."""
+        touched: Dict[str, SessionWindows] = {}
+        for event in events:
+            windows = self._sessions.get(event.session_id)
+            if windows is None:
+                windows = SessionWindows(event.user_id, event.session_id)
+                self._sessions[event.session_id] = windows
+            else:
+                self._sessions.move_to_end(event.session_id)
+            windows.add(event.event_type, event.timestamp.timestamp(), event.ip_address, event.device_fingerprint)
+            touched[event.session_id] = windows
+        self.evict_idle()
+        return list(touched.values())
+
+    def get(self, session_id: str) -> Optional[SessionWindows]:
+        return self._sessions.get(session_id)
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_activity >= cutoff and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "windowed_sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl,
+            "windows_seconds": [STREAM_SHORT_WINDOW_SECONDS, STREAM_LONG_WINDOW_SECONDS],
+            "evicted": self.evicted,
+        }
+
+
+class UpdateBuffer:
+    """Bounded outgoing buffer holding at most one pending update per key.
+
+    A newer update for a session replaces the pending one; if the session
+    is back in the band the client last saw, the pending update is dropped.
+    put() waits only when a new key arrives while the buffer is full.
+    """
+
+    def __init__(self, maxsize: int = STREAM_MAX_PENDING_UPDATES):
+        self.maxsize = maxsize
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self.coalesced = 0
+        self.full_waits = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def put(self, key: str, update: Dict[str, Any]):
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            previous = pending.get("previous_anomaly_type")
+            if update.get("anomaly_type") == previous:
+                del self._pending[key]
+                self._not_full.set()
+            else:
+                # Keep the band the client last saw and the session's place in line
+                update["previous_anomaly_type"] = previous
+                self._pending[key] = update
+            return
+        while len(self._pending) >= self.maxsize:
+            self.full_waits += 1
+            self._not_full.clear()
+            await self._not_full.wait()
+        self._pending[key] = update
+        self._not_empty.set()
+
+    async def get(self) -> Dict[str, Any]:
+        while not self._pending:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        _, update = self._pending.popitem(last=False)
+        self._not_full.set()
+        return update
+
+
+class ScoreStreams:
+    """Runs scoring connections and keeps their counters."""
+
+    def __init__(
+        self,
+        max_pending_messages: int = STREAM_MAX_PENDING_MESSAGES,
+        max_pending_updates: int = STREAM_MAX_PENDING_UPDATES,
+    ):
+        self.max_pending_messages = max_pending_messages
+        self.max_pending_updates = max_pending_updates
+        self._buffers: set = set()
+        self.connections_total = 0
+        self.messages = 0
+        self.rejected = 0
+        self.updates_sent = 0
+        self.read_pauses = 0
+        self._closed_coalesced = 0
+        self._closed_full_waits = 0
+
+    @property
+    def connections(self) -> int:
+        return len(self._buffers)
+
+    async def serve(self, websocket, handle: Callable[[str], List[Dict[str, Any]]]):
+        """Serve one connection until the client disconnects.
+
+        ``handle`` takes a received message and returns the updates to push;
+        an exception is reported back to the client as an error message.
+        """
+        await websocket.accept()
+        inbound: asyncio.Queue = asyncio.Queue(self.max_pending_messages)
+        outbound = UpdateBuffer(self.max_pending_updates)
+        errors = itertools.count()
+
+        async def receive():
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                text = message.get("text")
+                if text is None:
+                    text = (message.get("bytes") or b"").decode("utf-8", "replace")
+                if inbound.full():
+                    # Stop reading until scoring catches up; the producer's sends block
+                    self.read_pauses += 1
+                await inbound.put(text)
+
+        async def process():
+            while True:
+                text = await inbound.get()
+                self.messages += 1
+                try:
+                    updates = handle(text)
+                except Exception as e:
+                    self.rejected += 1
+                    await outbound.put(f"error:{next(errors)}", {"type": "error", "detail": str(e)})
+                    continue
+                for update in updates:
+                    await outbound.put(update["session_id"], update)
+
+        async def send():
+            while True:
+                update = await outbound.get()
+                await websocket.send_json(update)
+                self.updates_sent += 1
+
+        self._buffers.add(outbound)
+        self.connections_total += 1
+        tasks = [asyncio.create_task(fn()) for fn in (receive, process, send)]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    logger.warning(f"Score stream closed: {task.exception()!r}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._buffers.discard(outbound)
+            self._closed_coalesced += outbound.coalesced
+            self._closed_full_waits += outbound.full_waits
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": self.connections,
+            "connections_total": self.connections_total,
+            "messages": self.messages,
+            "rejected_messages": self.rejected,
+            "updates_sent": self.updates_sent,
+            "updates_pending": sum(len(b) for b in self._buffers),
+            "updates_coalesced": self._closed_coalesced + sum(b.coalesced for b in self._buffers),
+            "send_buffer_full_waits": self._closed_full_waits + sum(b.full_waits for b in self._buffers),
+            "read_pauses": self.read_pauses,
+            "max_pending_messages": self.max_pending_messages,
+            "max_pending_updates": self.max_pending_updates,
+        }
+
+
+window_store = WindowStore()
+score_streams = ScoreStreams()
@@ -0,0 +1,137 @@
+"""Binary columnar wire format for high-volume scoring traffic.
+
+Content type ``application/x-bris-columnar``. All integers and floats are
+little-endian and every section starts on an 8-byte boundary, so the decoder
+returns NumPy views straight over the request body without copying or
+building per-row objects.
+
+Request frame::
+
+    header     16 bytes   magic b"BRSC", u16 version, u16 n_cols, u32 n_rows, u32 reserved
+    user_ids   i64[n_rows]
+    features   f64[n_cols][n_rows]   one contiguous column per FEATURE_COLUMNS entry
+    offsets    u32[n_rows + 1]       byte offsets of each session id in the blob
+    blob       utf-8 session ids
+
+Response frame::
+
+    header     16 bytes   magic b"BRSR", u16 version, u16 0, u32 n_rows, u32 reserved
+    risk       f64[n_rows]           NaN for rows that could not be scored
+    confidence f64[n_rows]
+    anomaly    u8[n_rows]            index into ANOMALY_LABELS, ERROR_CODE for bad rows
+"""
+import struct
+from typing import List, NamedTuple, Sequence
+
+import numpy as np
+
+from app.scoring import ANOMALY_LABELS, FEATURE_COLUMNS
+
+WIRE_CONTENT_TYPE = "application/x-bris-columnar"
+WIRE_VERSION = 1
+REQUEST_MAGIC = b"BRSC"
+RESPONSE_MAGIC = b"BRSR"
+HEADER = struct.Struct("<4sHHII")
+ERROR_CODE = 255
+
+_LE_INT64 = np.dtype("<i8")
+_LE_FLOAT64 = np.dtype("<f8")
+_LE_UINT32 = np.dtype("<u4")
+
+
+class WireFormatError(ValueError):
+    """Raised for frames that do not match the columnar layout."""
+
+
+class ColumnarBatch(NamedTuple):
+    user_ids: np.ndarray
+    # (n_rows, n_cols) view over column-major data
+    features: np.ndarray
+    sessions: List[str]
+
+    def session_ids(self) -> List[str]:
+        return self.sessions
+
+
+def _pad8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def decode_predict_request(body: bytes) -> ColumnarBatch:
+    if len(body) < HEADER.size:
+        raise WireFormatError("frame shorter than header")
+    magic, version, n_cols, n_rows, _ = HEADER.unpack_from(body, 0)
+    if magic != REQUEST_MAGIC:
+        raise WireFormatError("bad magic")
+    if version != WIRE_VERSION:
+        raise WireFormatError(f"unsupported version {version}")
+    if n_cols != len(FEATURE_COLUMNS):
+        raise WireFormatError(f"expected {len(FEATURE_COLUMNS)} feature columns, got {n_cols}")
+
+    offset = HEADER.size
+    features_at = offset + 8 * n_rows
+    offsets_at = features_at + 8 * n_rows * n_cols
+    blob_at = _pad8(offsets_at + 4 * (n_rows + 1))
+    if len(body) < blob_at:
+        raise WireFormatError("frame truncated")
+
+    user_ids = np.frombuffer(body, dtype=_LE_INT64, count=n_rows, offset=offset)
+    columns = np.frombuffer(body, dtype=_LE_FLOAT64, count=n_rows * n_cols, offset=features_at)
+    session_offsets = np.frombuffer(body, dtype=_LE_UINT32, count=n_rows + 1, offset=offsets_at)
+    blob = bytes(memoryview(body)[blob_at:])
+    if (
+        session_offsets[0] != 0
+        or session_offsets[-1] != len(blob)
+        or np.any(np.diff(session_offsets.astype(np.int64)) < 0)
+    ):
+        raise WireFormatError("session id offsets do not match blob")
+    # Decoded here so a bad id is a format error, not a failure halfway through scoring
+    bounds = session_offsets.tolist()
+    try:
+        sessions = [blob[bounds[i]:bounds[i + 1]].decode("utf-8") for i in range(n_rows)]
+    except UnicodeDecodeError as e:
+        raise WireFormatError(f"session id is not valid UTF-8: {e}")
+
+    return ColumnarBatch(user_ids, columns.reshape(n_cols, n_rows).T, sessions)
+
+
+def encode_predict_request(user_ids: Sequence[int], session_ids: Sequence[str], features: np.ndarray) -> bytes:
+    """Build a request frame from an (n_rows, len(FEATURE_COLUMNS)) feature matrix."""
+    features = np.asarray(features, dtype=_LE_FLOAT64)
+    n_rows, n_cols = features.shape
+    encoded = [s.encode() for s in session_ids]
+    offsets = np.zeros(n_rows + 1, dtype=_LE_UINT32)
+    np.cumsum([len(s) for s in encoded], out=offsets[1:])
+
+    offsets_bytes = offsets.tobytes()
+    parts = [
+        HEADER.pack(REQUEST_MAGIC, WIRE_VERSION, n_cols, n_rows, 0),
+        np.asarray(user_ids, dtype=_LE_INT64).tobytes(),
+        np.ascontiguousarray(features.T).tobytes(),
+        offsets_bytes,
+        b"\0" * (_pad8(len(offsets_bytes)) - len(offsets_bytes)),
+        b"".join(encoded),
+    ]
+    return b"".join(parts)
+
+
+def encode_predict_response(risk: np.ndarray, confidence: np.ndarray, anomaly_codes: np.ndarray) -> bytes:
+    n_rows = len(risk)
+    return b"".join((
+        HEADER.pack(RESPONSE_MAGIC, WIRE_VERSION, 0, n_rows, 0),
+        np.asarray(risk, dtype=_LE_FLOAT64).tobytes(),
+        np.asarray(confidence, dtype=_LE_FLOAT64).tobytes(),
+        np.asarray(anomaly_codes, dtype=np.uint8).tobytes(),
+    ))
+
+
+def decode_predict_response(body: bytes):
+    """(risk, confidence, anomaly_labels) arrays from a response frame; labels are None for bad rows."""
+    magic, version, _, n_rows, _ = HEADER.unpack_from(body, 0)
+    if magic != RESPONSE_MAGIC or version != WIRE_VERSION:
+        raise WireFormatError("not a columnar response frame")
+    risk = np.frombuffer(body, dtype=_LE_FLOAT64, count=n_rows, offset=HEADER.size)
+    confidence = np.frombuffer(body, dtype=_LE_FLOAT64, count=n_rows, offset=HEADER.size + 8 * n_rows)
+    codes = np.frombuffer(body, dtype=np.uint8, count=n_rows, offset=HEADER.size + 16 * n_rows)
+    labels = [None if c == ERROR_CODE else str(ANOMALY_LABELS[c]) for c in codes]
+    return risk, confidence, labels
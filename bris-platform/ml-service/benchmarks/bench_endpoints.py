@@ -0,0 +1,119 @@
+"""Latency/throughput load test for the ML service endpoints.
+
+Runs the FastAPI app in-process against the fake Gemini (or a live server
+with --url) and reports p50/p95/p99 latency and requests/sec per endpoint
+at each concurrency level.
+
+    python -m benchmarks.bench_endpoints --requests 200 --concurrency 1,8,32 --output endpoints.json
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks import fake_genai
+from benchmarks.common import latency_summary, run_metadata, sample_events_summary, sample_features, write_results
+
+fake_genai.install()
+
+import httpx  # noqa: E402
+
+Payload = Callable[[int], Tuple[str, str, Optional[Dict[str, Any]]]]
+
+
+def scenarios(events_per_report: int) -> Dict[str, Payload]:
+    events = sample_events_summary(events_per_report)
+    batch = [{"user_id": i, "session_id": f"bench-{i}", "features": sample_features(i)} for i in range(100)]
+    return {
+        "health": lambda i: ("GET", "/health", None),
+        "predict": lambda i: ("POST", "/predict", {"user_id": 1, "session_id": f"bench-{i}", "features": sample_features(i)}),
+        "predict_batch_100": lambda i: ("POST", "/predict/batch", {"requests": batch}),
+        "explain": lambda i: ("POST", "/explain", {"user_id": 1, "risk_score": 55.0, "anomaly_type": "anomaly", "features": sample_features(i)}),
+        "ai_dna": lambda i: ("POST", "/ai/dna", {"user_id": 1, "features": sample_features(i)}),
+        "ai_reconstruction": lambda i: ("POST", "/ai/reconstruction", {"session_id": f"bench-{i}", "features": sample_features(i)}),
+        "ai_query": lambda i: ("POST", "/ai/query", {"query": f"Which users behave like session bench-{i}?"}),
+        "ai_forensic_report": lambda i: (
+            "POST",
+            "/ai/forensic-report",
+            {"session_id": f"bench-{i}", "user_id": 1, "features": sample_features(i), "events_summary": events},
+        ),
+    }
+
+
+async def run_level(client: httpx.AsyncClient, payload: Payload, requests: int, concurrency: int, headers: Dict[str, str]) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            method, path, body = payload(i)
+            started = time.perf_counter()
+            response = await client.request(method, path, json=body, headers=headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests_per_sec": round(requests / elapsed, 2),
+        "latency": latency_summary(latencies),
+        "status_codes": statuses,
+    }
+
+
+async def main(args) -> Dict[str, Any]:
+    fake_genai.configure_fake(
+        latency_ms=args.llm_latency_ms,
+        jitter_ms=args.llm_jitter_ms,
+        error_rate=args.llm_error_rate,
+        rate_limit_rate=args.llm_429_rate,
+    )
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        from app.main import app
+
+        client = httpx.AsyncClient(app=app, base_url="http://bench", timeout=60)
+
+    # Unique payloads plus no-cache measure the real work, not the response cache
+    headers = {} if args.allow_cache else {"Cache-Control": "no-cache"}
+    selected = scenarios(args.events_per_report)
+    if args.endpoints:
+        selected = {name: selected[name] for name in args.endpoints.split(",")}
+
+    results: Dict[str, Any] = {}
+    async with client:
+        for name, payload in selected.items():
+            levels = []
+            for concurrency in args.concurrency:
+                fake_genai.reset_counters()
+                level = await run_level(client, payload, args.requests, concurrency, headers)
+                level["fake_gemini_calls"] = dict(fake_genai.calls)
+                levels.append(level)
+            results[name] = levels
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint and concurrency level")
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 8, 32])
+    parser.add_argument("--endpoints", help="comma-separated subset of scenarios")
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--allow-cache", action="store_true", help="let the response cache serve repeated requests")
+    parser.add_argument("--events-per-report", type=int, default=200)
+    parser.add_argument("--llm-latency-ms", type=float, default=400)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-429-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = asyncio.run(main(args))
+    write_results({"meta": run_metadata(vars(args)), "endpoints": results}, args.output)
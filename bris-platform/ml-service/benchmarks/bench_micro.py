@@ -0,0 +1,71 @@
+"""Micro-benchmarks for the hot helpers in app/main.py.
+
+    python -m benchmarks.bench_micro --output micro.json
+"""
+import argparse
+import json
+import timeit
+from typing import Any, Callable, Dict
+
+from benchmarks import fake_genai
+from benchmarks.common import run_metadata, sample_features, write_results
+
+fake_genai.install()
+
+from app import main  # noqa: E402
+from app.cache import fingerprint  # noqa: E402
+from app.scoring import feature_matrix, risk_scores  # noqa: E402
+
+
+def cases() -> Dict[str, Callable[[], Any]]:
+    raw_features = sample_features(1)
+    features = main.BehavioralFeatures(**raw_features)
+    predict_payload = {"user_id": 1, "session_id": "bench", "features": raw_features}
+    batch = [main.BehavioralFeatures(**sample_features(i)) for i in range(1000)]
+    report_json = json.dumps(fake_genai.RESPONSE)
+    fenced_json = f"Here you go:\n```json\n{report_json}\n```"
+
+    return {
+        "generate_behavioral_narrative": lambda: main.generate_behavioral_narrative(features),
+        "generate_mitigation": lambda: main.generate_mitigation(62.0, features),
+        "parse_ai_json_plain": lambda: main.parse_ai_json(report_json),
+        "parse_ai_json_fenced": lambda: main.parse_ai_json(fenced_json),
+        "validate_behavioral_features": lambda: main.BehavioralFeatures(**raw_features),
+        "validate_predict_request": lambda: main.PredictRequest(**predict_payload),
+        "score_features": lambda: main.score_features(features, 0.0),
+        "feature_matrix_1000": lambda: feature_matrix(batch),
+        "risk_scores_1000": (lambda X: lambda: risk_scores(X))(feature_matrix(batch)),
+        "cache_fingerprint": lambda: fingerprint("ai/dna", "v1", raw_features),
+    }
+
+
+def measure(fn: Callable[[], Any], repeat: int, min_time: float) -> Dict[str, float]:
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    while number * (timer.timeit(1) or 1e-9) < min_time:
+        number *= 2
+    runs = timer.repeat(repeat=repeat, number=number)
+    per_call_us = [r / number * 1e6 for r in runs]
+    return {
+        "loops": number,
+        "best_us": round(min(per_call_us), 3),
+        "median_us": round(sorted(per_call_us)[len(per_call_us) // 2], 3),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per repeat")
+    parser.add_argument("--only", help="comma-separated subset of cases")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    selected = cases()
+    if args.only:
+        selected = {name: selected[name] for name in args.only.split(",")}
+    results = {name: measure(fn, args.repeat, args.min_time) for name, fn in selected.items()}
+    write_results({"meta": run_metadata(vars(args)), "micro": results}, args.output)
@@ -0,0 +1,150 @@
+"""Throughput of the CPU process pool on /predict/batch-style scoring and feature extraction.
+
+Scores batches with a synthetic tree ensemble (heavy enough that handing a
+batch to another process is small next to the work), and extracts raw
+signal features, first inline on the event loop and then through
+app/cpu_pool.py at each worker count, with several batches in flight.
+
+    python -m benchmarks.bench_pool --rows 50000 --workers 1,2,4 --output pool.json
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+import numpy as np
+
+from benchmarks.common import latency_summary, run_metadata, sample_features, write_results
+
+from app.cpu_pool import CPUPool, available_cpus
+from app.features import signal_features
+from app.model_registry import load_artifact, write_artifact
+from app.scoring import FEATURE_COLUMNS
+
+
+def build_tree_ensemble(root: str, X: np.ndarray, trees: int, depth: int, seed: int = 0):
+    """Complete binary trees splitting on random features at quantiles of X."""
+    rng = np.random.default_rng(seed)
+    n_inner = 2 ** depth - 1
+    n_nodes = 2 ** (depth + 1) - 1
+    nodes = np.arange(n_nodes)
+    feature = np.full((trees, n_nodes), -1, dtype=np.int32)
+    feature[:, :n_inner] = rng.integers(0, len(FEATURE_COLUMNS), (trees, n_inner))
+    quantiles = rng.uniform(0.1, 0.9, (trees, n_inner))
+    threshold = np.zeros((trees, n_nodes))
+    threshold[:, :n_inner] = np.quantile(X, quantiles, axis=0)[np.arange(trees)[:, None], np.arange(n_inner), feature[:, :n_inner]]
+    left = np.where(nodes < n_inner, 2 * nodes + 1, nodes)
+    right = np.where(nodes < n_inner, 2 * nodes + 2, nodes)
+    value = np.where(nodes < n_inner, 0.0, rng.normal(0, 1, (trees, n_nodes)))
+    manifest = {
+        "type": "tree_ensemble",
+        "features": list(FEATURE_COLUMNS),
+        "link": "logistic",
+        "max_depth": depth,
+        "learning_rate": 0.1,
+    }
+    arrays = {
+        "feature": feature,
+        "threshold": threshold,
+        "left": np.tile(left, (trees, 1)),
+        "right": np.tile(right, (trees, 1)),
+        "value": value,
+    }
+    write_artifact(root, "bench-trees", manifest, arrays)
+    return load_artifact(root, "bench-trees")
+
+
+def sample_signals(sessions: int, samples: int, seed: int = 0) -> List[List[List[float]]]:
+    rng = np.random.default_rng(seed)
+    mouse_t, mouse_x, mouse_y, key_down, key_up = [], [], [], [], []
+    for n in rng.integers(samples // 2, samples * 3 // 2, sessions):
+        mouse_t.append(np.cumsum(rng.uniform(5, 25, n)).tolist())
+        mouse_x.append(rng.uniform(0, 1920, n).tolist())
+        mouse_y.append(rng.uniform(0, 1080, n).tolist())
+        down = np.cumsum(rng.uniform(60, 300, n // 4))
+        key_down.append(down.tolist())
+        key_up.append((down + rng.uniform(40, 140, len(down))).tolist())
+    return [mouse_t, mouse_x, mouse_y, key_down, key_up]
+
+
+async def run_level(call: Callable[[], Awaitable[Any]], batches: int, concurrency: int, rows: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    remaining = iter(range(batches))
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            await call()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    return {
+        "batches": batches,
+        "concurrency": concurrency,
+        "rows_per_sec": round(batches * rows / elapsed, 1),
+        "latency": latency_summary(latencies),
+    }
+
+
+async def main(args) -> Dict[str, Any]:
+    distinct = np.asarray([[float(f[name]) for name in FEATURE_COLUMNS] for f in map(sample_features, range(5000))])
+    X = distinct[np.arange(args.rows) % len(distinct)]
+    signals = sample_signals(args.sessions, args.samples_per_session)
+    signal_rows = sum(len(c) for c in signals[0]) + sum(len(c) for c in signals[3])
+
+    with tempfile.TemporaryDirectory() as root:
+        model = build_tree_ensemble(root, X, args.trees, args.depth)
+        results: Dict[str, Any] = {}
+
+        async def score_inline():
+            return model.score(X)
+
+        async def extract_inline():
+            return signal_features(*signals)
+
+        results["score/inline"] = await run_level(score_inline, args.batches, args.concurrency, args.rows)
+        results["extract/inline"] = await run_level(extract_inline, args.batches, args.concurrency, signal_rows)
+        expected = model.score(X)
+
+        for workers in args.workers:
+            pool = CPUPool(workers=workers, task_timeout=args.timeout)
+            await pool.warm_up()
+            try:
+                assert np.allclose(await pool.score(model, X), expected), "pooled scores differ from inline"
+                results[f"score/w{workers}"] = await run_level(
+                    lambda: pool.score(model, X), args.batches, args.concurrency, args.rows)
+                results[f"extract/w{workers}"] = await run_level(
+                    lambda: pool.signal_features(*signals), args.batches, args.concurrency, signal_rows)
+            finally:
+                pool.shutdown()
+    return results
+
+
+def default_workers() -> List[int]:
+    cpus = available_cpus()
+    levels = [w for w in (1, 2, 4, 8, 16, 32) if w < cpus]
+    return levels + [cpus]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=50000, help="rows per scoring batch")
+    parser.add_argument("--batches", type=int, default=8, help="batches per scenario and worker count")
+    parser.add_argument("--concurrency", type=int, default=4, help="batches in flight at once")
+    parser.add_argument("--workers", type=lambda s: [int(w) for w in s.split(",")], default=default_workers())
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--sessions", type=int, default=200, help="sessions per extraction batch")
+    parser.add_argument("--samples-per-session", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=120.0, help="pool task timeout in seconds")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = asyncio.run(main(args))
+    write_results({"meta": {**run_metadata(vars(args)), "cpus": available_cpus()}, "pool": results}, args.output)
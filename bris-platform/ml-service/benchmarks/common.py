@@ -0,0 +1,85 @@
+"""Shared helpers for the benchmark scripts: payloads, stats and result files."""
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+def sample_features(seed: int) -> Dict[str, Any]:
+    """A plausible BehavioralFeatures payload; different seeds give different fingerprints."""
+    rng = random.Random(seed)
+    typing_speed = rng.uniform(20, 190)
+    return {
+        "click_frequency": rng.uniform(0, 30),
+        "scroll_velocity": rng.uniform(0, 400),
+        "typing_speed": typing_speed,
+        "dwell_time": rng.uniform(0, 60),
+        "tab_switch_count": rng.randint(0, 10),
+        "copy_paste_events": rng.randint(0, 6),
+        "navigation_speed": rng.uniform(0, 5),
+        "mouse_trajectory_entropy": rng.random(),
+        "keystroke_dynamics": [typing_speed],
+        "session_duration": rng.uniform(1, 90),
+        "time_of_day": rng.randint(0, 23),
+        "day_of_week": rng.randint(0, 6),
+        "device_change": rng.random() < 0.1,
+        "location_anomaly": rng.random() < 0.1,
+        "event_count": rng.randint(10, 2000),
+        "unique_event_types": rng.randint(1, 9),
+        "error_rate": rng.random() * 0.1,
+    }
+
+
+def sample_events_summary(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    types = ["mouse_move", "mouse_click", "keyboard_down", "tab_visible", "clipboard_paste", "scroll"]
+    start = 1_760_000_000_000
+    return [
+        {"event_type": rng.choice(types), "timestamp": start + i * rng.randint(50, 3000), "event_data": {"x": rng.randint(0, 1920)}}
+        for i in range(n)
+    ]
+
+
+def latency_summary(latencies_ms: List[float]) -> Dict[str, float]:
+    if not latencies_ms:
+        return {"count": 0}
+    values = np.asarray(latencies_ms)
+    return {
+        "count": int(len(values)),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def run_metadata(settings: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": settings,
+    }
+
+
+def write_results(results: Dict[str, Any], output: Optional[str]):
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
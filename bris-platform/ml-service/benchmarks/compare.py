@@ -0,0 +1,51 @@
+"""Compare two benchmark result files and print the change per metric.
+
+    python -m benchmarks.compare baseline.json candidate.json
+"""
+import argparse
+import json
+from typing import Any, Dict, Iterator, Tuple
+
+# Metrics where a larger number is better; everything else is a latency
+HIGHER_IS_BETTER = {"requests_per_sec", "rows_per_sec"}
+
+
+def flatten(results: Dict[str, Any]) -> Iterator[Tuple[str, float]]:
+    for name, entry in results.get("micro", {}).items():
+        yield f"micro/{name}/median_us", entry["median_us"]
+    for name, levels in results.get("endpoints", {}).items():
+        for level in levels:
+            prefix = f"endpoints/{name}/c{level['concurrency']}"
+            yield f"{prefix}/requests_per_sec", level["requests_per_sec"]
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                if key in level["latency"]:
+                    yield f"{prefix}/{key}", level["latency"][key]
+    for name, entry in results.get("pool", {}).items():
+        yield f"pool/{name}/rows_per_sec", entry["rows_per_sec"]
+        for key in ("p50_ms", "p95_ms"):
+            if key in entry["latency"]:
+                yield f"pool/{name}/{key}", entry["latency"][key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="flag changes larger than this many percent")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        before = dict(flatten(json.load(f)))
+    with open(args.candidate) as f:
+        after = dict(flatten(json.load(f)))
+
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        change = (new - old) / old * 100 if old else 0.0
+        worse = change < 0 if key.rsplit("/", 1)[-1] in HIGHER_IS_BETTER else change > 0
+        flag = " <-- regression" if worse and abs(change) > args.threshold else ""
+        print(f"{key:60s} {old:12.3f} -> {new:12.3f} ({change:+6.1f}%){flag}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Local stand-in for ``google.generativeai`` with configurable behavior.
+
+``install()`` registers it under the real module name, so it must run before
+``app.main`` is imported. Latency, jitter, error rate, 429 rate and a
+requests-per-minute quota are read from FAKE_GEMINI_* environment variables
+and can be changed at runtime with ``configure_fake()``.
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+import types
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+
+DEFAULT_MODELS = [
+    "models/gemini-2.0-flash",
+    "models/gemini-1.5-flash",
+    "models/gemini-pro",
+]
+
+_config: Dict[str, Any] = {
+    "latency_ms": float(os.getenv("FAKE_GEMINI_LATENCY_MS", "400")),
+    "jitter_ms": float(os.getenv("FAKE_GEMINI_JITTER_MS", "100")),
+    "error_rate": float(os.getenv("FAKE_GEMINI_ERROR_RATE", "0")),
+    "rate_limit_rate": float(os.getenv("FAKE_GEMINI_429_RATE", "0")),
+    "rpm": int(os.getenv("FAKE_GEMINI_RPM", "0")),
+    "list_models_latency_ms": float(os.getenv("FAKE_GEMINI_LIST_MODELS_LATENCY_MS", "150")),
+    "models": DEFAULT_MODELS,
+    "stream_chunks": 8,
+}
+_rng = random.Random(int(os.getenv("FAKE_GEMINI_SEED", "7")))
+_lock = threading.Lock()
+_recent_calls: deque = deque()
+calls: Dict[str, int] = {"generate": 0, "list_models": 0, "errors": 0, "rate_limited": 0}
+
+# One JSON document that satisfies every /ai/* parser
+RESPONSE = {
+    "dna_profile": "The Methodical Researcher. Deliberate navigation with consistent keystroke rhythm.",
+    "intent_level": "Low",
+    "mood_state": "Calm",
+    "verdict_label": "AUTHORIZED_USER",
+    "reconstruction": "User at a desk with a physical keyboard. Cursor movement is smooth and unhurried.",
+    "visual_clues": ["Steady dwell times", "No cursor jitter"],
+    "summary_narrative": "Session shows repeated tab switching followed by clipboard pastes into answer fields.",
+    "legal_assessment": "Risk score is consistent with the observed tab-switch and paste counts.",
+    "behavioral_evidence": ["Tab switch burst", "Paste after focus loss", "Flat typing cadence"],
+    "mitigation_roadmap": ["Flag session", "Require proctor review", "Re-verify identity"],
+}
+
+
+class ResourceExhausted(Exception):
+    """Mirrors google.api_core.exceptions.ResourceExhausted (HTTP 429)."""
+
+
+def configure_fake(**overrides):
+    unknown = set(overrides) - set(_config)
+    if unknown:
+        raise ValueError(f"Unknown fake Gemini settings: {sorted(unknown)}")
+    _config.update(overrides)
+
+
+def reset_counters():
+    for key in calls:
+        calls[key] = 0
+    _recent_calls.clear()
+
+
+def _sleep(base_ms: float, jitter_ms: float):
+    time.sleep(max(base_ms + _rng.uniform(-jitter_ms, jitter_ms), 0) / 1000)
+
+
+def _admit():
+    """Raise the same errors the real SDK would for quota / random failure."""
+    with _lock:
+        calls["generate"] += 1
+        now = time.monotonic()
+        if _config["rpm"]:
+            while _recent_calls and now - _recent_calls[0] > 60:
+                _recent_calls.popleft()
+            if len(_recent_calls) >= _config["rpm"]:
+                calls["rate_limited"] += 1
+                raise ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+            _recent_calls.append(now)
+        roll = _rng.random()
+    if roll < _config["rate_limit_rate"]:
+        calls["rate_limited"] += 1
+        raise ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+    if roll < _config["rate_limit_rate"] + _config["error_rate"]:
+        calls["errors"] += 1
+        raise RuntimeError("503 The model is overloaded. Please try again later.")
+
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class GenerativeModel:
+    def __init__(self, model_name: str, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, generation_config=None, stream: bool = False, request_options=None, **kwargs):
+        if self.model_name not in _config["models"]:
+            raise RuntimeError(f"404 models/{self.model_name} is not found")
+        _admit()
+        text = json.dumps(RESPONSE)
+        if not stream:
+            _sleep(_config["latency_ms"], _config["jitter_ms"])
+            return _Response(text)
+        return self._stream(text)
+
+    def _stream(self, text: str) -> Iterator[_Response]:
+        n = max(1, _config["stream_chunks"])
+        size = -(-len(text) // n)
+        for i in range(0, len(text), size):
+            _sleep(_config["latency_ms"] / n, _config["jitter_ms"] / n)
+            yield _Response(text[i:i + size])
+
+
+def list_models() -> List[types.SimpleNamespace]:
+    calls["list_models"] += 1
+    _sleep(_config["list_models_latency_ms"], 0)
+    return [types.SimpleNamespace(name=name, supported_generation_methods=["generateContent"]) for name in _config["models"]]
+
+
+def configure(api_key: Optional[str] = None, **kwargs):
+    pass
+
+
+def install():
+    """Register this module as google.generativeai and provide a dummy API key."""
+    module = sys.modules[__name__]
+    try:
+        import google
+    except ImportError:
+        google = types.ModuleType("google")
+        google.__path__ = []
+        sys.modules["google"] = google
+    google.generativeai = module
+    sys.modules["google.generativeai"] = module
+    os.environ.setdefault("GEMINI_API_KEY", "fake-benchmark-key")
+    return module
@@ -0,0 +1,28 @@
+"""Shared fixtures: the app runs in-process against the fake Gemini from benchmarks/."""
+import os
+import tempfile
+
+import pytest
+
+_state_dir = tempfile.mkdtemp(prefix="bris-ml-tests-")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("MODEL_PATH", _state_dir)
+os.environ.setdefault("BASELINE_SNAPSHOT_PATH", os.path.join(_state_dir, "baselines.npz"))
+os.environ.setdefault("AI_WARMUP_DELAY_SECONDS", "0")
+os.environ.setdefault("CPU_POOL_WORKERS", "0")
+os.environ.setdefault("FAKE_GEMINI_LATENCY_MS", "0")
+os.environ.setdefault("FAKE_GEMINI_JITTER_MS", "0")
+
+from benchmarks import fake_genai  # noqa: E402
+
+fake_genai.install()
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from app import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
@@ -0,0 +1,67 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.baselines import BaselineStore, write_snapshot
+from app.scoring import COLUMN_INDEX, FEATURE_COLUMNS
+
+
+def rows(values):
+    X = np.zeros((len(values), len(FEATURE_COLUMNS)))
+    X[:, COLUMN_INDEX["click_frequency"]] = values
+    return X
+
+
+def click_stats(store, user_id):
+    stats = store.baseline(user_id)["click_frequency"]
+    return store.sessions(user_id), stats["mean"], stats["std"]
+
+
+def test_rescored_session_replaces_its_earlier_row():
+    store = BaselineStore(min_samples=1)
+    store.update([1, 1], rows([2.0, 4.0]), ["a", "b"])
+    # Session "a" grows and is scored again, twice in one batch
+    store.update([1, 1], rows([5.0, 6.0]), ["a", "a"])
+    store.update([1], rows([6.0]), ["a"])
+
+    expected = np.array([6.0, 4.0])
+    count, mean, std = click_stats(store, 1)
+    assert count == 2
+    assert np.isclose(mean, expected.mean())
+    assert np.isclose(std, expected.std(ddof=1))
+
+
+def test_rows_without_session_ids_always_count():
+    store = BaselineStore(min_samples=1)
+    store.update([1, 1], rows([2.0, 4.0]))
+    store.update([1], rows([4.0]))
+    assert click_stats(store, 1)[0] == 3
+
+
+def test_evicted_user_is_not_charged_for_old_sessions():
+    store = BaselineStore(max_users=1, min_samples=1, initial_capacity=1)
+    store.update([1], rows([10.0]), ["a"])
+    store.update([2], rows([3.0]), ["b"])
+    # "a" belonged to user 1, whose slot now holds user 2
+    store.update([2], rows([5.0]), ["a"])
+    count, mean, _ = click_stats(store, 2)
+    assert count == 2
+    assert np.isclose(mean, 4.0)
+
+
+def test_concurrent_snapshots_leave_one_complete_file(tmp_path):
+    path = str(tmp_path / "baselines.npz")
+    stores = []
+    for user_id in range(4):
+        store = BaselineStore(min_samples=1)
+        store.update([user_id] * 50, rows(np.arange(50.0)))
+        stores.append(store)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(lambda store: write_snapshot(store.snapshot_data(), path), stores * 5))
+
+    restored = BaselineStore(min_samples=1)
+    assert restored.load(path)
+    assert len(restored) == 1
+    assert os.listdir(tmp_path) == ["baselines.npz"]
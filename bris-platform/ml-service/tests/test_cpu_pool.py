@@ -0,0 +1,19 @@
+import pytest
+
+from app import cpu_pool
+
+
+@pytest.mark.parametrize("cpus, web_workers, expected", [
+    (64, None, 4),
+    (8, "4", 2),
+    (8, "16", 1),
+    (2, None, 2),
+])
+def test_default_pool_is_a_bounded_share_of_the_cpus(monkeypatch, cpus, web_workers, expected):
+    monkeypatch.setattr(cpu_pool, "available_cpus", lambda: cpus)
+    if web_workers is None:
+        monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    else:
+        monkeypatch.setenv("WEB_CONCURRENCY", web_workers)
+    assert cpu_pool.default_workers() == expected
+
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+import pytest
+
+from app import deadlines
+from app.deadlines import DeadlineExceededError, parse_deadline
+
+
+@pytest.mark.parametrize("value", ["nan", "inf", "-inf", "NaN", "soon"])
+def test_unusable_deadline_headers_are_ignored(value):
+    assert parse_deadline(value, time.monotonic()) is None
+
+
+def test_follower_without_deadline_outlives_a_short_leader():
+    from app.main import call_llm
+
+    seen = []
+
+    async def generate():
+        # The shared call must not carry the leader's deadline
+        seen.append(deadlines.remaining())
+        await asyncio.sleep(0.2)
+        return "report"
+
+    async def leader():
+        token = deadlines._deadline.set(time.monotonic() + 0.05)
+        try:
+            return await call_llm("shared-flight", generate)
+        finally:
+            deadlines._deadline.reset(token)
+
+    async def follower():
+        await asyncio.sleep(0.01)
+        return await call_llm("shared-flight", generate)
+
+    async def run():
+        return await asyncio.gather(leader(), follower(), return_exceptions=True)
+
+    leader_result, follower_result = asyncio.run(run())
+    assert isinstance(leader_result, DeadlineExceededError)
+    assert follower_result == "report"
+    assert seen == [None]
+
+
+def test_abandoned_shared_call_gives_its_llm_slot_back():
+    from app.llm import LLMClient
+    from app.main import call_llm
+
+    client = LLMClient(max_concurrency=2, timeout=5)
+
+    async def generate():
+        return await client._run(time.sleep, 0.5)
+
+    async def caller(budget):
+        token = deadlines._deadline.set(time.monotonic() + budget)
+        try:
+            return await call_llm("abandoned-flight", generate)
+        finally:
+            deadlines._deadline.reset(token)
+
+    async def run():
+        results = await asyncio.gather(caller(0.05), caller(0.1), return_exceptions=True)
+        await asyncio.sleep(0.01)
+        return results, client.in_flight
+
+    results, in_flight = asyncio.run(run())
+    assert all(isinstance(r, DeadlineExceededError) for r in results)
+    assert in_flight == 0
@@ -0,0 +1,39 @@
+import numpy as np
+
+from app.features import KEY_TIMING_BINS, keystroke_features, mouse_features
+
+
+def test_non_finite_key_timings_stay_in_their_session():
+    nan, inf = float("nan"), float("inf")
+    # Session 0 has a NaN release and an infinite press; session 1 is clean
+    down = np.array([0.0, 100.0, inf, 0.0, 200.0])
+    up = np.array([50.0, nan, 400.0, 80.0, 260.0])
+    keys = keystroke_features(down, up, [3, 2])
+
+    for name in ("dwell_histogram", "flight_histogram"):
+        hist = keys[name]
+        assert hist.shape == (2, KEY_TIMING_BINS)
+        assert np.isfinite(hist).all()
+        assert np.allclose(hist.sum(axis=1)[hist.sum(axis=1) > 0], 1.0)
+    # Session 1's rows only reflect its own two keys
+    assert np.allclose(keys["dwell_histogram"][1], np.eye(KEY_TIMING_BINS)[1])
+    assert np.isclose(keys["dwell_mean_ms"][1], 70.0)
+    for name in ("dwell_mean_ms", "dwell_std_ms", "flight_mean_ms", "flight_std_ms"):
+        assert np.isfinite(keys[name]).all()
+
+
+def test_non_finite_mouse_samples_stay_out_of_the_features():
+    nan = float("nan")
+    # Session 0: a NaN coordinate; session 1: coordinates that overflow once
+    # subtracted; session 2: clean, for comparison
+    t = np.array([0.0, 10.0, 20.0, 0.0, 10.0, 20.0, 0.0, 10.0, 20.0])
+    x = np.array([0.0, nan, 5.0, 0.0, 1e308, -1e308, 0.0, 3.0, 6.0])
+    y = np.array([nan, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 4.0, 8.0])
+    mouse = mouse_features(t, x, y, [3, 3, 3])
+
+    for name, values in mouse.items():
+        assert np.isfinite(values).all(), name
+    # Session 0 keeps only its last sample, so it has no steps
+    assert mouse["mouse_path_length"][0] == 0.0
+    assert np.isclose(mouse["mouse_path_length"][2], 10.0)
+    assert np.isclose(mouse["mouse_straightness"][2], 1.0)
@@ -0,0 +1,19 @@
+def metric_types(text):
+    return dict(line.split()[2:4] for line in text.splitlines() if line.startswith("# TYPE"))
+
+
+def test_running_totals_are_exported_as_counters(client):
+    client.post("/predict", json={"user_id": 1, "session_id": "metrics-1", "features": {
+        "navigation_speed": 1, "mouse_trajectory_entropy": 0.5, "keystroke_dynamics": [40], "session_duration": 3,
+        "time_of_day": 10, "day_of_week": 2, "device_change": False, "location_anomaly": False,
+        "event_count": 20, "unique_event_types": 3, "error_rate": 0,
+    }})
+    types = metric_types(client.get("/metrics").text)
+    for name, kind in types.items():
+        # Prometheus convention: counters, and only counters, end in _total
+        assert (kind == "counter") == name.endswith("_total"), name
+    assert types["bris_response_cache_lookups_total"] == "counter"
+    assert types["bris_llm_singleflight_requests_total"] == "counter"
+    assert types["bris_score_stream_updates_total"] == "counter"
+    assert types["bris_llm_singleflight_in_flight"] == "gauge"
+    assert types["bris_response_cache_entries"] == "gauge"
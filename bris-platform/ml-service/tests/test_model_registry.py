@@ -0,0 +1,34 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.model_registry import ModelRegistry, RuleModel, ScoringModel
+from app.scoring import FEATURE_COLUMNS
+
+
+def point_current(root, version):
+    with open(os.path.join(root, "CURRENT"), "w") as f:
+        f.write(version)
+
+
+def test_reverting_a_broken_current_clears_the_error(tmp_path):
+    registry = ModelRegistry(str(tmp_path))
+    point_current(tmp_path, "missing-version")
+    assert registry.reload() is False
+    assert registry.last_error
+
+    point_current(tmp_path, registry.active.version)
+    assert registry.reload() is False
+    assert registry.last_error is None
+
+
+def test_scoring_models_must_implement_raw_scores():
+    class Incomplete(ScoringModel):
+        model_type = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete("v1", {})
+    rules = RuleModel("rules", {"type": "rules"})
+    X = np.zeros((2, len(FEATURE_COLUMNS)))
+    assert np.allclose(rules.raw_scores(X), rules.score(X))
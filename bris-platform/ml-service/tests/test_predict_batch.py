@@ -0,0 +1,37 @@
+from benchmarks.common import sample_features
+
+
+def test_null_optional_feature_fails_only_its_item(client):
+    nulled = {**sample_features(2), "tab_switch_count": None}
+    batch = [
+        {"user_id": 1, "session_id": "batch-ok", "features": sample_features(1)},
+        {"user_id": 2, "session_id": "batch-null", "features": nulled},
+        {"user_id": 3, "session_id": "batch-bad", "features": {"click_frequency": 1}},
+    ]
+    response = client.post("/predict/batch", json={"requests": batch})
+    assert response.status_code == 200
+    body = response.json()
+    ok, null_item, bad = body["results"]
+    assert ok["prediction"] is not None and ok["error"] is None
+    # A null optional field scores as 0 rather than breaking the narrative
+    assert null_item["error"] is None
+    assert null_item["prediction"]["explanation"].startswith("**SUMMARY:**")
+    assert bad["prediction"] is None and bad["error"]
+    assert body["error_count"] == 1
+
+
+def test_non_object_entries_fail_only_their_slot(client):
+    batch = [
+        5,
+        None,
+        {"user_id": "not-a-number", "session_id": "batch-bad-id", "features": sample_features(3)},
+        {"user_id": 4, "session_id": "batch-after", "features": sample_features(4)},
+    ]
+    response = client.post("/predict/batch", json={"requests": batch})
+    assert response.status_code == 200
+    body = response.json()
+    number, null, bad_id, ok = body["results"]
+    assert number["error"] and null["error"] and bad_id["error"]
+    assert bad_id["session_id"] == "batch-bad-id" and bad_id["user_id"] is None
+    assert ok["error"] is None and ok["user_id"] == 4 and ok["prediction"] is not None
+    assert body["error_count"] == 3
@@ -0,0 +1,32 @@
+from app.prompting import MAX_LIST_ITEMS, compact_features, digest_events, event_seconds
+
+
+def test_long_numeric_lists_are_summarized():
+    compact = compact_features({"dynamics": [0.5, 1, 2.0] * 4})
+    assert compact["dynamics"] == {"n": 12, "mean": 1.17, "min": 0.5, "max": 2.0}
+
+
+def test_long_mixed_or_ragged_lists_are_truncated():
+    tags = ["copy", 3, None, {"k": 1}] * 3
+    ragged = [[1.0, 2.0], [3.0]] * 6
+    flags = [True, False] * 6
+    compact = compact_features({"tags": tags, "ragged": ragged, "flags": flags})
+
+    assert compact["tags"] == {"n": 12, "first": tags[:MAX_LIST_ITEMS]}
+    assert compact["ragged"] == {"n": 12, "first": ragged[:MAX_LIST_ITEMS]}
+    assert compact["flags"] == {"n": 12, "first": flags[:MAX_LIST_ITEMS]}
+
+
+def test_non_finite_timestamps_are_treated_as_missing():
+    events = [
+        {"event_type": "click", "timestamp": 1_700_000_000_000},
+        {"event_type": "click", "timestamp": float("nan")},
+        {"event_type": "keydown", "timestamp": float("-inf")},
+        {"event_type": "keydown", "timestamp": 10 ** 400},
+        {"event_type": "click", "timestamp": 1_700_000_060_000},
+    ]
+    assert [event_seconds(e) for e in events[1:4]] == [None, None, None]
+
+    digest, stats = digest_events(events)
+    assert digest["event_count"] == 5
+    assert digest["span_seconds"] == 60.0
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from app.scoring import FEATURE_COLUMNS
+from app.wire import (
+    HEADER,
+    WIRE_CONTENT_TYPE,
+    WireFormatError,
+    decode_predict_request,
+    decode_predict_response,
+    encode_predict_request,
+)
+
+N_COLS = len(FEATURE_COLUMNS)
+
+
+def frame(session_ids=("s-1", "s-2")) -> bytearray:
+    features = np.arange(len(session_ids) * N_COLS, dtype=np.float64).reshape(len(session_ids), N_COLS)
+    return bytearray(encode_predict_request(list(range(len(session_ids))), list(session_ids), features))
+
+
+def offsets_at(n_rows: int) -> int:
+    return HEADER.size + 8 * n_rows + 8 * n_rows * N_COLS
+
+
+def test_round_trip():
+    batch = decode_predict_request(bytes(frame(("a", "ü-2"))))
+    assert batch.session_ids() == ["a", "ü-2"]
+    assert batch.features.shape == (2, N_COLS)
+
+
+def test_invalid_utf8_session_id_is_a_format_error():
+    body = frame(("ab", "cd"))
+    body[-1] = 0xFF
+    with pytest.raises(WireFormatError):
+        decode_predict_request(bytes(body))
+
+
+def test_offsets_must_start_at_zero():
+    body = frame(("ab", "cd"))
+    at = offsets_at(2)
+    body[at:at + 4] = (1).to_bytes(4, "little")
+    with pytest.raises(WireFormatError):
+        decode_predict_request(bytes(body))
+
+
+def test_decreasing_offsets_are_rejected():
+    body = frame(("ab", "cd"))
+    at = offsets_at(2) + 4
+    body[at:at + 4] = (5).to_bytes(4, "little")
+    with pytest.raises(WireFormatError):
+        decode_predict_request(bytes(body))
+
+
+def test_malformed_body_gets_400_not_500(client):
+    body = frame(("ab", "cd"))
+    body[-1] = 0xFF
+    response = client.post("/predict/batch", content=bytes(body), headers={"content-type": WIRE_CONTENT_TYPE})
+    assert response.status_code == 400
+
+    response = client.post("/predict/batch", content=bytes(frame()), headers={"content-type": WIRE_CONTENT_TYPE})
+    assert response.status_code == 200
+    risk, _, labels = decode_predict_response(response.content)
+    assert len(risk) == 2 and None not in labels